@@ -7,16 +7,24 @@ export function useApiEndpoints() {
     Authorization: `Bearer ${authToken.value}`,
   }
 
-  // --- Restaurant Endpoints ---
-  const fetchRestaurants = async () => {
-    const { data, error } = await useFetch(`${baseUrl}restaurants/`, {
-      method: 'GET',
-      headers,
-    })
-    if (error.value) throw error.value
-    return data.value
+  // List endpoints are cursor paginated ({ next, results }). fetchAllPages
+  // asks for the largest page the API allows and follows the `next` cursors
+  // until there are none left, returning the results of every page.
+  const MAX_PAGE_SIZE = 100
+  const fetchAllPages = async (url) => {
+    const results = []
+    let next = `${url}?page_size=${MAX_PAGE_SIZE}`
+    while (next) {
+      const page = await $fetch(next, { method: 'GET', headers })
+      results.push(...page.results)
+      next = page.next
+    }
+    return results
   }
 
+  // --- Restaurant Endpoints ---
+  const fetchRestaurants = () => fetchAllPages(`${baseUrl}restaurants/`)
+
   const fetchRestaurantById = async (id) => {
     const { data, error } = await useFetch(`${baseUrl}restaurants/${id}/`, {
       method: 'GET',
@@ -46,14 +54,7 @@ export function useApiEndpoints() {
   }
 
   // --- Promo Endpoints ---
-  const fetchPromos = async () => {
-    const { data, error } = await useFetch(`${baseUrl}promos/`, {
-      method: 'GET',
-      headers,
-    })
-    if (error.value) throw error.value
-    return data.value
-  }
+  const fetchPromos = () => fetchAllPages(`${baseUrl}promos/`)
 
   const fetchPromoById = async (id) => {
     const { data, error } = await useFetch(`${baseUrl}promos/${id}/`, {
@@ -84,14 +85,7 @@ export function useApiEndpoints() {
   }
 
   // --- Menu Endpoints ---
-  const fetchMenus = async () => {
-    const { data, error } = await useFetch(`${baseUrl}menus/`, {
-      method: 'GET',
-      headers,
-    })
-    if (error.value) throw error.value
-    return data.value
-  }
+  const fetchMenus = () => fetchAllPages(`${baseUrl}menus/`)
 
   const fetchMenuById = async (id) => {
     const { data, error } = await useFetch(`${baseUrl}menus/${id}/`, {
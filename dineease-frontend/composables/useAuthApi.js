@@ -76,6 +76,8 @@ export function useAuthApi() {
     }
   
     authToken.value = data.value.access
+    // Refresh tokens are rotated: the one just used is no longer accepted
+    if (data.value.refresh) refreshToken.value = data.value.refresh
     return true
   }
 
@@ -91,6 +93,7 @@ export function useAuthApi() {
         headers: {
           Authorization: `Bearer ${authToken.value}`,
         },
+        body: { refresh: refreshToken.value },
       })
     } catch (error) {
       console.error("Error logging out on server:", error)
@@ -8,12 +8,14 @@ export function useOrderApiEndpoints() {
     }
   
     // --- Order Endpoints ---
-    const createOrder = async (orderData) => {
+    // Pass the same idempotencyKey when retrying a checkout, so it is not ordered twice
+    const createOrder = async (orderData, idempotencyKey = crypto.randomUUID()) => {
     console.log(orderData, headers)
       const { data, error } = await useFetch(`${baseUrl}payments/orders/create/`, {
         method: 'POST',
-        headers,
+        headers: { ...headers, 'Idempotency-Key': idempotencyKey },
         body: orderData,
+        retry: 2,
       })
       if (error.value) throw error.value
 
@@ -31,6 +33,41 @@ export function useOrderApiEndpoints() {
       return data.value
     }
   
+    // A single-use ticket for a URL that cannot carry the Authorization header
+    const fetchStreamTicket = async () => {
+      const { ticket } = await $fetch(`${baseUrl}payments/stream-tickets/`, { method: 'POST', headers })
+      return ticket
+    }
+
+    // Status changes of an order as they happen; close() the returned stream when done
+    const streamOrderStatus = (orderId, onEvent) => {
+      let source = null
+      let closed = false
+      const reconnect = () => {
+        if (!closed) setTimeout(() => connect().catch(reconnect), 3000)
+      }
+      const connect = async () => {
+        const ticket = await fetchStreamTicket()
+        if (closed) return
+        source = new EventSource(`${baseUrl}payments/orders/${orderId}/stream/?ticket=${ticket}`)
+        for (const type of ['order', 'payment']) {
+          source.addEventListener(type, (event) => onEvent(JSON.parse(event.data)))
+        }
+        // The ticket is spent, so reconnect with a new one rather than let EventSource retry
+        source.onerror = () => {
+          source.close()
+          reconnect()
+        }
+      }
+      connect().catch(reconnect)
+      return {
+        close: () => {
+          closed = true
+          source?.close()
+        },
+      }
+    }
+  
     // --- Payment Endpoints ---
     const updatePaymentStatus = async (paymentId, paymentStatusData) => {
       const { data, error } = await useFetch(`${baseUrl}payments/${paymentId}/update-status/`, {
@@ -45,6 +82,8 @@ export function useOrderApiEndpoints() {
     return {
       createOrder,
       updateOrderStatus,
+      fetchStreamTicket,
+      streamOrderStatus,
       updatePaymentStatus,
     }
 }
@@ -4,4 +4,8 @@
 
 python3 manage.py migrate
 python3 manage.py collectstatic --noinput
-python3 manage.py runserver 0.0.0.0:8000
\ No newline at end of file
+# ASGI, so the order streams hold no thread while idle. Behind nginx, whose
+# X-Forwarded-* headers are trusted for the client address and scheme
+uvicorn dineease_backend.asgi:application --host 0.0.0.0 --port 8000 \
+    --workers "${WEB_CONCURRENCY:-4}" \
+    --proxy-headers --forwarded-allow-ips "${FORWARDED_ALLOW_IPS:-*}"
@@ -0,0 +1,109 @@
+"""
+Stateless authentication of API requests.
+
+Tokens carry the claims most requests need, signed when they are issued: the
+user's id, username, staff flag and ``type_of_user``. A request is
+authenticated without loading its User or UserProfile; request.user is a
+Principal built from the token. The few views that need the row itself call
+user_instance().
+
+A token stops working before it expires when it is revoked (on logout or
+refresh token rotation), or when every token of its user is (when their
+password, active or staff flag, or type changes, or they are deleted; see
+core.signals). Checking a token costs no query unless it may have been
+revoked (see core.revocation).
+"""
+from functools import cached_property
+
+from django.contrib.auth.models import User
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .revocation import is_revoked, outstand, revoked_tokens
+
+
+class PrincipalRefreshToken(RefreshToken):
+    """
+    A refresh token, and the access tokens made from it, carrying the
+    Principal's claims. Access tokens are not recorded as outstanding: they
+    are revoked by jti or by their user's cutoff (see core.revocation).
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['username'] = user.username
+        token['is_staff'] = user.is_staff
+        token['type_of_user'] = user.profile.type_of_user if hasattr(user, 'profile') else None
+        return token
+
+    def check_blacklist(self):
+        if is_revoked(self):
+            raise TokenError("Token is blacklisted")
+
+    def blacklist(self):
+        blacklisted = super().blacklist()
+        revoked_tokens.add(self[api_settings.JTI_CLAIM])
+        return blacklisted
+
+
+class ClaimedProfile:
+    """The UserProfile fields carried by the token."""
+
+    def __init__(self, type_of_user):
+        self.type_of_user = type_of_user
+
+
+class Principal(TokenUser):
+    """
+    The authenticated user as described by their token. It has the pk,
+    username, is_staff and profile.type_of_user of a User, but is not one: use
+    ``owner_id=user.pk`` rather than ``owner=user`` in queries.
+    """
+
+    @cached_property
+    def instance(self):
+        return User.objects.select_related('profile').get(pk=self.pk)
+
+    # Tokens issued before the claims were added are served from the User row
+
+    @cached_property
+    def is_staff(self):
+        return self.token['is_staff'] if 'is_staff' in self.token else self.instance.is_staff
+
+    @cached_property
+    def profile(self):
+        if 'type_of_user' in self.token:
+            return ClaimedProfile(self.token['type_of_user'])
+        return self.instance.profile
+
+
+def user_instance(user):
+    """The User row behind ``request.user``, loading it when it is a Principal."""
+    return user.instance if isinstance(user, Principal) else user
+
+
+class PrincipalAuthentication(JWTStatelessUserAuthentication):
+    def get_user(self, validated_token):
+        if is_revoked(validated_token):
+            raise InvalidToken("Token has been revoked")
+        return super().get_user(validated_token)
+
+
+class PrincipalTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = PrincipalRefreshToken
+
+
+class PrincipalTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = PrincipalRefreshToken
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        if 'refresh' in data:
+            # simplejwt does not record the refresh tokens it rotates in
+            outstand(self.token_class(data['refresh'], verify=False))
+        return data
@@ -0,0 +1,87 @@
+import hashlib
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .hours import minute_of_week
+from .models import Restaurant, Menu, Promo, Category, OperatingInterval
+
+CATEGORY_COUNTS_TIMEOUT = 60 * 60
+
+# Models whose updated_at feeds the Last-Modified of each cached collection.
+COLLECTION_MODELS = {
+    'categories': (Category,),
+    'menus': (Menu, Promo, Category),
+    'restaurants': (Restaurant, Menu, Promo, Category),
+}
+
+
+def version_key(collection):
+    return f'catalog-version:{collection}'
+
+
+def get_collection_version(collection):
+    """
+    Return ``(version, last_modified)`` for a catalog collection.
+
+    Both live in the cache, so validating a conditional request costs no
+    database work. After a cache flush the timestamp is recovered from the
+    newest updated_at of the collection's models.
+    """
+    state = cache.get(version_key(collection))
+    if state is None:
+        timestamps = [
+            model.objects.aggregate(latest=Max('updated_at'))['latest']
+            for model in COLLECTION_MODELS[collection]
+        ]
+        last_modified = max(filter(None, timestamps), default=timezone.now())
+        state = (uuid.uuid4().hex, last_modified)
+        cache.set(version_key(collection), state, timeout=None)
+    return state
+
+
+def bump_collections(collections):
+    """Give the collections a new version once the current transaction commits."""
+    def bump():
+        now = timezone.now()
+        cache.set_many({version_key(name): (uuid.uuid4().hex, now) for name in collections}, timeout=None)
+
+    transaction.on_commit(bump)
+
+
+def category_counts(category_type, city=None, province=None, open_at=None):
+    """
+    Map category id -> number of active restaurants (or, for menu
+    categories, active menus of active restaurants) in the given scope.
+
+    Counted in one grouped query and cached per scope. The key carries the
+    restaurants and menus versions, so catalog changes miss the old entries.
+    """
+    minute = minute_of_week(open_at) if open_at else None
+    versions = [get_collection_version(collection)[0] for collection in ('restaurants', 'menus')]
+    scope = ':'.join([category_type, *versions, (city or '').lower(), (province or '').upper(), str(minute)])
+    key = 'category-counts:' + hashlib.md5(scope.encode()).hexdigest()
+
+    counts = cache.get(key)
+    if counts is None:
+        restaurants = Restaurant.objects.exclude(status='inactive')
+        if city:
+            restaurants = restaurants.filter(city__iexact=city)
+        if province:
+            restaurants = restaurants.filter(province=province.upper())
+        if open_at:
+            restaurants = restaurants.filter(pk__in=OperatingInterval.restaurants_open_at(open_at))
+
+        if category_type == 'restaurant':
+            rows = Restaurant.categories.through.objects.filter(restaurant__in=restaurants).values('category_id')
+            rows = rows.annotate(count=Count('restaurant_id'))
+        else:
+            rows = Menu.objects.filter(status='active', category__isnull=False, restaurant__in=restaurants)
+            rows = rows.values('category_id').annotate(count=Count('id'))
+
+        counts = {row['category_id']: row['count'] for row in rows.order_by()}
+        cache.set(key, counts, CATEGORY_COUNTS_TIMEOUT)
+    return counts
@@ -15,4 +15,7 @@ CANADA_PROVINCE_CHOICES = (
     ("QC", _("Quebec")),
     ("SK", _("Saskatchewan")),
     ("YT", _("Yukon")),
-)
\ No newline at end of file
+)
+
+# Sort value for rows without a priority_index, so they list after ranked ones.
+UNRANKED_PRIORITY = 2147483647
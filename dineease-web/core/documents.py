@@ -0,0 +1,86 @@
+import json
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from .models import Restaurant, RestaurantDocument
+from .promos import winning_promo_prefetch
+from .serializers import RestaurantSerializer
+
+_pending = threading.local()
+
+
+def as_json_data(data):
+    """
+    Round-trip serializer output through the API renderer, so decimals, dates
+    and geometries are stored exactly as the live endpoints render them.
+    """
+    return json.loads(JSONRenderer().render(data))
+
+
+def render_document(restaurant):
+    """Fully expanded RestaurantSerializer output as plain JSON data."""
+    return as_json_data(RestaurantSerializer(restaurant).data)
+
+
+def rebuild_documents(restaurant_ids):
+    """Re-render and store the documents of the given restaurants."""
+    restaurants = Restaurant.objects.filter(pk__in=restaurant_ids).prefetch_related(
+        'promos',
+        'categories',
+        'images',
+        'menus__images',
+        'menus__addon_categories__addon_options__menu_item',
+        winning_promo_prefetch('menus__promos'),
+    )
+    now = timezone.now()
+    documents = [
+        RestaurantDocument(restaurant=restaurant, document=render_document(restaurant), updated_at=now)
+        for restaurant in restaurants
+    ]
+    RestaurantDocument.objects.bulk_create(
+        documents,
+        update_conflicts=True,
+        unique_fields=['restaurant'],
+        update_fields=['document', 'updated_at'],
+    )
+    return len(documents)
+
+
+def schedule_rebuild(restaurant_ids):
+    """
+    Rebuild documents once the current transaction commits.
+
+    Ids are collected per thread and the first commit callback rebuilds all of
+    them, so saving a restaurant together with its inlines renders it once.
+    """
+    ids = {pk for pk in restaurant_ids if pk is not None}
+    if not ids:
+        return
+    if not hasattr(_pending, 'ids'):
+        _pending.ids = set()
+    _pending.ids |= ids
+    transaction.on_commit(_flush_pending)
+
+
+def _flush_pending():
+    ids, _pending.ids = _pending.ids, set()
+    if ids:
+        rebuild_documents(ids)
+
+
+def absolutize_media_urls(document, request):
+    """
+    Documents are rendered without a request, so image URLs are stored
+    relative to MEDIA_URL. Make them absolute, as the serializers would.
+    """
+    if isinstance(document, dict):
+        return {key: absolutize_media_urls(value, request) for key, value in document.items()}
+    if isinstance(document, list):
+        return [absolutize_media_urls(value, request) for value in document]
+    if isinstance(document, str) and document.startswith(settings.MEDIA_URL):
+        return request.build_absolute_uri(document)
+    return document
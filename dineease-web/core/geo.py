@@ -0,0 +1,54 @@
+import math
+
+from django.contrib.gis.geos import Point
+from rest_framework.exceptions import ValidationError
+
+# Shortest length of one degree of latitude (at the equator), in metres.
+METERS_PER_DEGREE = 110574
+
+DEFAULT_RADIUS = 5000  # metres
+MAX_RADIUS = 50000  # metres
+
+
+def parse_point(params, required=True):
+    """
+    Build a WGS84 point from the ``lat`` and ``lng`` query parameters.
+    Returns None when both are missing and the point is optional.
+    """
+    lat, lng = params.get('lat'), params.get('lng')
+    if lat in (None, '') and lng in (None, '') and not required:
+        return None
+
+    try:
+        lat, lng = float(lat), float(lng)
+    except (TypeError, ValueError):
+        raise ValidationError({"detail": "lat and lng must be valid numbers."})
+
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValidationError({"detail": "lat and lng are out of range."})
+
+    return Point(lng, lat, srid=4326)
+
+
+def parse_radius(params):
+    """Return the ``radius`` query parameter in metres, clamped to MAX_RADIUS."""
+    try:
+        radius = float(params.get('radius', DEFAULT_RADIUS))
+    except (TypeError, ValueError):
+        raise ValidationError({"detail": "radius must be a number of metres."})
+
+    if radius <= 0:
+        raise ValidationError({"detail": "radius must be positive."})
+    return min(radius, MAX_RADIUS)
+
+
+def radius_in_degrees(point, meters):
+    """
+    Convert a radius in metres into a planar radius in degrees around ``point``.
+
+    The result is deliberately generous (a degree of longitude shrinks towards
+    the poles), so ST_DWithin on it can be used as an index-assisted prefilter
+    before the exact spherical distance check.
+    """
+    cos_lat = max(math.cos(math.radians(point.y)), 0.01)
+    return meters / (METERS_PER_DEGREE * cos_lat)
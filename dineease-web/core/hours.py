@@ -0,0 +1,185 @@
+"""
+Weekly hours as stored in Restaurant.operating_hours and Promo.time_offer,
+e.g. ``{"Monday": "9:00AM – 3:00PM", "Sunday": "Closed"}``, compiled into
+minute-of-week intervals (Monday 00:00 is minute 0) that can be indexed.
+"""
+import re
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+
+DAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+CLOSED = {'', 'closed', 'close', 'off', 'none', '-'}
+ALL_DAY = {'open 24 hours', '24 hours', '24h', 'all day'}
+
+TIME_RE = re.compile(r'^(\d{1,2})(?:[:.](\d{2}))?\s*([ap])\.?\s*m?\.?$|^(\d{1,2})[:.](\d{2})$')
+RANGE_SEPARATOR_RE = re.compile(r'\s*(?:–|—|-|\bto\b)\s*')
+PERIOD_SEPARATOR_RE = re.compile(r'\s*[,;/&]\s*|\s+and\s+')
+
+
+def parse_time(text):
+    """Minutes after midnight for '9:00AM', '9 am', '12:30PM', '21:00', 'noon'..."""
+    text = text.strip().lower()
+    if text == 'noon':
+        return 12 * 60
+    if text == 'midnight':
+        return 0
+
+    match = TIME_RE.match(text)
+    if not match:
+        raise ValueError(f"Unrecognised time: {text!r}")
+
+    if match.group(4) is not None:
+        hour, minute = int(match.group(4)), int(match.group(5))
+        if hour > 24 or minute > 59:
+            raise ValueError(f"Unrecognised time: {text!r}")
+        return hour * 60 + minute
+
+    hour, minute, meridiem = int(match.group(1)), int(match.group(2) or 0), match.group(3)
+    if not 1 <= hour <= 12 or minute > 59:
+        raise ValueError(f"Unrecognised time: {text!r}")
+    hour %= 12
+    if meridiem == 'p':
+        hour += 12
+    return hour * 60 + minute
+
+
+def parse_day(text):
+    """
+    Opening periods of one day as ``(start, end)`` minutes after midnight.
+    A period closing at or before it opens runs past midnight, so its end is
+    greater than MINUTES_PER_DAY.
+    """
+    text = (text or '').strip()
+    if text.lower() in CLOSED:
+        return []
+    if text.lower() in ALL_DAY:
+        return [(0, MINUTES_PER_DAY)]
+
+    periods = []
+    for period in PERIOD_SEPARATOR_RE.split(text):
+        bounds = RANGE_SEPARATOR_RE.split(period.strip())
+        if len(bounds) != 2:
+            raise ValueError(f"Unrecognised hours: {text!r}")
+        start, end = parse_time(bounds[0]), parse_time(bounds[1])
+        if end <= start:
+            end += MINUTES_PER_DAY
+        periods.append((start, end))
+    return periods
+
+
+def compile_weekly_hours(hours, strict=True):
+    """
+    Merge a weekday -> hours mapping into sorted, non-overlapping
+    ``(start, end)`` minute-of-week intervals. Periods running past Sunday
+    midnight wrap around to Monday morning.
+
+    With ``strict=False`` days that cannot be parsed are treated as closed
+    instead of raising ValueError.
+    """
+    intervals = []
+    for index, day in enumerate(DAYS):
+        try:
+            periods = parse_day((hours or {}).get(day))
+        except ValueError:
+            if strict:
+                raise
+            periods = []
+
+        offset = index * MINUTES_PER_DAY
+        for start, end in periods:
+            start, end = offset + start, offset + end
+            if end > MINUTES_PER_WEEK:
+                intervals.append((0, end - MINUTES_PER_WEEK))
+                end = MINUTES_PER_WEEK
+            intervals.append((start, end))
+
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def local_time_zone():
+    return ZoneInfo(settings.RESTAURANT_TIME_ZONE)
+
+
+def minute_of_week(moment):
+    """Minute of the week of ``moment`` in the restaurants' local time."""
+    local = timezone.localtime(moment, local_time_zone())
+    return local.weekday() * MINUTES_PER_DAY + local.hour * 60 + local.minute
+
+
+def parse_open_at(params):
+    """
+    The moment asked for by ``?open_now=true`` or ``?open_at=<ISO datetime>``,
+    or None. Naive datetimes are taken as restaurant local time.
+    """
+    if params.get('open_at'):
+        moment = parse_datetime(params['open_at'])
+        if moment is None:
+            raise ValidationError({"detail": "open_at must be an ISO 8601 datetime."})
+        if timezone.is_naive(moment):
+            moment = moment.replace(tzinfo=local_time_zone())
+        return moment
+
+    if params.get('open_now', '').lower() in ('1', 'true', 'yes'):
+        return timezone.now()
+    return None
+
+
+def week_start(moment):
+    """Local Monday 00:00 of the week ``moment`` falls in, as a naive datetime."""
+    local = timezone.localtime(moment, local_time_zone()).replace(tzinfo=None)
+    return datetime.combine(local.date() - timedelta(days=local.weekday()), time())
+
+
+def next_occurrence(minute, moment):
+    """The first moment strictly after ``moment`` at ``minute`` of a week."""
+    start = week_start(moment)
+    for weeks in (0, 1):
+        candidate = (start + timedelta(weeks=weeks, minutes=minute)).replace(tzinfo=local_time_zone())
+        if candidate > moment:
+            return candidate
+
+
+def in_window(intervals, moment, start_date=None, end_date=None):
+    """
+    Whether ``moment`` falls in the compiled ``intervals`` and, when given,
+    between the local ``start_date`` and ``end_date`` (both inclusive).
+    """
+    today = timezone.localdate(moment, local_time_zone())
+    if start_date and today < start_date:
+        return False
+    if end_date and today > end_date:
+        return False
+    minute = minute_of_week(moment)
+    return any(start <= minute < end for start, end in intervals)
+
+
+def next_window_change(intervals, moment, start_date=None, end_date=None):
+    """
+    The next moment after ``moment`` at which in_window() may change, or None
+    once the window has ended for good.
+    """
+    zone = local_time_zone()
+    if end_date and timezone.localdate(moment, zone) > end_date:
+        return None
+
+    candidates = [next_occurrence(edge, moment) for interval in intervals for edge in interval]
+    for day in (start_date, end_date and end_date + timedelta(days=1)):
+        if day:
+            boundary = datetime.combine(day, time(), tzinfo=zone)
+            if boundary > moment:
+                candidates.append(boundary)
+    return min(candidates, default=None)
@@ -0,0 +1,145 @@
+"""
+Resized WebP and JPEG derivatives of uploaded images, plus a tiny blurred
+placeholder, so listings do not download full-size originals.
+
+Derivatives are saved in a ``.derivatives`` folder next to the original
+(named by content, like every upload, see core.storage) and recorded in the
+owner's ``image_variants`` field, which the serializers expose through
+ImageVariantsField. They are rendered by a small thread pool after the upload
+commits; the generate_image_derivatives command backfills existing images.
+"""
+import base64
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageFilter, ImageOps, UnidentifiedImageError
+
+from .models import Category, Menu, Promo, Restaurant, RestaurantImage, UserProfile
+
+logger = logging.getLogger(__name__)
+
+IMAGE_MODELS = (Category, Restaurant, Promo, Menu, RestaurantImage, UserProfile)
+
+WIDTHS = (160, 320, 640, 1024, 1600)
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+PLACEHOLDER_WIDTH = 16
+
+_executor = None
+
+
+def derivative_root(name):
+    return f'{os.path.splitext(name)[0]}.derivatives'
+
+
+def encode(image, format):
+    pil_format, options = FORMATS[format]
+    if pil_format == 'JPEG' and image.mode != 'RGB':
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+        image = background
+    output = io.BytesIO()
+    image.save(output, pil_format, **options)
+    return output.getvalue()
+
+
+def resize(image, width):
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.Resampling.LANCZOS)
+
+
+def render_derivatives(name):
+    """
+    Render and store the derivatives of the image file ``name``, returning
+    what to keep in ``image_variants``, or None when it cannot be read.
+    """
+    try:
+        with default_storage.open(name) as original:
+            image = ImageOps.exif_transpose(Image.open(original))
+            image.load()
+    except (OSError, UnidentifiedImageError):
+        logger.warning("Cannot read image %s, skipping its derivatives", name)
+        return None
+    except Image.DecompressionBombError:
+        logger.warning("Image %s is over twice Image.MAX_IMAGE_PIXELS, skipping its derivatives", name)
+        return None
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+
+    # Widths up to the original's, and the original's own when it is smaller than all of them
+    widths = [width for width in WIDTHS if width < image.width] or [image.width]
+    root = derivative_root(name)
+    variants = {'name': name, 'width': image.width, 'height': image.height}
+    for format in FORMATS:
+        variants[format] = {}
+    for width in widths:
+        resized = resize(image, width)
+        for format in FORMATS:
+            # Named by content, so rendering the same image again writes nothing new
+            name_hint = f'{root}/{width}.{format}'
+            variants[format][str(width)] = default_storage.save(name_hint, ContentFile(encode(resized, format)))
+
+    placeholder = resize(image, min(PLACEHOLDER_WIDTH, image.width)).filter(ImageFilter.GaussianBlur(1))
+    variants['placeholder'] = 'data:image/webp;base64,' + base64.b64encode(encode(placeholder, 'webp')).decode('ascii')
+    return variants
+
+
+def store_variants(model, pk, variants):
+    """Record ``variants`` unless the image was replaced while they were rendered."""
+    with transaction.atomic():
+        instance = model.objects.select_for_update().filter(pk=pk).first()
+        if instance is None or instance.image.name != variants['name']:
+            return False
+        instance.image_variants = variants
+        # Saved, not updated, so the cached documents and trees showing it are rebuilt
+        instance.save(update_fields=['image_variants'])
+    return True
+
+
+def generate_derivatives(model, pk):
+    instance = model.objects.filter(pk=pk).only('image', 'image_variants').first()
+    if instance is None or not instance.image or instance.image_variants.get('name') == instance.image.name:
+        return False
+    variants = render_derivatives(instance.image.name)
+    return variants is not None and store_variants(model, pk, variants)
+
+
+def _generate_in_background(model, pk):
+    try:
+        generate_derivatives(model, pk)
+    except Exception:
+        logger.exception("Could not generate the image derivatives of %s %s", model.__name__, pk)
+    finally:
+        # Each worker thread opened its own connection
+        connections.close_all()
+
+
+def schedule_derivatives(model, pk):
+    """Render the derivatives of an instance's image in the background once the upload commits."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_DERIVATIVE_WORKERS, thread_name_prefix='image-derivatives')
+    transaction.on_commit(lambda: _executor.submit(_generate_in_background, model, pk))
+
+
+def image_variants(instance, url):
+    """
+    The ``image_variants`` of an instance for its current image as
+    ``{"webp": {"320": url, ...}, "jpeg": {...}, "placeholder": ...}``, with
+    file names turned into URLs by ``url``; None until they are generated.
+    """
+    variants = instance.image_variants
+    if not instance.image or variants.get('name') != instance.image.name:
+        return None
+    data = {'width': variants['width'], 'height': variants['height'], 'placeholder': variants['placeholder']}
+    for format in FORMATS:
+        data[format] = {width: url(name) for width, name in variants[format].items()}
+    return data
@@ -0,0 +1,89 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.models import Restaurant, UserProfile
+from core.views import RestaurantViewSet
+
+BENCHMARK_USER = 'nearby-benchmark'
+ORIGIN = Point(-123.1207, 49.2827, srid=4326)
+
+
+class Command(BaseCommand):
+    help = (
+        "Time /api/restaurants/nearby/ pages on synthetic catalogs of growing size, "
+        "first pages and pages deep into the cursor."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 500000], help="Restaurants in the catalog.")
+        parser.add_argument('--radius', type=int, default=5000, help="Metres around the origin.")
+        parser.add_argument('--pages', type=int, default=10, help="Pages followed through the cursor.")
+        parser.add_argument('--runs', type=int, default=20, help="Timed runs at every size.")
+
+    def handle(self, *args, **options):
+        # Everything, including the catalog, is rolled back at the end
+        with transaction.atomic():
+            user, _ = User.objects.get_or_create(username=BENCHMARK_USER)
+            UserProfile.objects.get_or_create(user=user, defaults={'phone': '555-0199', 'address': '1 Benchmark Street', 'city': 'Vancouver'})
+
+            rng = random.Random(42)
+            view = RestaurantViewSet.as_view({'get': 'nearby'})
+            factory = APIRequestFactory()
+            for size in sorted(options['sizes']):
+                self.grow(user, size, rng)
+                first, deep = self.time_pages(view, factory, user, options)
+                self.stdout.write(
+                    f"{size:7} restaurants: first page p50 {statistics.median(first):6.1f} ms, "
+                    f"page {options['pages']} p50 {statistics.median(deep):6.1f} ms, max {max(first + deep):6.1f} ms"
+                )
+
+            transaction.set_rollback(True)
+
+    def grow(self, owner, size, rng):
+        """Add restaurants spread over the metro area until there are ``size`` of them."""
+        existing = Restaurant.objects.filter(owner=owner).count()
+        Restaurant.objects.bulk_create(
+            (
+                Restaurant(
+                    name=f'Nearby benchmark {index}',
+                    location=f'{index} Benchmark Street',
+                    coordinates=Point(ORIGIN.x + rng.uniform(-0.5, 0.5), ORIGIN.y + rng.uniform(-0.3, 0.3), srid=4326),
+                    telephone='555-0100',
+                    image='restaurant_images/benchmark.webp',
+                    owner=owner,
+                )
+                for index in range(existing, size)
+            ),
+            batch_size=5000,
+        )
+        # So the planner sees the catalog's real size and uses the GiST index
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {Restaurant._meta.db_table}')
+
+    def time_pages(self, view, factory, user, options):
+        params = {'lat': ORIGIN.y, 'lng': ORIGIN.x, 'radius': options['radius'], 'fields': 'id,name'}
+        first, deep = [], []
+        for _ in range(options['runs']):
+            url, query = '/api/restaurants/nearby/', params
+            for page in range(options['pages']):
+                request = factory.get(url, query)
+                force_authenticate(request, user=user)
+                started = time.perf_counter()
+                response = view(request)
+                elapsed = (time.perf_counter() - started) * 1000
+                if response.status_code != 200:
+                    raise RuntimeError(response.data)
+                if page == 0:
+                    first.append(elapsed)
+                url, query = response.data['next'], None
+                if url is None:
+                    break
+            deep.append(elapsed)
+        return first, deep
@@ -0,0 +1,75 @@
+import threading
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.models import Promo, Restaurant
+
+BENCHMARK_OWNER = 'promo-counter-benchmark'
+
+
+def hammer_promo(promo_id, threads, attempts):
+    """
+    Redeem one promo ``attempts`` times from each of ``threads`` threads, each
+    on its own connection. Returns the number of successful claims and the
+    elapsed seconds.
+    """
+    claimed = []
+    start = threading.Barrier(threads)
+
+    def redeem():
+        try:
+            promo = Promo.objects.get(pk=promo_id)
+            start.wait()
+            claimed.append(sum(promo.increment_usage() for _ in range(attempts)))
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=redeem) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sum(claimed), time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = "Redeem one promo from many threads, check usage_limit holds and report throughput."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--attempts', type=int, default=200, help="Redemptions tried per thread.")
+        parser.add_argument('--limit', type=int, default=1000, help="usage_limit of the promo.")
+        parser.add_argument('--shards', type=int, default=0, help="Counter shards, 0 for the promo row.")
+
+    def handle(self, *args, **options):
+        owner, _ = User.objects.get_or_create(username=BENCHMARK_OWNER)
+        restaurant = Restaurant.objects.create(
+            name='Promo counter benchmark', image='restaurant_images/benchmark.webp', location='1 Benchmark Street',
+            coordinates=Point(-123.1207, 49.2827, srid=4326), telephone='555-0100', owner=owner,
+        )
+        try:
+            promo = Promo.objects.create(
+                restaurant=restaurant, name='Flash', description='', discount=Decimal('10.00'),
+                usage_limit=options['limit'], time_offer={},
+            )
+            if options['shards']:
+                promo.shard_usage_counter(options['shards'])
+
+            claimed, elapsed = hammer_promo(promo.pk, options['threads'], options['attempts'])
+            attempts = options['threads'] * options['attempts']
+            used = Promo.objects.get(pk=promo.pk).total_usage()
+
+            self.stdout.write(
+                f"{attempts} attempts from {options['threads']} threads in {elapsed:.2f}s "
+                f"({attempts / elapsed:.0f} attempts/sec), {claimed} claimed, usage {used}/{options['limit']}"
+            )
+            if used != claimed or used > options['limit']:
+                raise CommandError("Usage counter is inconsistent with the claims.")
+        finally:
+            restaurant.delete()
@@ -0,0 +1,103 @@
+import statistics
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.documents import rebuild_documents
+from core.models import (
+    AddonCategory, AddonOption, Menu, Promo, Restaurant, RestaurantDocument, RestaurantImage, UserProfile,
+    compile_promo_schedule,
+)
+from core.views import RestaurantViewSet
+
+BENCHMARK_USER = 'document-benchmark'
+
+
+class Command(BaseCommand):
+    help = (
+        "Time GET /api/restaurants/<id>/ rendered by the serializers (no document yet) "
+        "against the precomputed restaurant document, for restaurants of several menu sizes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--menus', type=int, nargs='+', default=[10, 50, 200], help="Menu items per restaurant.")
+        parser.add_argument('--addons', type=int, default=3, help="Add-on options per menu item.")
+        parser.add_argument('--runs', type=int, default=50, help="Timed requests per case.")
+
+    def handle(self, *args, **options):
+        # Everything, including the documents, is rolled back at the end
+        with transaction.atomic():
+            user, _ = User.objects.get_or_create(username=BENCHMARK_USER)
+            UserProfile.objects.get_or_create(user=user, defaults={'phone': '555-0198', 'address': '1 Benchmark Street', 'city': 'Vancouver'})
+
+            view = RestaurantViewSet.as_view({'get': 'retrieve'})
+            factory = APIRequestFactory()
+            for menus in options['menus']:
+                restaurant = self.create_restaurant(user, menus, options['addons'])
+
+                RestaurantDocument.objects.filter(restaurant=restaurant).delete()
+                cold = self.time_requests(view, factory, user, restaurant, options['runs'])
+                rebuild_documents([restaurant.pk])
+                precomputed = self.time_requests(view, factory, user, restaurant, options['runs'])
+
+                for label, (timings, queries) in (('cold', cold), ('precomputed', precomputed)):
+                    timings.sort()
+                    p95 = timings[min(int(len(timings) * 0.95), len(timings) - 1)]
+                    self.stdout.write(
+                        f"{menus:4} menus {label:12} p50 {statistics.median(timings):7.1f} ms  "
+                        f"p95 {p95:7.1f} ms  {queries:3} queries"
+                    )
+
+            transaction.set_rollback(True)
+
+    def create_restaurant(self, owner, menus, addons):
+        restaurant = Restaurant.objects.create(
+            name=f'Document benchmark {menus}', image='restaurant_images/benchmark.webp', location='1 Benchmark Street',
+            coordinates=Point(-123.1207, 49.2827, srid=4326), telephone='555-0100', owner=owner,
+        )
+        RestaurantImage.objects.create(restaurant=restaurant, image='images/benchmark.webp')
+        Promo.objects.create(restaurant=restaurant, name='Benchmark promo', description='', discount=Decimal('5.00'), time_offer={})
+
+        items = Menu.objects.bulk_create(
+            Menu(restaurant=restaurant, name=f'Item {index}', description='', cost=Decimal('12.00'))
+            for index in range(menus)
+        )
+        RestaurantImage.objects.bulk_create(RestaurantImage(menu=menu, image='images/benchmark.webp') for menu in items)
+        # bulk_create skips Promo.save(), which compiles the schedule
+        Promo.objects.bulk_create(
+            Promo(
+                menu=menu, name='Item promo', description='', discount=Decimal('10.00'), priority_index=1,
+                time_offer={}, schedule=compile_promo_schedule({}), is_live=True,
+            )
+            for menu in items
+        )
+        categories = AddonCategory.objects.bulk_create(AddonCategory(menu=menu, name='Sides') for menu in items)
+        AddonOption.objects.bulk_create(
+            AddonOption(category=category, name=f'Side {index}', price=Decimal('2.00'))
+            for category in categories
+            for index in range(addons)
+        )
+        return restaurant
+
+    def time_requests(self, view, factory, user, restaurant, runs):
+        """Milliseconds per request, rendering included, and the queries of one request."""
+        timings = []
+        queries = 0
+        for _ in range(runs):
+            request = factory.get(f'/api/restaurants/{restaurant.pk}/')
+            force_authenticate(request, user=user)
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = view(request, pk=restaurant.pk)
+                response.render()
+                timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError(response.data)
+            queries = len(context.captured_queries)
+        return timings, queries
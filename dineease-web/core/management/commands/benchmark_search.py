@@ -0,0 +1,104 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import Menu, Restaurant
+from core.search import search, update_search_vectors
+
+BENCHMARK_OWNER = 'search-benchmark'
+
+CUISINES = ['Italian', 'Thai', 'Sushi', 'Korean', 'Mexican', 'Greek', 'Indian', 'Vietnamese', 'French', 'Lebanese']
+ADJECTIVES = ['Spicy', 'Smoked', 'Crispy', 'Garlic', 'Honey', 'Grilled', 'Roasted', 'Lemon', 'Truffle', 'Braised']
+DISHES = [
+    'Chicken', 'Ramen', 'Burrito', 'Pizza', 'Pho', 'Curry', 'Salmon', 'Tacos', 'Souvlaki', 'Bibimbap',
+    'Gnocchi', 'Shawarma', 'Dumplings', 'Risotto', 'Falafel', 'Udon', 'Lasagna', 'Poutine', 'Burger', 'Noodles',
+]
+CITIES = ['Vancouver', 'Burnaby', 'Richmond', 'Surrey', 'Victoria', 'Kelowna']
+
+# Exact terms, misspellings and multi word queries
+QUERIES = ['pizza', 'spicy ramen', 'shawarma', 'shwarma', 'ramne', 'garlic chicken curry', 'thai', 'burnaby sushi']
+
+
+class Command(BaseCommand):
+    help = "Time /api/search/ queries, optionally on a generated synthetic catalog."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', action='store_true', help="Generate the synthetic catalog first.")
+        parser.add_argument('--menus', type=int, default=200000, help="Menu items to generate with --seed.")
+        parser.add_argument('--menus-per-restaurant', type=int, default=25)
+        parser.add_argument('--runs', type=int, default=50, help="Timed runs of every query.")
+        parser.add_argument('--cleanup', action='store_true', help="Delete the synthetic catalog and exit.")
+
+    def handle(self, *args, **options):
+        if options['cleanup']:
+            deleted, _ = Restaurant.objects.filter(owner__username=BENCHMARK_OWNER).delete()
+            self.stdout.write(f"Deleted {deleted} rows.")
+            return
+
+        if options['seed']:
+            self.seed(options['menus'], options['menus_per_restaurant'])
+
+        self.stdout.write(f"Catalog: {Restaurant.objects.count()} restaurants, {Menu.objects.count()} menus")
+        point = Point(-123.1207, 49.2827, srid=4326)
+        for label, around in (('text', None), ('text + distance', point)):
+            self.stdout.write(f"\n{label}")
+            for text in QUERIES:
+                self.time_query(text, around, options['runs'])
+
+    def time_query(self, text, point, runs):
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            list(search(Restaurant.objects.all(), text, point, 'coordinates'))
+            list(search(Menu.objects.select_related('restaurant'), text, point, 'restaurant__coordinates'))
+            timings.append((time.perf_counter() - started) * 1000)
+
+        timings.sort()
+        p95 = timings[min(int(len(timings) * 0.95), len(timings) - 1)]
+        self.stdout.write(
+            f"  {text!r:26} p50 {statistics.median(timings):7.1f} ms  p95 {p95:7.1f} ms  max {timings[-1]:7.1f} ms"
+        )
+
+    @transaction.atomic
+    def seed(self, menu_count, per_restaurant):
+        rng = random.Random(42)
+        owner, _ = User.objects.get_or_create(username=BENCHMARK_OWNER)
+
+        restaurants = Restaurant.objects.bulk_create(
+            [
+                Restaurant(
+                    name=f"{rng.choice(ADJECTIVES)} {rng.choice(CUISINES)} {rng.choice(DISHES)} House {index}",
+                    description=f"{rng.choice(CUISINES)} kitchen serving {rng.choice(DISHES).lower()}",
+                    city=rng.choice(CITIES),
+                    location=f"{index} Benchmark Street",
+                    coordinates=Point(-123.1207 + rng.uniform(-0.5, 0.5), 49.2827 + rng.uniform(-0.3, 0.3), srid=4326),
+                    telephone='555-0100',
+                    image='restaurant_images/benchmark.webp',
+                    owner=owner,
+                )
+                for index in range(-(-menu_count // per_restaurant))
+            ],
+            batch_size=2000,
+        )
+
+        menus = (
+            Menu(
+                restaurant=restaurants[index // per_restaurant],
+                name=f"{rng.choice(ADJECTIVES)} {rng.choice(DISHES)}",
+                description=f"{rng.choice(ADJECTIVES)} {rng.choice(CUISINES).lower()} {rng.choice(DISHES).lower()}",
+                cost=Decimal(rng.randrange(500, 4000)) / 100,
+            )
+            for index in range(menu_count)
+        )
+        Menu.objects.bulk_create(menus, batch_size=5000)
+
+        # bulk_create skips the signals that fill the vectors
+        update_search_vectors(Restaurant, Restaurant.objects.filter(owner=owner).values('pk'))
+        update_search_vectors(Menu, Menu.objects.filter(restaurant__owner=owner).values('pk'))
+        self.stdout.write(f"Seeded {len(restaurants)} restaurants and {menu_count} menus.")
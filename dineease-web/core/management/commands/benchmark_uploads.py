@@ -0,0 +1,139 @@
+import asyncio
+import io
+import json
+import resource
+import time
+
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point
+from django.core.management.base import BaseCommand
+from PIL import Image
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.models import ChunkedUpload, Restaurant, RestaurantImage
+from dineease_backend.asgi import application
+from payments.management.commands.soak_order_streams import rss_kb
+
+BENCHMARK_USER = 'upload-benchmark'
+MESSAGE_SIZE = 64 * 1024  # Body bytes per ASGI message, about what a server reads off a socket
+
+
+def photo(index):
+    """The start of a photo Pillow reads as a JPEG, a small distinct image, and filler to pad it with."""
+    output = io.BytesIO()
+    Image.new('RGB', (64, 64), (index % 256, 80, 160)).save(output, 'JPEG')
+    header = output.getvalue()
+    filler = bytes(range(256)) * (MESSAGE_SIZE // 256)
+    return header, filler
+
+
+async def request(method, path, token, body=b'', headers=(), message_size=MESSAGE_SIZE):
+    """One request to the ASGI application, its body sent in ``message_size`` pieces; returns (status, body)."""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': method, 'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'root_path': '',
+        'query_string': b'', 'client': ('127.0.0.1', 10000), 'server': ('localhost', 80),
+        'headers': [
+            (b'host', b'localhost'), (b'authorization', f'Bearer {token}'.encode()),
+            (b'content-length', str(len(body)).encode()), *headers,
+        ],
+    }
+    pieces = [body[start:start + message_size] for start in range(0, len(body), message_size)] or [b'']
+    response = {'status': None, 'body': b''}
+
+    async def receive():
+        if pieces:
+            piece = pieces.pop(0)
+            return {'type': 'http.request', 'body': piece, 'more_body': bool(pieces)}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        elif message['type'] == 'http.response.body':
+            response['body'] += message.get('body', b'')
+
+    await application(scope, receive, send)
+    return response['status'], response['body']
+
+
+class Command(BaseCommand):
+    help = (
+        "Upload large photos concurrently through the resumable upload API, driving one ASGI "
+        "worker in this process, and report its memory and throughput."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uploads', type=int, default=8, help="Concurrent uploads")
+        parser.add_argument('--size', type=int, default=100, help="MB per upload")
+        parser.add_argument('--chunk-size', type=int, default=8, help="MB per PATCH request")
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username=BENCHMARK_USER)
+        restaurant = Restaurant.objects.create(
+            name='Upload benchmark', image='restaurant_images/benchmark.webp', location='1 Benchmark Street',
+            coordinates=Point(-123.1207, 49.2827, srid=4326), telephone='555-0100', owner=user,
+        )
+        try:
+            asyncio.run(self.benchmark(restaurant, str(AccessToken.for_user(user)), options))
+        finally:
+            # Only the rows: blobs may be shared with other images (see
+            # core.storage), collect_media_garbage removes unreferenced ones
+            ChunkedUpload.objects.filter(user=user).delete()
+            restaurant.delete()
+            self.stdout.write("Run collect_media_garbage to remove the uploaded files.")
+
+    async def benchmark(self, restaurant, token, options):
+        size = options['size'] * 1024 * 1024
+        chunk_size = options['chunk_size'] * 1024 * 1024
+        baseline = rss_kb()
+        samples = []
+
+        async def sample():
+            while True:
+                samples.append(rss_kb())
+                await asyncio.sleep(0.1)
+
+        async def upload(index):
+            header, filler = photo(index)
+            status, body = await request(
+                'POST', '/api/uploads/', token,
+                json.dumps({'restaurant': restaurant.pk, 'filename': f'photo-{index}.jpg', 'size': size}).encode(),
+                [(b'content-type', b'application/json')],
+            )
+            if status != 201:
+                raise RuntimeError(f"Creating upload {index} failed with {status}: {body[:200]}")
+            path = f"/api/uploads/{json.loads(body)['id']}/"
+
+            offset = 0
+            while offset < size:
+                # Only one chunk per upload is in memory at a time, as on a client reading a file
+                chunk = bytearray(header if offset == 0 else b'')
+                while len(chunk) < min(chunk_size, size - offset):
+                    chunk += filler[:min(chunk_size, size - offset) - len(chunk)]
+                status, body = await request(
+                    'PATCH', path, token, bytes(chunk),
+                    [(b'content-type', b'application/offset+octet-stream'), (b'upload-offset', str(offset).encode())],
+                )
+                if status != 200:
+                    raise RuntimeError(f"Chunk at {offset} of upload {index} failed with {status}: {body[:200]}")
+                offset = json.loads(body)['offset']
+            return json.loads(body)['image'] is not None
+
+        sampler = asyncio.create_task(sample())
+        started = time.perf_counter()
+        completed = await asyncio.gather(*(upload(index) for index in range(options['uploads'])))
+        elapsed = time.perf_counter() - started
+        sampler.cancel()
+
+        total = options['uploads'] * options['size']
+        self.stdout.write(
+            f"{sum(completed)}/{options['uploads']} uploads of {options['size']} MB in {elapsed:.1f}s "
+            f"({total / elapsed:.0f} MB/s)"
+        )
+        self.stdout.write(
+            f"RSS: {baseline / 1024:.1f} MB before, {max(samples) / 1024:.1f} MB at most while uploading, "
+            f"peak {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB "
+            f"(the client's chunks, {options['uploads'] * options['chunk_size']} MB, included)"
+        )
+        self.stdout.write(f"{await RestaurantImage.objects.filter(restaurant=restaurant).acount()} images attached")
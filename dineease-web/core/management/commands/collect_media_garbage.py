@@ -0,0 +1,66 @@
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import models
+from django.utils import timezone
+
+from core.images import FORMATS, IMAGE_MODELS
+from core.storage import is_blob
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete content-addressed media files (see core.storage) that no FileField or ImageField, "
+        "nor any image derivative, refers to."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--min-age', type=int, default=24, help="Hours; younger files may belong to uploads not committed yet")
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        referenced = self.referenced_names(options['batch_size'])
+        cutoff = timezone.now() - timedelta(hours=options['min_age'])
+
+        found = deleted = 0
+        for name in self.blobs():
+            found += 1
+            if name in referenced or default_storage.get_modified_time(name) > cutoff:
+                continue
+            deleted += 1
+            if not options['dry_run']:
+                default_storage.delete(name)
+
+        verb = "Would delete" if options['dry_run'] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {deleted} of {found} blobs ({len(referenced)} files referenced)."))
+
+    def referenced_names(self, batch_size):
+        """Every file name stored in a FileField or ImageField, or among the image derivatives."""
+        names = set()
+        for model in apps.get_models():
+            for field in model._meta.concrete_fields:
+                if isinstance(field, models.FileField):
+                    rows = model._base_manager.exclude(**{field.name: ''}).exclude(**{f'{field.name}__isnull': True})
+                    names.update(rows.values_list(field.name, flat=True).iterator(chunk_size=batch_size))
+
+        for model in IMAGE_MODELS:
+            rows = model._base_manager.exclude(image_variants={}).values_list('image_variants', flat=True)
+            for variants in rows.iterator(chunk_size=batch_size):
+                for format in FORMATS:
+                    names.update(variants.get(format, {}).values())
+        return names
+
+    def blobs(self, folder=''):
+        try:
+            directories, files = default_storage.listdir(folder)
+        except FileNotFoundError:
+            return
+        for name in files:
+            path = f'{folder}/{name}' if folder else name
+            if is_blob(path):
+                yield path
+        for directory in directories:
+            yield from self.blobs(f'{folder}/{directory}' if folder else directory)
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import OperatingInterval, Restaurant
+
+
+class Command(BaseCommand):
+    help = "Compile every restaurant's operating_hours into OperatingInterval rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        restaurants = Restaurant.objects.only('pk', 'operating_hours').order_by('pk')
+
+        compiled = 0
+        batch = []
+        for restaurant in restaurants.iterator(chunk_size=batch_size):
+            batch.append(restaurant)
+            if len(batch) == batch_size:
+                compiled += self.compile_batch(batch)
+                batch = []
+        if batch:
+            compiled += self.compile_batch(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Compiled operating hours of {compiled} restaurants."))
+
+    @transaction.atomic
+    def compile_batch(self, restaurants):
+        OperatingInterval.objects.filter(restaurant__in=restaurants).delete()
+        OperatingInterval.objects.bulk_create(
+            [interval for restaurant in restaurants for interval in OperatingInterval.for_restaurant(restaurant)]
+        )
+        return len(restaurants)
@@ -0,0 +1,46 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core.images import IMAGE_MODELS, render_derivatives, store_variants
+
+
+class Command(BaseCommand):
+    help = (
+        "Render the resized copies of every uploaded image that has none yet (all of them with "
+        "--force), spread over worker processes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Processes; 0 renders in this one")
+        parser.add_argument('--force', action='store_true')
+
+    def handle(self, *args, **options):
+        jobs = []
+        for model in IMAGE_MODELS:
+            rows = model.objects.exclude(image='').exclude(image__isnull=True).order_by('pk')
+            for pk, name, rendered in rows.values_list('pk', 'image', 'image_variants__name'):
+                if options['force'] or rendered != name:
+                    jobs.append((model, pk, name))
+
+        names = [name for _, _, name in jobs]
+        if options['workers']:
+            # Forked workers only read and write files; the database stays with this process
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+                stored = self.store(jobs, executor.map(render_derivatives, names, chunksize=8))
+        else:
+            stored = self.store(jobs, map(render_derivatives, names))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered derivatives of {stored} images, {len(jobs) - stored} skipped or unreadable."
+        ))
+
+    def store(self, jobs, rendered):
+        """Record each image's derivatives as soon as they are rendered."""
+        return sum(
+            store_variants(model, pk, variants)
+            for (model, pk, _), variants in zip(jobs, rendered) if variants is not None
+        )
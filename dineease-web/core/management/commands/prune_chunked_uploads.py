@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import ChunkedUpload
+from core.uploads import discard_part
+
+
+class Command(BaseCommand):
+    help = "Delete uploads idle for CHUNKED_UPLOAD_EXPIRY_HOURS, with the part files of unfinished ones, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=settings.CHUNKED_UPLOAD_EXPIRY_HOURS)
+        deleted = 0
+        while True:
+            batch = list(ChunkedUpload.objects.filter(updated_at__lte=cutoff).only('pk', 'image')[:options['batch_size']])
+            for upload in batch:
+                if upload.image_id is None:
+                    discard_part(upload)
+            count, _ = ChunkedUpload.objects.filter(pk__in=[upload.pk for upload in batch]).delete()
+            deleted += count
+            if len(batch) < options['batch_size']:
+                break
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired uploads."))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from core.models import ExpiringToken, TokenCutoff
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired outstanding and blacklisted JWTs, expired token cutoffs and expired legacy auth tokens, in batches. "
+        "Unlike flushexpiredtokens, no statement deletes more than --batch-size rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        # Blacklist rows first, so deleting the outstanding tokens has nothing to cascade to
+        blacklisted = self.prune(BlacklistedToken.objects.filter(token__expires_at__lte=now), options['batch_size'])
+        outstanding = self.prune(OutstandingToken.objects.filter(expires_at__lte=now), options['batch_size'])
+        cutoffs = self.prune(TokenCutoff.objects.filter(expires_at__lte=now), options['batch_size'])
+        legacy = self.prune(ExpiringToken.objects.filter(created__lte=now - ExpiringToken.LIFETIME), options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {outstanding} expired outstanding tokens, {blacklisted} blacklisted tokens, "
+            f"{cutoffs} token cutoffs and {legacy} legacy auth tokens."
+        ))
+
+    def prune(self, expired, batch_size):
+        deleted = 0
+        while True:
+            batch = list(expired.values_list('pk', flat=True)[:batch_size])
+            count, _ = expired.model.objects.filter(pk__in=batch).delete()
+            deleted += count
+            if len(batch) < batch_size:
+                return deleted
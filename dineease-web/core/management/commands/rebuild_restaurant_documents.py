@@ -0,0 +1,32 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core.documents import rebuild_documents
+from core.models import Restaurant
+
+
+class Command(BaseCommand):
+    help = "Rebuild the pre-rendered restaurant documents in parallel batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        ids = list(Restaurant.objects.order_by('pk').values_list('pk', flat=True))
+        batches = [ids[i:i + batch_size] for i in range(0, len(ids), batch_size)]
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            built = sum(executor.map(self.rebuild_batch, batches))
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {built} restaurant documents in {len(batches)} batches."))
+
+    def rebuild_batch(self, ids):
+        try:
+            return rebuild_documents(ids)
+        finally:
+            # Each worker thread opened its own connection
+            connections.close_all()
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from core.scheduler import sync_live_promos
+
+
+class Command(BaseCommand):
+    help = "Flip Promo.is_live as promo time windows open and close."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Sync once and exit, e.g. from cron.")
+        parser.add_argument(
+            '--max-sleep', type=int, default=300,
+            help="Longest wait in seconds between syncs, so edited promos are picked up.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            flipped, next_change = sync_live_promos()
+            if flipped:
+                self.stdout.write(f"{timezone.now():%Y-%m-%d %H:%M:%S} flipped {flipped} promos")
+            if options['once']:
+                return
+
+            delay = options['max_sleep']
+            if next_change is not None:
+                delay = min(delay, max((next_change - timezone.now()).total_seconds(), 0))
+            close_old_connections()
+            time.sleep(delay)
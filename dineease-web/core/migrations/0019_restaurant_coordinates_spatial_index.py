@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+# Restaurant.coordinates started out as a CharField and was converted to a
+# PointField in 0006. AlterField does not build the spatial index Django adds
+# for new geometry columns, so KNN ordering and ST_DWithin fell back to
+# sequential scans. Create it under the name Django would have picked, leaving
+# databases that already have it alone.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_promo_code_promo_image_promo_minimum_order_and_more'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS "core_restaurant_coordinates_24798298_id" '
+                'ON "core_restaurant" USING GIST ("coordinates");',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
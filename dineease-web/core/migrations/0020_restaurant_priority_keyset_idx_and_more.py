@@ -0,0 +1,24 @@
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_restaurant_coordinates_spatial_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(django.db.models.functions.comparison.Coalesce(models.F('priority_index'), models.Value(2147483647)), models.F('id'), name='restaurant_priority_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='promo',
+            index=models.Index(django.db.models.functions.comparison.Coalesce(models.F('priority_index'), models.Value(2147483647)), models.F('id'), name='promo_priority_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='menu',
+            index=models.Index(django.db.models.functions.comparison.Coalesce(models.F('priority_index'), models.Value(2147483647)), models.F('id'), name='menu_priority_keyset_idx'),
+        ),
+    ]
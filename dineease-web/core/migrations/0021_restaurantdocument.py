@@ -0,0 +1,21 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_restaurant_priority_keyset_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RestaurantDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('document', models.JSONField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('restaurant', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='document', to='core.restaurant')),
+            ],
+        ),
+    ]
@@ -0,0 +1,124 @@
+import django.contrib.postgres.fields.ranges
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.db import migrations, models
+import re
+
+from django.db.backends.postgresql.psycopg_any import NumericRange
+
+# Frozen copy of core.hours as of this migration, so later changes to the
+# parser cannot change what it computes
+
+DAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+CLOSED = {'', 'closed', 'close', 'off', 'none', '-'}
+ALL_DAY = {'open 24 hours', '24 hours', '24h', 'all day'}
+
+TIME_RE = re.compile(r'^(\d{1,2})(?:[:.](\d{2}))?\s*([ap])\.?\s*m?\.?$|^(\d{1,2})[:.](\d{2})$')
+RANGE_SEPARATOR_RE = re.compile(r'\s*(?:–|—|-|\bto\b)\s*')
+PERIOD_SEPARATOR_RE = re.compile(r'\s*[,;/&]\s*|\s+and\s+')
+
+
+def parse_time(text):
+    text = text.strip().lower()
+    if text == 'noon':
+        return 12 * 60
+    if text == 'midnight':
+        return 0
+
+    match = TIME_RE.match(text)
+    if not match:
+        raise ValueError(text)
+
+    if match.group(4) is not None:
+        hour, minute = int(match.group(4)), int(match.group(5))
+        if hour > 24 or minute > 59:
+            raise ValueError(text)
+        return hour * 60 + minute
+
+    hour, minute, meridiem = int(match.group(1)), int(match.group(2) or 0), match.group(3)
+    if not 1 <= hour <= 12 or minute > 59:
+        raise ValueError(text)
+    hour %= 12
+    if meridiem == 'p':
+        hour += 12
+    return hour * 60 + minute
+
+
+def parse_day(text):
+    text = (text or '').strip()
+    if text.lower() in CLOSED:
+        return []
+    if text.lower() in ALL_DAY:
+        return [(0, MINUTES_PER_DAY)]
+
+    periods = []
+    for period in PERIOD_SEPARATOR_RE.split(text):
+        bounds = RANGE_SEPARATOR_RE.split(period.strip())
+        if len(bounds) != 2:
+            raise ValueError(text)
+        start, end = parse_time(bounds[0]), parse_time(bounds[1])
+        if end <= start:
+            end += MINUTES_PER_DAY
+        periods.append((start, end))
+    return periods
+
+
+def compile_weekly_hours(hours):
+    """Merged minute-of-week intervals; days that cannot be parsed are closed."""
+    intervals = []
+    for index, day in enumerate(DAYS):
+        try:
+            periods = parse_day((hours or {}).get(day))
+        except ValueError:
+            periods = []
+
+        offset = index * MINUTES_PER_DAY
+        for start, end in periods:
+            start, end = offset + start, offset + end
+            if end > MINUTES_PER_WEEK:
+                intervals.append((0, end - MINUTES_PER_WEEK))
+                end = MINUTES_PER_WEEK
+            intervals.append((start, end))
+
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def compile_existing_hours(apps, schema_editor):
+    Restaurant = apps.get_model('core', 'Restaurant')
+    OperatingInterval = apps.get_model('core', 'OperatingInterval')
+    OperatingInterval.objects.bulk_create(
+        OperatingInterval(restaurant_id=pk, minutes=NumericRange(start, end))
+        for pk, hours in Restaurant.objects.values_list('pk', 'operating_hours').iterator()
+        for start, end in compile_weekly_hours(hours)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_category_updated_at_menu_updated_at_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OperatingInterval',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minutes', django.contrib.postgres.fields.ranges.IntegerRangeField()),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='operating_intervals', to='core.restaurant')),
+            ],
+            options={
+                'indexes': [django.contrib.postgres.indexes.GistIndex(fields=['minutes'], name='operating_interval_minutes_idx')],
+            },
+        ),
+        migrations.RunPython(compile_existing_hours, migrations.RunPython.noop),
+    ]
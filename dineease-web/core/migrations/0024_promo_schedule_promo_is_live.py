@@ -0,0 +1,139 @@
+import re
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+# Frozen copy of core.hours and compile_promo_schedule as of this migration,
+# so later changes to them cannot change what it computes
+
+DAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+CLOSED = {'', 'closed', 'close', 'off', 'none', '-'}
+ALL_DAY = {'open 24 hours', '24 hours', '24h', 'all day'}
+
+TIME_RE = re.compile(r'^(\d{1,2})(?:[:.](\d{2}))?\s*([ap])\.?\s*m?\.?$|^(\d{1,2})[:.](\d{2})$')
+RANGE_SEPARATOR_RE = re.compile(r'\s*(?:–|—|-|\bto\b)\s*')
+PERIOD_SEPARATOR_RE = re.compile(r'\s*[,;/&]\s*|\s+and\s+')
+
+
+def parse_time(text):
+    text = text.strip().lower()
+    if text == 'noon':
+        return 12 * 60
+    if text == 'midnight':
+        return 0
+
+    match = TIME_RE.match(text)
+    if not match:
+        raise ValueError(text)
+
+    if match.group(4) is not None:
+        hour, minute = int(match.group(4)), int(match.group(5))
+        if hour > 24 or minute > 59:
+            raise ValueError(text)
+        return hour * 60 + minute
+
+    hour, minute, meridiem = int(match.group(1)), int(match.group(2) or 0), match.group(3)
+    if not 1 <= hour <= 12 or minute > 59:
+        raise ValueError(text)
+    hour %= 12
+    if meridiem == 'p':
+        hour += 12
+    return hour * 60 + minute
+
+
+def parse_day(text):
+    text = (text or '').strip()
+    if text.lower() in CLOSED:
+        return []
+    if text.lower() in ALL_DAY:
+        return [(0, MINUTES_PER_DAY)]
+
+    periods = []
+    for period in PERIOD_SEPARATOR_RE.split(text):
+        bounds = RANGE_SEPARATOR_RE.split(period.strip())
+        if len(bounds) != 2:
+            raise ValueError(text)
+        start, end = parse_time(bounds[0]), parse_time(bounds[1])
+        if end <= start:
+            end += MINUTES_PER_DAY
+        periods.append((start, end))
+    return periods
+
+
+def compile_weekly_hours(hours):
+    """Merged minute-of-week intervals; days that cannot be parsed are closed."""
+    intervals = []
+    for index, day in enumerate(DAYS):
+        try:
+            periods = parse_day((hours or {}).get(day))
+        except ValueError:
+            periods = []
+
+        offset = index * MINUTES_PER_DAY
+        for start, end in periods:
+            start, end = offset + start, offset + end
+            if end > MINUTES_PER_WEEK:
+                intervals.append((0, end - MINUTES_PER_WEEK))
+                end = MINUTES_PER_WEEK
+            intervals.append((start, end))
+
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def compile_promo_schedule(time_offer):
+    # Promos without a time_offer run around the clock
+    if not time_offer:
+        return [[0, MINUTES_PER_WEEK]]
+    return [list(interval) for interval in compile_weekly_hours(time_offer)]
+
+
+def in_window(intervals, moment, start_date, end_date):
+    local = timezone.localtime(moment, ZoneInfo(settings.RESTAURANT_TIME_ZONE))
+    if start_date and local.date() < start_date:
+        return False
+    if end_date and local.date() > end_date:
+        return False
+    minute = local.weekday() * MINUTES_PER_DAY + local.hour * 60 + local.minute
+    return any(start <= minute < end for start, end in intervals)
+
+
+def compile_existing_promos(apps, schema_editor):
+    Promo = apps.get_model('core', 'Promo')
+    now = timezone.now()
+    promos = list(Promo.objects.all())
+    for promo in promos:
+        promo.schedule = compile_promo_schedule(promo.time_offer)
+        promo.is_live = promo.status == 'active' and in_window(promo.schedule, now, promo.start_date, promo.end_date)
+    Promo.objects.bulk_update(promos, ['schedule', 'is_live'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_operatinginterval'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promo',
+            name='schedule',
+            field=models.JSONField(default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='promo',
+            name='is_live',
+            field=models.BooleanField(db_index=True, default=False, editable=False),
+        ),
+        migrations.RunPython(compile_existing_promos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+# Frozen copy of core.search.SEARCH_VECTORS as of this migration
+SEARCH_VECTORS = {
+    'Restaurant': (
+        SearchVector('name', weight='A', config='english')
+        + SearchVector('city', weight='B', config='english')
+        + SearchVector('description', weight='C', config='english')
+    ),
+    'Menu': (
+        SearchVector('name', weight='A', config='english')
+        + SearchVector('description', weight='C', config='english')
+    ),
+    'Category': SearchVector('name', weight='A', config='english'),
+}
+
+
+def fill_search_vectors(apps, schema_editor):
+    for model_name, vector in SEARCH_VECTORS.items():
+        apps.get_model('core', model_name).objects.update(search_vector=vector)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_promo_schedule_promo_is_live'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='category',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='menu',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='category_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='category_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='menu',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='menu_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='menu',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='menu_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='restaurant_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='restaurant_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+    ]
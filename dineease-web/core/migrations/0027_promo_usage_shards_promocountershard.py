@@ -0,0 +1,30 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_restaurant_city_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promo',
+            name='usage_shards',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='PromoCounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('capacity', models.PositiveIntegerField(blank=True, null=True)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('promo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage_counters', to='core.promo')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('promo', 'shard'), name='unique_promo_counter_shard')],
+            },
+        ),
+    ]
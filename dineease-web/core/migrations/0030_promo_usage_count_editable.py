@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0029_chunkedupload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='promo',
+            name='usage_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
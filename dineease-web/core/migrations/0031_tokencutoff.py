@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0030_promo_usage_count_editable'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenCutoff',
+            fields=[
+                ('user_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('revoked_at', models.DateTimeField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
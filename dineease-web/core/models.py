@@ -1,14 +1,25 @@
-from django.db import models
+import random
+import uuid
+
+from django.db import models, transaction
+from django.db.models import F, Q
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.gis.db import models as gis_models
-from .constants import CANADA_PROVINCE_CHOICES
+from .constants import CANADA_PROVINCE_CHOICES, UNRANKED_PRIORITY
 from rest_framework.authtoken.models import Token
 from django.utils import timezone
 from datetime import timedelta
 from django.conf import settings
 from django.utils.text import slugify
+from django.db.models.functions import Coalesce, Upper
+from django.contrib.postgres.fields import IntegerRangeField
+from django.contrib.postgres.indexes import GinIndex, GistIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.core.exceptions import ValidationError
+from django.db.backends.postgresql.psycopg_any import NumericRange
+from .hours import MINUTES_PER_WEEK, compile_weekly_hours, in_window, minute_of_week
 
 class Category(models.Model):
     CATEGORY_TYPES = (
@@ -19,8 +30,18 @@ class Category(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     image = models.ImageField(upload_to='category_images/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)  # Resized copies, see core.images
     category_type = models.CharField(max_length=50, choices=CATEGORY_TYPES)
     priority_index = models.PositiveIntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by core.signals, see core.search
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='category_search_idx'),
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='category_name_trgm_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.get_category_type_display()})"
@@ -40,6 +61,7 @@ class Restaurant(models.Model):
 
     name = models.CharField(max_length=255)
     image = models.ImageField(upload_to='restaurant_images/')
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     categories = models.ManyToManyField(
         Category,
         blank=True,
@@ -78,15 +100,77 @@ class Restaurant(models.Model):
             "linkedin": ""
         }
     )
+    updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by core.signals, see core.search
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination order, see core.pagination.PriorityPagination
+            models.Index(Coalesce('priority_index', models.Value(UNRANKED_PRIORITY)), 'id', name='restaurant_priority_keyset_idx'),
+            GinIndex(fields=['search_vector'], name='restaurant_search_idx'),
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='restaurant_name_trgm_idx'),
+            # Category count scopes, see core.catalog.category_counts
+            models.Index(Upper('city'), 'province', name='restaurant_city_idx'),
+            models.Index(fields=['province'], name='restaurant_province_idx'),
+        ]
+
+    def clean(self):
+        try:
+            compile_weekly_hours(self.operating_hours)
+        except ValueError as e:
+            raise ValidationError({'operating_hours': str(e)})
 
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
         super().save(*args, **kwargs)
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'operating_hours' in update_fields:
+            self.compile_operating_hours()
+
+    def compile_operating_hours(self):
+        """Rewrite the OperatingInterval rows used by the open-now filters."""
+        self.operating_intervals.all().delete()
+        OperatingInterval.objects.bulk_create(OperatingInterval.for_restaurant(self))
     
     def __str__(self):
         return self.name
+
+class OperatingInterval(models.Model):
+    # operating_hours compiled into minute-of-week ranges (Monday 00:00 is 0),
+    # so "open at" filters are an indexed range containment check.
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='operating_intervals')
+    minutes = IntegerRangeField()
+
+    class Meta:
+        indexes = [
+            GistIndex(fields=['minutes'], name='operating_interval_minutes_idx'),
+        ]
+
+    @classmethod
+    def for_restaurant(cls, restaurant):
+        # Unparseable days count as closed here, clean() reports them in forms
+        return [
+            cls(restaurant=restaurant, minutes=NumericRange(start, end))
+            for start, end in compile_weekly_hours(restaurant.operating_hours, strict=False)
+        ]
+
+    @classmethod
+    def restaurants_open_at(cls, moment):
+        """Subquery of the ids of restaurants open at ``moment``."""
+        return cls.objects.filter(minutes__contains=minute_of_week(moment)).values('restaurant_id')
+
+    def __str__(self):
+        return f"{self.restaurant_id}: {self.minutes.lower}-{self.minutes.upper}"
     
+def compile_promo_schedule(time_offer):
+    # Promos without a time_offer run around the clock
+    if not time_offer:
+        return [[0, MINUTES_PER_WEEK]]
+    return [list(interval) for interval in compile_weekly_hours(time_offer, strict=False)]
+
 class Promo(models.Model):
     STATUSES = (
         ('active', 'Active'),
@@ -105,8 +189,12 @@ class Promo(models.Model):
     discount = models.DecimalField(max_digits=5, decimal_places=2)
     discount_type = models.CharField(max_length=10, choices=DISCOUNT_TYPES, default='percentage')
     image = models.ImageField(upload_to='promo_images/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     usage_limit = models.PositiveIntegerField(null=True, blank=True)  # Total times promo can be used
-    usage_count = models.PositiveIntegerField(default=0)  # Tracks how many times it has been used
+    usage_count = models.PositiveIntegerField(default=0, editable=False)  # Tracks how many times it has been used
+    # Spread usage_count over this many PromoCounterShard rows, for promos hot
+    # enough that the single row lock serializes redemptions. 0 disables.
+    usage_shards = models.PositiveSmallIntegerField(default=0, editable=False)
     status = models.CharField(max_length=10, choices=STATUSES, default='active')
     start_date = models.DateField(null=True, blank=True)
     end_date = models.DateField(null=True, blank=True)
@@ -125,27 +213,140 @@ class Promo(models.Model):
     minimum_order = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     code = models.CharField(max_length=50, unique=True, null=True, blank=True)
     target_audience = models.CharField(max_length=50, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # time_offer compiled to minute-of-week intervals, see core.hours
+    schedule = models.JSONField(default=list, editable=False)
+    # Kept current by the run_promo_scheduler command at every window boundary
+    is_live = models.BooleanField(default=False, db_index=True, editable=False)
+
+    COUNTER_FIELDS = ('usage_count', 'usage_shards')
+
+    class Meta:
+        indexes = [
+            # Keyset pagination order, see core.pagination.PriorityPagination
+            models.Index(Coalesce('priority_index', models.Value(UNRANKED_PRIORITY)), 'id', name='promo_priority_keyset_idx'),
+        ]
+
+    def clean(self):
+        try:
+            compile_weekly_hours(self.time_offer)
+        except ValueError as e:
+            raise ValidationError({'time_offer': str(e)})
 
+    def save(self, *args, **kwargs):
+        self.schedule = compile_promo_schedule(self.time_offer)
+        self.is_live = self.live_at(timezone.now())
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'schedule', 'is_live'}
+        elif not self._state.adding and not kwargs.get('force_insert'):
+            # The counters are only written by conditional UPDATEs; a full-row
+            # save would put back the values read before concurrent redemptions
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+    def live_at(self, moment):
+        """Whether the promo is active and inside its date and time window."""
+        if self.status != 'active':
+            return False
+        return in_window(self.schedule, moment, self.start_date, self.end_date)
 
     def can_be_used(self):
         """Check if the promo is valid and can be used."""
-        if self.status != 'active':
+        if not self.live_at(timezone.now()):
             return False
-        if self.usage_limit is not None and self.usage_count >= self.usage_limit:
+        # Sharded counters are only checked when a use is claimed
+        if not self.usage_shards and self.usage_limit is not None and self.usage_count >= self.usage_limit:
             return False
         return True
 
     def increment_usage(self):
-        """Increment usage count when the promo is used."""
-        if self.can_be_used():
-            self.usage_count += 1
-            self.save()
-            return True
-        return False
+        """
+        Count one use of the promo, False once usage_limit is reached.
+
+        A single conditional UPDATE, so concurrent redemptions can neither
+        lose increments nor overshoot the limit. ``usage_count`` on this
+        instance is not refreshed.
+        """
+        if not self.can_be_used():
+            return False
+        if self.usage_shards:
+            return PromoCounterShard.claim(self)
+
+        under_limit = Q(usage_limit__isnull=True) | Q(usage_count__lt=F('usage_limit'))
+        return Promo.objects.filter(under_limit, pk=self.pk).update(usage_count=F('usage_count') + 1) == 1
+
+    def release_usage(self):
+        """Give back a use counted by increment_usage(), e.g. for a failed payment."""
+        if self.usage_shards:
+            return PromoCounterShard.release(self)
+        return Promo.objects.filter(pk=self.pk, usage_count__gt=0).update(usage_count=F('usage_count') - 1) == 1
+
+    def total_usage(self):
+        return self.usage_count + sum(self.usage_counters.values_list('count', flat=True))
+
+    @transaction.atomic
+    def shard_usage_counter(self, shards):
+        """
+        Count further uses on ``shards`` counter rows (0 goes back to the
+        promo row). Uses counted so far are folded into usage_count and the
+        remaining ones split between the shards. Called again by core.signals
+        when usage_limit changes.
+        """
+        promo = Promo.objects.select_for_update().get(pk=self.pk)
+        counters = list(promo.usage_counters.select_for_update())
+        usage_count = promo.usage_count + sum(counter.count for counter in counters)
+        promo.usage_counters.all().delete()
+
+        if shards:
+            remaining = None if promo.usage_limit is None else max(promo.usage_limit - usage_count, 0)
+            PromoCounterShard.objects.bulk_create(
+                PromoCounterShard(
+                    promo=promo,
+                    shard=shard,
+                    capacity=None if remaining is None else remaining // shards + (shard < remaining % shards),
+                )
+                for shard in range(shards)
+            )
+        Promo.objects.filter(pk=self.pk).update(usage_count=usage_count, usage_shards=shards)
+        self.usage_count, self.usage_shards = usage_count, shards
 
     def __str__(self):
         return self.name
     
+class PromoCounterShard(models.Model):
+    # One slice of a sharded promo usage counter, see Promo.shard_usage_counter
+    promo = models.ForeignKey(Promo, on_delete=models.CASCADE, related_name='usage_counters')
+    shard = models.PositiveSmallIntegerField()
+    capacity = models.PositiveIntegerField(null=True, blank=True)  # Uses this shard may hand out
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['promo', 'shard'], name='unique_promo_counter_shard'),
+        ]
+
+    @classmethod
+    def claim(cls, promo):
+        """Count a use on a random shard with room left, trying the others in turn."""
+        under_capacity = Q(capacity__isnull=True) | Q(count__lt=F('capacity'))
+        for shard in random.sample(range(promo.usage_shards), promo.usage_shards):
+            if cls.objects.filter(under_capacity, promo=promo, shard=shard).update(count=F('count') + 1):
+                return True
+        return False
+
+    @classmethod
+    def release(cls, promo):
+        for shard in random.sample(range(promo.usage_shards), promo.usage_shards):
+            if cls.objects.filter(promo=promo, shard=shard, count__gt=0).update(count=F('count') - 1):
+                return True
+        return False
+
+    def __str__(self):
+        return f"{self.promo_id}/{self.shard}: {self.count}"
+
 class Menu(models.Model):
     STATUSES = (
         ('active', 'Active'),
@@ -159,7 +360,20 @@ class Menu(models.Model):
     cost = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=10, choices=STATUSES, default='active')
     image = models.ImageField(upload_to='menu_images/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     priority_index = models.PositiveIntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by core.signals, see core.search
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination order, see core.pagination.PriorityPagination
+            models.Index(Coalesce('priority_index', models.Value(UNRANKED_PRIORITY)), 'id', name='menu_priority_keyset_idx'),
+            GinIndex(fields=['search_vector'], name='menu_search_idx'),
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='menu_name_trgm_idx'),
+            models.Index(fields=['status', 'category'], name='menu_status_category_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -189,6 +403,7 @@ class RestaurantImage(models.Model):
     restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='images', null=True, blank=True)
     menu = models.ForeignKey(Menu, on_delete=models.CASCADE, related_name='images', null=True, blank=True)
     image = models.ImageField(upload_to='images/')
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     caption = models.CharField(max_length=255, blank=True, null=True)
 
     def __str__(self):
@@ -198,7 +413,34 @@ class RestaurantImage(models.Model):
             return f"Image for menu: {self.menu.name}"
         else:
             return "Unassigned image"
-    
+
+class ChunkedUpload(models.Model):
+    # A photo sent in chunks (see core.uploads). Its bytes so far are in a part
+    # file under CHUNKED_UPLOAD_ROOT; once `offset` reaches `size` it becomes `image`.
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chunked_uploads')
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, null=True, blank=True)
+    menu = models.ForeignKey(Menu, on_delete=models.CASCADE, null=True, blank=True)
+    filename = models.CharField(max_length=255)
+    caption = models.CharField(max_length=255, blank=True, null=True)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    image = models.OneToOneField(RestaurantImage, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Upload of {self.filename} ({self.offset}/{self.size} bytes)"
+
+class RestaurantDocument(models.Model):
+    # Pre-rendered RestaurantSerializer output, kept current by core.signals
+    restaurant = models.OneToOneField(Restaurant, on_delete=models.CASCADE, related_name='document')
+    document = models.JSONField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Document for restaurant: {self.restaurant_id}"
+
 class UserProfile(models.Model):
     USER_TYPES = [
         ('restaurant_owner', 'Restaurant Owner'),
@@ -213,16 +455,19 @@ class UserProfile(models.Model):
     address = models.CharField(max_length=255)
     city = models.CharField(max_length=100)
     image = models.ImageField(upload_to='user_pictures/', blank=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     
     def __str__(self):
         return self.user.username
     
 class ExpiringToken(Token):
+    LIFETIME = timedelta(hours=24)  # Set the token validity duration here
+
     class Meta:
         proxy = True  # Use this model as a proxy to add additional methods without creating a new table
 
     def has_expired(self):
-        expiration_date = self.created + timedelta(hours=24)  # Set the token validity duration here
+        expiration_date = self.created + self.LIFETIME
         return timezone.now() > expiration_date
 
     @classmethod
@@ -232,3 +477,13 @@ class ExpiringToken(Token):
             token.delete()
             token = cls.objects.create(user=user)
         return token
+
+class TokenCutoff(models.Model):
+    # Every JWT issued to the user up to revoked_at is revoked (see core.revocation).
+    # Not a foreign key: the cutoff outlives a deleted user until their tokens expire.
+    user_id = models.IntegerField(primary_key=True)
+    revoked_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Tokens of user {self.user_id} issued up to {self.revoked_at}"
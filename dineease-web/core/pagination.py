@@ -0,0 +1,157 @@
+import base64
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.db.models import F, Func, Value
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import GreaterThan, LessThan
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from .constants import UNRANKED_PRIORITY
+
+
+class Row(Func):
+    """SQL row value such as ``(sort_key, id)``, compared element by element."""
+    template = '(%(expressions)s)'
+    output_field = models.Field()
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on a ``(sort key, id)`` pair.
+
+    Pages are fetched with ``WHERE (sort_key, id) > (last_key, last_id)`` instead
+    of an OFFSET, so with a matching index every page is a single index seek and
+    deep pages cost the same as the first one.
+    """
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    descending = False
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_sort_key(self):
+        """Expression the results are ordered by (ties are broken on ``id``)."""
+        return F('id')
+
+    def decode_key(self, value):
+        """Turn a sort key read back from a cursor into a query value."""
+        return value
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            key, pk = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            return self.decode_key(key), int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, key, pk):
+        payload = json.dumps([key, pk], cls=DjangoJSONEncoder)
+        return base64.urlsafe_b64encode(payload.encode('ascii')).decode('ascii')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        queryset = queryset.annotate(keyset_key=self.get_sort_key())
+        if self.descending:
+            queryset = queryset.order_by('-keyset_key', '-id')
+            after = LessThan
+        else:
+            queryset = queryset.order_by('keyset_key', 'id')
+            after = GreaterThan
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            queryset = queryset.filter(after(
+                Row(F('keyset_key'), F('id')),
+                Row(Value(cursor[0]), Value(cursor[1])),
+            ))
+
+        # Fetch one extra row to know whether there is a next page.
+        results = list(queryset[:page_size + 1])
+        self.next_cursor = None
+        if len(results) > page_size:
+            results = results[:page_size]
+            last = results[-1]
+            self.next_cursor = self.encode_cursor(last.keyset_key, last.pk)
+        return results
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class PriorityPagination(KeysetPagination):
+    """
+    Pages catalog rows by ``(priority_index, id)``, backed by the matching
+    expression indexes on Restaurant, Menu and Promo.
+    """
+
+    def get_sort_key(self):
+        return Coalesce(F('priority_index'), Value(UNRANKED_PRIORITY))
+
+    def decode_key(self, value):
+        return int(value)
+
+
+class NearbyPagination(KeysetPagination):
+    """Pages restaurants by their KNN distance, annotated by the nearby endpoint."""
+
+    def get_sort_key(self):
+        return F('knn_distance')
+
+    def decode_key(self, value):
+        return float(value)
+
+
+class RecentPagination(KeysetPagination):
+    """Pages rows newest first by ``(created_at, id)``."""
+    page_size = 50
+    descending = True
+
+    def get_sort_key(self):
+        return F('created_at')
+
+    def encode_cursor(self, key, pk):
+        # In full; DjangoJSONEncoder would cut the microseconds to milliseconds
+        return super().encode_cursor(key.isoformat(), pk)
+
+    def decode_key(self, value):
+        key = parse_datetime(value)
+        if key is None:
+            raise ValueError(value)
+        return key
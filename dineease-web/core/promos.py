@@ -0,0 +1,73 @@
+import uuid
+
+from django.core.cache import cache
+from django.db.models import Prefetch
+from .models import Promo
+from payments.models import PromoUsage
+
+REDEEMED_PROMOS_TIMEOUT = 60 * 60 * 24
+
+
+def winning_promo_prefetch(lookup='promos'):
+    """
+    Prefetch the highest priority live promo of every menu into
+    ``menu.winning_promos``.
+
+    The prefetch queryset is sliced, which Django resolves with a single
+    ROW_NUMBER() window partitioned by menu, so a whole page of menus costs one
+    query instead of one per menu.
+    """
+    return Prefetch(
+        lookup,
+        queryset=Promo.objects.filter(is_live=True).order_by('-priority_index')[:1],
+        to_attr='winning_promos',
+    )
+
+
+def get_winning_promo(menu):
+    """Return the promo that sets the discounted price of ``menu``, if any."""
+    if hasattr(menu, 'winning_promos'):
+        return menu.winning_promos[0] if menu.winning_promos else None
+    return menu.promos.filter(is_live=True).order_by('-priority_index').first()
+
+
+def get_discounted_cost(menu, promo):
+    """Apply ``promo`` to the menu cost; None when there is no promo."""
+    if not promo:
+        return None
+
+    if promo.discount_type == 'percentage':
+        discount = menu.cost * (promo.discount / 100)
+    elif promo.discount_type == 'fixed':
+        discount = promo.discount
+    else:
+        discount = 0
+
+    # Ensure discounted price is not negative
+    return round(max(menu.cost - discount, 0), 2)
+
+
+def redeemed_promos_version_key(user_id):
+    return f'redeemed-promos-version:{user_id}'
+
+
+def redeemed_promo_ids(user):
+    """
+    Ids of the promos ``user`` has an approved usage for, cached per user as a
+    frozenset. Entries are keyed by a per user version, which payments.signals
+    drops whenever a usage changes. A miss that read the table before the
+    change stores what it read under the old version, where nothing looks.
+    """
+    version = cache.get_or_set(redeemed_promos_version_key(user.pk), uuid.uuid4().hex, timeout=None)
+    key = f'redeemed-promos:{user.pk}:{version}'
+    promo_ids = cache.get(key)
+    if promo_ids is None:
+        promo_ids = frozenset(
+            PromoUsage.objects.filter(customer_id=user.pk, status='approved').values_list('promo_id', flat=True)
+        )
+        cache.set(key, promo_ids, REDEEMED_PROMOS_TIMEOUT)
+    return promo_ids
+
+
+def forget_redeemed_promos(user_id):
+    cache.delete(redeemed_promos_version_key(user_id))
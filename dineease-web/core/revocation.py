@@ -0,0 +1,178 @@
+"""
+Revoked tokens.
+
+Revoking a token blacklists it by jti in simplejwt's token_blacklist tables,
+where refresh tokens rotated out are recorded too. Only refresh tokens are
+recorded as outstanding when issued; an access token gets a row only when it
+is revoked. All of a user's tokens are revoked when their credentials change
+by a TokenCutoff instead: every token issued to them up to its revoked_at,
+access or refresh. The prune_tokens command deletes rows of expired tokens
+and cutoffs.
+
+Each process keeps a Bloom filter of the blacklisted jtis and of the users
+with a cutoff. A token neither of whose keys the filter contains has not been
+revoked, and nearly every token checked is one of those, so the check costs
+no query. The filter is built from the tables, topped up with newly revoked
+rows every TOKEN_REVOCATION_REFRESH_SECONDS and rebuilt every
+TOKEN_REVOCATION_REBUILD_SECONDS. A token revoked by another process may be
+accepted until the next top-up; the revoking process refuses it right away.
+"""
+import hashlib
+import math
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .models import TokenCutoff
+
+MIN_CAPACITY = 1024
+# Longest a blacklisting transaction is expected to take to commit: rows are
+# read again for this long, as a row can become visible after rows with higher ids
+COMMIT_WINDOW = 60
+
+
+def cutoff_key(user_id):
+    return f'user:{user_id}'
+
+
+class BloomFilter:
+    def __init__(self, capacity, false_positive_rate):
+        self.capacity = capacity
+        self.size = math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, key):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + index * second) % self.size for index in range(self.hashes)]
+
+    def add(self, key):
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+
+
+class RevokedTokens:
+    """The process's Bloom filter of blacklisted jtis and cut off users, kept current as described above."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.filter = None
+        self.built_at = self.refreshed_at = 0
+        # (time, id): every row with a higher id was read after that time
+        self.checkpoints = deque()
+        # Cutoffs are updated in place, so they are read again by revoked_at
+        self.cutoffs_read_at = None
+
+    def rebuild(self):
+        with self.lock:
+            self._rebuild(time.monotonic())
+
+    def _rebuild(self, now):
+        settled = timezone.now() - timedelta(seconds=COMMIT_WINDOW)
+        settled_id = BlacklistedToken.objects.filter(blacklisted_at__lt=settled).aggregate(id=Max('id'))['id'] or 0
+        self.cutoffs_read_at = timezone.now()
+        jtis = BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now()).values_list('token__jti', flat=True)
+        users = TokenCutoff.objects.filter(expires_at__gt=timezone.now()).values_list('user_id', flat=True)
+        capacity = max(2 * (jtis.count() + users.count()), MIN_CAPACITY)
+        bloom = BloomFilter(capacity, settings.TOKEN_REVOCATION_FALSE_POSITIVE_RATE)
+        for jti in jtis.iterator(chunk_size=5000):
+            bloom.add(jti)
+        for user_id in users.iterator(chunk_size=5000):
+            bloom.add(cutoff_key(user_id))
+        self.filter = bloom
+        self.built_at = self.refreshed_at = now
+        self.checkpoints = deque([(now - COMMIT_WINDOW, settled_id)])
+
+    def _refresh(self, now):
+        while len(self.checkpoints) > 1 and now - self.checkpoints[1][0] >= COMMIT_WINDOW:
+            self.checkpoints.popleft()
+        last_id = since = self.checkpoints[0][1]
+        for pk, jti in BlacklistedToken.objects.filter(id__gt=since).values_list('id', 'token__jti'):
+            self.filter.add(jti)
+            last_id = max(last_id, pk)
+        self.checkpoints.append((now, last_id))
+        read_at = timezone.now()
+        since = self.cutoffs_read_at - timedelta(seconds=COMMIT_WINDOW)
+        for user_id in TokenCutoff.objects.filter(revoked_at__gte=since).values_list('user_id', flat=True):
+            self.filter.add(cutoff_key(user_id))
+        self.cutoffs_read_at = read_at
+        self.refreshed_at = now
+
+    def __contains__(self, key):
+        """Whether ``key``, a jti or cutoff_key(), may have been revoked; False means it has not."""
+        with self.lock:
+            now = time.monotonic()
+            if (
+                self.filter is None
+                or now - self.built_at >= settings.TOKEN_REVOCATION_REBUILD_SECONDS
+                or self.filter.count > self.filter.capacity
+            ):
+                self._rebuild(now)
+            elif now - self.refreshed_at >= settings.TOKEN_REVOCATION_REFRESH_SECONDS:
+                self._refresh(now)
+            return key in self.filter
+
+    def add(self, key):
+        with self.lock:
+            if self.filter is not None:
+                self.filter.add(key)
+
+
+revoked_tokens = RevokedTokens()
+
+
+def outstand(token):
+    """Record ``token`` as outstanding, for its blacklist row to point at, and return its row."""
+    outstanding, _ = OutstandingToken.objects.get_or_create(
+        jti=token[api_settings.JTI_CLAIM],
+        defaults={
+            'user_id': token.get(api_settings.USER_ID_CLAIM),
+            'token': str(token),
+            'created_at': datetime_from_epoch(token['iat']) if 'iat' in token else None,
+            'expires_at': datetime_from_epoch(token['exp']),
+        },
+    )
+    return outstanding
+
+
+def revoke_token(token):
+    """Blacklist ``token``, a validated access or refresh token."""
+    outstanding = outstand(token)
+    BlacklistedToken.objects.get_or_create(token=outstanding)
+    revoked_tokens.add(outstanding.jti)
+
+
+def revoke_user_tokens(user_id):
+    """Revoke every token issued to the user so far."""
+    now = timezone.now()
+    lifetime = max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME)
+    TokenCutoff.objects.update_or_create(user_id=user_id, defaults={'revoked_at': now, 'expires_at': now + lifetime})
+    revoked_tokens.add(cutoff_key(user_id))
+
+
+def is_revoked(token):
+    jti = token[api_settings.JTI_CLAIM]
+    # Only tokens the filter cannot rule out are looked up
+    if jti in revoked_tokens and BlacklistedToken.objects.filter(token__jti=jti).exists():
+        return True
+    user_id = token.get(api_settings.USER_ID_CLAIM)
+    if user_id is None or cutoff_key(user_id) not in revoked_tokens:
+        return False
+    # iat is in whole seconds: a token issued in the second of the cutoff is revoked too
+    issued_at = datetime_from_epoch(token['iat']) if 'iat' in token else datetime_from_epoch(0)
+    return TokenCutoff.objects.filter(user_id=user_id, revoked_at__gte=issued_at).exists()
@@ -0,0 +1,52 @@
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .catalog import bump_collections
+from .documents import schedule_rebuild
+from .hours import next_window_change
+from .menu_tree import invalidate_menu_trees
+from .models import Promo
+
+
+def sync_live_promos(moment=None):
+    """
+    Flip Promo.is_live for every promo whose window opened or closed by
+    ``moment`` and invalidate the cached catalog data showing them.
+
+    Returns the number of promos flipped and the next moment any window
+    changes (None when no active promo has a future boundary).
+    """
+    moment = moment or timezone.now()
+    promos = Promo.objects.filter(Q(status='active') | Q(is_live=True)).select_related('menu').only(
+        'status', 'start_date', 'end_date', 'schedule', 'is_live', 'restaurant', 'menu__restaurant',
+    )
+
+    flipped = {True: [], False: []}
+    restaurant_ids = set()
+    next_change = None
+    for promo in promos.iterator(chunk_size=1000):
+        live = promo.live_at(moment)
+        if live != promo.is_live:
+            flipped[live].append(promo.pk)
+            # A promo attached to neither is shown nowhere, nothing to invalidate
+            restaurant_id = promo.restaurant_id or (promo.menu.restaurant_id if promo.menu_id else None)
+            if restaurant_id is not None:
+                restaurant_ids.add(restaurant_id)
+
+        if promo.status == 'active':
+            change = next_window_change(promo.schedule, moment, promo.start_date, promo.end_date)
+            if change and (next_change is None or change < next_change):
+                next_change = change
+
+    with transaction.atomic():
+        for live, pks in flipped.items():
+            if pks:
+                # update() skips the save signals, so invalidate by hand
+                Promo.objects.filter(pk__in=pks).update(is_live=live, updated_at=moment)
+        if restaurant_ids:
+            bump_collections(('restaurants', 'menus'))
+            schedule_rebuild(restaurant_ids)
+            invalidate_menu_trees(restaurant_ids)
+
+    return len(flipped[True]) + len(flipped[False]), next_change
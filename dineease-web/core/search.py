@@ -0,0 +1,61 @@
+from django.contrib.gis.db.models.functions import Distance
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import Cast
+
+SEARCH_CONFIG = 'english'
+
+# Distance in metres at which a result's relevance is halved when the
+# search is made around a point.
+DISTANCE_DECAY = 5000
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+# Weighted document of every searchable model, stored in its search_vector
+SEARCH_VECTORS = {
+    'restaurant': (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('city', weight='B', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='C', config=SEARCH_CONFIG)
+    ),
+    'menu': (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='C', config=SEARCH_CONFIG)
+    ),
+    'category': SearchVector('name', weight='A', config=SEARCH_CONFIG),
+}
+
+
+def update_search_vectors(model, pks=None):
+    """Recompute ``search_vector`` in the database, for ``pks`` or every row."""
+    queryset = model._default_manager.all()
+    if pks is not None:
+        queryset = queryset.filter(pk__in=pks)
+    return queryset.update(search_vector=SEARCH_VECTORS[model._meta.model_name])
+
+
+def search(queryset, text, point=None, distance_field=None, limit=DEFAULT_LIMIT):
+    """
+    Rank ``queryset`` against ``text``.
+
+    Rows match on the full text index or, for misspellings, on trigram word
+    similarity of the name; both conditions are answered by GIN indexes.
+    Relevance is the text rank plus the name similarity. When ``point`` is
+    given it decays with the distance of ``distance_field`` from it.
+    """
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+    queryset = queryset.filter(
+        Q(search_vector=query) | Q(name__trigram_word_similar=text)
+    ).annotate(
+        relevance=SearchRank(F('search_vector'), query) + TrigramWordSimilarity(text, 'name'),
+    )
+
+    if point is not None and distance_field:
+        queryset = queryset.annotate(distance=Distance(distance_field, point)).annotate(
+            score=F('relevance') / (Value(1.0) + Cast('distance', FloatField()) / Value(float(DISTANCE_DECAY))),
+        )
+    else:
+        queryset = queryset.annotate(score=F('relevance'))
+
+    return queryset.order_by('-score', 'pk')[:limit]
@@ -1,30 +1,101 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Restaurant, Promo, Menu, UserProfile, RestaurantImage, AddonCategory, AddonOption, Category
+from .models import Restaurant, Promo, Menu, UserProfile, RestaurantImage, AddonCategory, AddonOption, Category, ChunkedUpload
 from django.core.exceptions import ValidationError
+from .promos import get_discounted_cost, get_winning_promo
+from .hours import compile_weekly_hours
+from .images import image_variants
+from django.core.files.storage import default_storage
+from django.conf import settings
+from django.core.validators import validate_image_file_extension
+from django.core.files.base import ContentFile
+
+class ImageVariantsField(serializers.Field):
+    """
+    Resized WebP and JPEG copies of the ``image`` by width, with a tiny
+    placeholder (see core.images); None until they are generated.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(source='*', read_only=True, **kwargs)
+
+    def to_representation(self, instance):
+        request = self.context.get('request')
+
+        def url(name):
+            url = default_storage.url(name)
+            return request.build_absolute_uri(url) if request is not None else url
+
+        return image_variants(instance, url)
 
 class RestaurantImageSerializer(serializers.ModelSerializer):
     image = serializers.ImageField(use_url=True)
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = RestaurantImage
-        fields = ['id', 'image', 'caption']
+        fields = ['id', 'image', 'image_variants', 'caption']
+
+class ChunkedUploadSerializer(serializers.ModelSerializer):
+    image = RestaurantImageSerializer(read_only=True)
+
+    class Meta:
+        model = ChunkedUpload
+        fields = ['id', 'restaurant', 'menu', 'filename', 'caption', 'size', 'offset', 'image']
+        read_only_fields = ['offset']
+
+    def validate_filename(self, value):
+        try:
+            validate_image_file_extension(ContentFile(b'', name=value))
+        except ValidationError as error:
+            raise serializers.ValidationError(error.messages)
+        return value
+
+    def validate_size(self, value):
+        if not 0 < value <= settings.CHUNKED_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f"Uploads must be between 1 and {settings.CHUNKED_UPLOAD_MAX_SIZE} bytes.")
+        return value
+
+    def validate(self, data):
+        if bool(data.get('restaurant')) == bool(data.get('menu')):
+            raise serializers.ValidationError("An upload is for either a restaurant or a menu.")
+        user = self.context['request'].user
+        restaurant = data.get('restaurant') or data['menu'].restaurant
+        if not user.is_staff and restaurant.owner_id != user.pk:
+            raise serializers.ValidationError("You can only upload images of your own restaurants.")
+        return data
 
 class PromoSerializer(serializers.ModelSerializer):
     image = serializers.ImageField(use_url=True)  # Keeps the image field with URL usage
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Promo
         fields = [
             'id', 'restaurant', 'name', 'description', 'discount', 'discount_type', 
-            'time_offer', 'status', 'image', 'priority_index', 'start_date', 
-            'end_date', 'minimum_order', 'code', 'usage_limit', 'target_audience'
+            'time_offer', 'status', 'image', 'image_variants', 'priority_index', 'start_date', 
+            'end_date', 'minimum_order', 'code', 'usage_limit', 'target_audience',
+            'is_live'
         ]
 
+    def validate_time_offer(self, value):
+        try:
+            compile_weekly_hours(value)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+        return value
+
+class AddonMenuItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Menu
+        fields = ['id', 'name', 'cost']
+
 class AddonOptionSerializer(serializers.ModelSerializer):
+    menu_item = AddonMenuItemSerializer(read_only=True)  # Set when a menu item is offered as the addon
+
     class Meta:
         model = AddonOption
-        fields = ['id', 'name', 'price']
+        fields = ['id', 'name', 'price', 'menu_item']
 
 class AddonCategorySerializer(serializers.ModelSerializer):
     addon_options = AddonOptionSerializer(many=True, read_only=True)
@@ -34,62 +105,125 @@ class AddonCategorySerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'required', 'max_selections', 'addon_options']
 
 class CategorySerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Category
-        fields = ['id', 'name', 'description', 'image']
+        fields = ['id', 'name', 'description', 'image', 'image_variants']
+
+class CategoryCountSerializer(CategorySerializer):
+    count = serializers.SerializerMethodField()
+
+    class Meta(CategorySerializer.Meta):
+        fields = CategorySerializer.Meta.fields + ['count']
+
+    def get_count(self, obj):
+        # Counted for the whole list at once, see CategoryCountsMixin
+        return self.context['category_counts'].get(obj.pk, 0)
 
 class MenuSerializer(serializers.ModelSerializer):
     addon_categories = AddonCategorySerializer(many=True, read_only=True)
     images = RestaurantImageSerializer(many=True, read_only=True)  # Include images if you need to
     discounted_cost = serializers.SerializerMethodField()  # New field for discounted price
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Menu
         fields = [
-            'id', 'name', 'description', 'cost', 'category', 'status', 'image', 
+            'id', 'name', 'description', 'cost', 'category', 'status', 'image', 'image_variants',
             'priority_index', 'addon_categories', 'images', 'discounted_cost'
         ]
 
     def get_discounted_cost(self, obj):
         """
         Calculate the discounted cost if a promo is applied to the menu.
+        Views prefetch the winning promo with winning_promo_prefetch(), so this
+        does not query per menu.
         """
-        # Get promos associated with the menu
-        promo = obj.promos.filter(status='active').order_by('-priority_index').first()
-
-        # If there's no active promo, return None (or original price if desired)
-        if not promo:
-            return None
+        return get_discounted_cost(obj, get_winning_promo(obj))
 
-        # Calculate the discounted price
-        if promo.discount_type == 'percentage':
-            discount = obj.cost * (promo.discount / 100)
-        elif promo.discount_type == 'fixed':
-            discount = promo.discount
-        else:
-            discount = 0
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """
+    A ModelSerializer that takes an additional `fields` argument that
+    controls which fields should be displayed.
+    """
 
-        # Ensure discounted price is not negative
-        discounted_price = max(obj.cost - discount, 0)
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
 
-        return round(discounted_price, 2)
+        if fields is not None:
+            # Drop any fields that are not specified in the `fields` argument.
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
 
-class RestaurantSerializer(serializers.ModelSerializer):
+class RestaurantSerializer(DynamicFieldsModelSerializer):
     promos = PromoSerializer(many=True, read_only=True)
     menus = MenuSerializer(many=True, read_only=True)
     images = RestaurantImageSerializer(many=True, read_only=True)
     categories = CategorySerializer(many=True, read_only=True)
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Restaurant
         fields = [
-            'id', 'name', 'categories', 'service_type', 'image', 'city', 'province', 'email',
+            'id', 'name', 'categories', 'service_type', 'image', 'image_variants', 'city', 'province', 'email',
             'operating_hours', 'location', 'coordinates',
             'priority_index', 'telephone', 'ratings', 'description', 'status', 'owner', 
             'social_media_links',
             'promos', 'menus', 'images'
         ]
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Promos the customer already redeemed, see RestaurantViewSet
+        excluded = self.context.get('excluded_promo_ids')
+        if excluded and 'promos' in data:
+            data['promos'] = [promo for promo in data['promos'] if promo['id'] not in excluded]
+        return data
+
+    def validate_operating_hours(self, value):
+        try:
+            compile_weekly_hours(value)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+        return value
+
+class NearbyRestaurantSerializer(RestaurantSerializer):
+    distance = serializers.SerializerMethodField()  # Metres from the requested point
+
+    class Meta(RestaurantSerializer.Meta):
+        fields = RestaurantSerializer.Meta.fields + ['distance']
+
+    def get_distance(self, obj):
+        return round(obj.distance.m, 1)
+
+class SearchResultSerializer(serializers.ModelSerializer):
+    score = serializers.FloatField(read_only=True)
+    image_variants = ImageVariantsField()
+    distance = serializers.SerializerMethodField()  # Metres, when searching around a point
+
+    def get_distance(self, obj):
+        distance = getattr(obj, 'distance', None)
+        return round(distance.m, 1) if distance is not None else None
+
+class RestaurantSearchSerializer(SearchResultSerializer):
+    class Meta:
+        model = Restaurant
+        fields = ['id', 'name', 'city', 'province', 'image', 'image_variants', 'ratings', 'score', 'distance']
+
+class MenuSearchSerializer(SearchResultSerializer):
+    restaurant_name = serializers.CharField(source='restaurant.name', read_only=True)
+
+    class Meta:
+        model = Menu
+        fields = ['id', 'name', 'description', 'cost', 'image', 'image_variants', 'restaurant', 'restaurant_name', 'score', 'distance']
+
+class CategorySearchSerializer(SearchResultSerializer):
+    class Meta:
+        model = Category
+        fields = ['id', 'name', 'category_type', 'image', 'image_variants', 'score']
+
 class RegisterSerializer(serializers.ModelSerializer):
     email = serializers.EmailField(required=False, allow_blank=True)
     phone = serializers.CharField(required=False, allow_blank=True, max_length=15)
@@ -151,9 +285,11 @@ class LoginSerializer(serializers.Serializer):
         raise serializers.ValidationError("Incorrect username or password.")
     
 class UserProfileSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = UserProfile
-        fields = ['phone', 'image', 'address', 'city', 'address', 'city']
+        fields = ['phone', 'image', 'image_variants', 'address', 'city', 'address', 'city']
 
 class UserSerializer(serializers.ModelSerializer):
     profile = UserProfileSerializer()  # Nested serializer to include profile data
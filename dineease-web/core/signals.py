@@ -0,0 +1,187 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_init, post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+
+from .catalog import bump_collections
+from .documents import schedule_rebuild
+from .images import IMAGE_MODELS, schedule_derivatives
+from .menu_tree import invalidate_menu_trees
+from .revocation import revoke_user_tokens
+from .search import update_search_vectors
+from .models import Restaurant, Menu, AddonCategory, AddonOption, RestaurantImage, Promo, Category, UserProfile
+
+
+# Cached catalog collections (see core.catalog) each model is rendered in
+CATALOG_COLLECTIONS = {
+    Category: ('categories', 'restaurants', 'menus'),
+    Restaurant: ('restaurants',),
+    Menu: ('restaurants', 'menus'),
+    AddonCategory: ('restaurants', 'menus'),
+    AddonOption: ('restaurants', 'menus'),
+    RestaurantImage: ('restaurants', 'menus'),
+    Promo: ('restaurants', 'menus'),
+}
+
+
+def catalog_changed(sender, **kwargs):
+    bump_collections(CATALOG_COLLECTIONS[sender])
+
+
+for model in CATALOG_COLLECTIONS:
+    post_save.connect(catalog_changed, sender=model, dispatch_uid=f'catalog-save-{model.__name__}')
+    post_delete.connect(catalog_changed, sender=model, dispatch_uid=f'catalog-delete-{model.__name__}')
+
+
+def remember_image(sender, instance, **kwargs):
+    # The image file an instance was loaded with, read without loading a
+    # deferred field, so derivatives are only rendered for new uploads
+    image = instance.__dict__.get('image')
+    instance._saved_image = getattr(image, 'name', image) or ''
+
+
+def image_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    if instance.image and instance.image.name != instance._saved_image:
+        instance._saved_image = instance.image.name
+        schedule_derivatives(sender, instance.pk)
+
+
+for model in IMAGE_MODELS:
+    post_init.connect(remember_image, sender=model, dispatch_uid=f'image-init-{model.__name__}')
+    post_save.connect(image_saved, sender=model, dispatch_uid=f'image-save-{model.__name__}')
+
+
+# Fields the claims of a user's tokens come from, or that should end their
+# sessions, by model (see core.authentication)
+TOKEN_FIELDS = {
+    User: ('password', 'is_active', 'is_staff'),
+    UserProfile: ('type_of_user',),
+}
+
+
+def token_fields(sender, instance):
+    return [instance.__dict__.get(field) for field in TOKEN_FIELDS[sender]]
+
+
+def remember_token_fields(sender, instance, **kwargs):
+    instance._saved_token_fields = token_fields(sender, instance)
+
+
+def token_fields_saved(sender, instance, created, **kwargs):
+    fields = token_fields(sender, instance)
+    if not created and fields != instance._saved_token_fields:
+        revoke_user_tokens(instance.pk if sender is User else instance.user_id)
+    instance._saved_token_fields = fields
+
+
+for model in TOKEN_FIELDS:
+    post_init.connect(remember_token_fields, sender=model, dispatch_uid=f'token-fields-init-{model.__name__}')
+    post_save.connect(token_fields_saved, sender=model, dispatch_uid=f'token-fields-save-{model.__name__}')
+
+
+@receiver(post_init, sender=Promo)
+def remember_usage_limit(sender, instance, **kwargs):
+    instance._saved_usage_limit = instance.__dict__.get('usage_limit')
+
+
+@receiver(post_save, sender=Promo)
+def usage_limit_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Shard capacities are split from usage_limit, so a new limit is split again
+    if update_fields is not None and 'usage_limit' not in update_fields:
+        return
+    if not created and instance.usage_limit != instance._saved_usage_limit:
+        # The instance may have been read before the counter was sharded
+        shards = Promo.objects.filter(pk=instance.pk).values_list('usage_shards', flat=True).get()
+        if shards:
+            instance.shard_usage_counter(shards)
+    instance._saved_usage_limit = instance.usage_limit
+
+
+@receiver(pre_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    # The cutoff is kept after the user is gone, until their last token expires
+    revoke_user_tokens(instance.pk)
+
+
+@receiver(post_save, sender=Restaurant)
+@receiver(post_save, sender=Menu)
+@receiver(post_save, sender=Category)
+def search_document_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not {'name', 'description', 'city'} & set(update_fields):
+        return
+    update_search_vectors(sender, [instance.pk])
+
+
+def menu_restaurant_ids(**filters):
+    return Menu.objects.filter(**filters).values_list('restaurant_id', flat=True)
+
+
+@receiver(post_save, sender=Restaurant)
+def restaurant_saved(sender, instance, **kwargs):
+    schedule_rebuild([instance.pk])
+
+
+def menus_changed(restaurant_ids):
+    """Rebuild the documents and menu trees of the restaurants."""
+    restaurant_ids = set(restaurant_ids)
+    schedule_rebuild(restaurant_ids)
+    invalidate_menu_trees(restaurant_ids)
+
+
+@receiver(post_save, sender=Menu)
+@receiver(post_delete, sender=Menu)
+def menu_changed(sender, instance, **kwargs):
+    menus_changed([instance.restaurant_id])
+
+
+@receiver(post_save, sender=Menu)
+@receiver(pre_delete, sender=Menu)
+def addon_menu_item_changed(sender, instance, **kwargs):
+    # Menus offering this one as an addon option; pre_delete, before the
+    # options are set to null
+    menus_changed(menu_restaurant_ids(addon_categories__addon_options__menu_item=instance.pk))
+
+
+@receiver(post_save, sender=AddonCategory)
+@receiver(post_delete, sender=AddonCategory)
+def addon_category_changed(sender, instance, **kwargs):
+    menus_changed(menu_restaurant_ids(pk=instance.menu_id))
+
+
+@receiver(post_save, sender=AddonOption)
+@receiver(post_delete, sender=AddonOption)
+def addon_option_changed(sender, instance, **kwargs):
+    menus_changed(menu_restaurant_ids(addon_categories=instance.category_id))
+
+
+@receiver(post_save, sender=RestaurantImage)
+@receiver(post_delete, sender=RestaurantImage)
+@receiver(post_save, sender=Promo)
+@receiver(post_delete, sender=Promo)
+def restaurant_or_menu_child_changed(sender, instance, **kwargs):
+    restaurant_ids = [instance.restaurant_id]
+    if instance.menu_id:
+        restaurant_ids += menu_restaurant_ids(pk=instance.menu_id)
+    menus_changed(restaurant_ids)
+
+
+@receiver(post_save, sender=Category)
+@receiver(pre_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    # pre_delete, while the category is still linked to its restaurants
+    schedule_rebuild(instance.restaurants.values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=Restaurant.categories.through)
+def restaurant_categories_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action.startswith('post_'):
+        bump_collections(('restaurants',))
+    if not reverse:
+        if action.startswith('post_'):
+            schedule_rebuild([instance.pk])
+    elif action == 'pre_clear':
+        # post_clear carries no pk_set, so collect the restaurants while still linked
+        schedule_rebuild(instance.restaurants.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        schedule_rebuild(pk_set)
@@ -0,0 +1,59 @@
+"""
+Content-addressed media storage.
+
+Uploads are named after the SHA-256 of their content inside their
+``upload_to`` folder, e.g. ``restaurant_images/3f/3fa2…c9.png``. Identical
+uploads share one file, and since a name always holds the same bytes nginx
+serves them as immutable; a replaced image gets a new name instead of going
+stale in caches. Files no row refers to any more are removed by the
+collect_media_garbage command.
+"""
+import hashlib
+import os
+import re
+
+from django.core.files.storage import FileSystemStorage
+
+BLOB_NAME_RE = re.compile(r'(^|/)([0-9a-f]{2})/\2[0-9a-f]{62}(\.[a-z0-9]+)?$')
+
+
+def is_blob(name):
+    """Whether ``name`` was given by ContentAddressedStorage."""
+    return bool(BLOB_NAME_RE.search(name))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # A blob name is never suffixed: when a concurrent upload of the same
+        # content wins the race, _save() keeps its file
+        if is_blob(name) and self.exists(name):
+            raise FileExistsError(name)
+        return super().get_available_name(name, max_length)
+
+    def content_hash(self, content):
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        return digest.hexdigest()
+
+    def blob_name(self, name, content):
+        folder = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        digest = self.content_hash(content)
+        return os.path.join(folder, digest[:2], f'{digest}{extension}')
+
+    def _save(self, name, content):
+        name = self.blob_name(name, content)
+        if self.exists(name):
+            # Deduplicated; refreshed so garbage collection sees it as recently used
+            os.utime(self.path(name))
+            return name
+        try:
+            return super()._save(name, content)
+        except FileExistsError:
+            # The same content, saved by a concurrent upload
+            return name
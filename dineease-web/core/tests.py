@@ -1,3 +1,953 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.cache import cache
+from django.contrib.gis.geos import Point
+from django.db import connection
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from payments.models import PromoUsage
+from .constants import UNRANKED_PRIORITY
+from .hours import DAYS, MINUTES_PER_DAY, compile_weekly_hours, parse_day, parse_time
+from .images import generate_derivatives
+from .menu_tree import get_menu_tree, tree_version_key
+from .promos import redeemed_promo_ids
+from .authentication import PrincipalAuthentication
+from .revocation import BloomFilter, is_revoked, revoked_tokens
+from .storage import is_blob
+from .uploads import part_path
+from .management.commands.benchmark_promo_counter import hammer_promo
+from .scheduler import sync_live_promos
+from .serializers import CategorySerializer, MenuSerializer, PromoSerializer, RestaurantSerializer
+from .models import Restaurant, Menu, Promo, AddonCategory, AddonOption, Category, RestaurantImage, RestaurantDocument, UserProfile, ChunkedUpload, TokenCutoff
+
+
+# Promos default to weekday lunch windows, keep the fixtures independent of the clock
+ALL_WEEK = {day: 'Open 24 hours' for day in DAYS}
+
+
+def create_restaurant(owner, name, menus=2):
+    restaurant = Restaurant.objects.create(
+        name=name,
+        image='restaurant_images/test.webp',
+        location='123 Test Street',
+        coordinates=Point(-123.1207, 49.2827, srid=4326),
+        telephone='555-0100',
+        owner=owner,
+    )
+    restaurant.categories.add(Category.objects.create(name=f'{name} category', category_type='restaurant'))
+    RestaurantImage.objects.create(restaurant=restaurant, image='images/test.webp')
+    Promo.objects.create(restaurant=restaurant, name='Restaurant promo', description='', discount=Decimal('5.00'), time_offer=ALL_WEEK)
+
+    for index in range(menus):
+        menu = Menu.objects.create(restaurant=restaurant, name=f'{name} menu {index}', description='', cost=Decimal('20.00'))
+        RestaurantImage.objects.create(menu=menu, image='images/test.webp')
+        addon_category = AddonCategory.objects.create(menu=menu, name='Sides')
+        AddonOption.objects.create(category=addon_category, name='Fries', price=Decimal('3.00'))
+        Promo.objects.create(menu=menu, name='Low', description='', discount=Decimal('10.00'), priority_index=1, time_offer=ALL_WEEK)
+        Promo.objects.create(menu=menu, name='High', description='', discount=Decimal('5.00'), discount_type='fixed', priority_index=2, time_offer=ALL_WEEK)
+        Promo.objects.create(menu=menu, name='Off', description='', discount=Decimal('90.00'), priority_index=3, status='inactive', time_offer=ALL_WEEK)
+    return restaurant
+
+
+class DiscountedCostQueryTests(TestCase):
+    """Listing endpoints resolve every menu's promo without per-row queries."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('customer', password='password')
+        UserProfile.objects.create(user=cls.user, phone='555-0101', address='1 Main St', city='Vancouver')
+        cls.owner = User.objects.create_user('owner', password='password')
+        create_restaurant(cls.owner, 'First')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response
+
+    def assertConstantQueries(self, url):
+        # Warm the per-user caches (profile, redeemed promos) first
+        self.count_queries(url)
+        baseline, _ = self.count_queries(url)
+        for index in range(5):
+            create_restaurant(self.owner, f'Extra {index}', menus=4)
+        with self.assertNumQueries(baseline):
+            response = self.client.get(url)
+        return response
+
+    def test_restaurant_list(self):
+        response = self.assertConstantQueries('/api/restaurants/?expand=menus,promos')
+        menu = response.data['results'][0]['menus'][0]
+        # The highest priority active promo wins: $5 off $20.
+        self.assertEqual(menu['discounted_cost'], Decimal('15.00'))
+
+    def test_menu_list(self):
+        self.assertConstantQueries('/api/menus/')
+
+    def test_featured_restaurants(self):
+        self.assertConstantQueries('/api/featured-restaurants/?expand=menus,promos')
+
+    def test_featured_menus(self):
+        response = self.assertConstantQueries('/api/featured-menus/')
+        self.assertEqual(response.data['results'][0]['discounted_cost'], Decimal('15.00'))
+
+
+class SparseFieldsetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('customer', password='password')
+        UserProfile.objects.create(user=cls.user, phone='555-0101', address='1 Main St', city='Vancouver')
+        create_restaurant(User.objects.create_user('owner', password='password'), 'First')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_listing_leaves_out_menus_and_promos_by_default(self):
+        response = self.client.get('/api/restaurants/')
+        restaurant = response.data['results'][0]
+        self.assertNotIn('menus', restaurant)
+        self.assertNotIn('promos', restaurant)
+        self.assertIn('images', restaurant)
+
+    def test_fields_and_expand(self):
+        # Profile, redeemed promos, restaurants and the menu graph (menus,
+        # images, addon categories, addon options, winning promos); nothing
+        # for the rest.
+        with self.assertNumQueries(8):
+            response = self.client.get('/api/restaurants/?fields=name,menus&expand=menus')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name', 'menus'})
+
+    def test_detail_is_expanded(self):
+        restaurant = Restaurant.objects.get()
+        response = self.client.get(f'/api/restaurants/{restaurant.pk}/')
+        self.assertIn('menus', response.data)
+        self.assertIn('promos', response.data)
+
+
+class RestaurantDocumentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('customer', password='password')
+        UserProfile.objects.create(user=cls.user, phone='555-0101', address='1 Main St', city='Vancouver')
+        cls.owner = User.objects.create_user('owner', password='password')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_document_follows_catalog_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            restaurant = create_restaurant(self.owner, 'First')
+        document = RestaurantDocument.objects.get(restaurant=restaurant).document
+        self.assertEqual(len(document['menus']), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            restaurant.menus.first().delete()
+        document = RestaurantDocument.objects.get(restaurant=restaurant).document
+        self.assertEqual(len(document['menus']), 1)
+
+    def test_detail_served_from_document(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            restaurant = create_restaurant(self.owner, 'First')
+
+        # Profile, restaurant with its document and the redeemed promo ids.
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/restaurants/{restaurant.pk}/')
+        self.assertEqual(response.data['name'], 'First')
+        self.assertEqual(len(response.data['menus']), 2)
+        self.assertTrue(response.data['image'].startswith('http://testserver/media/'))
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('customer', password='password')
+        create_restaurant(User.objects.create_user('owner', password='password'), 'First')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertNotModified(self, url, serializer, **headers):
+        with mock.patch.object(serializer, 'to_representation') as to_representation:
+            with self.assertNumQueries(0):
+                response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 304)
+        to_representation.assert_not_called()
+
+    def test_if_none_match(self):
+        for url, serializer in [
+            ('/api/featured-restaurants/', RestaurantSerializer),
+            ('/api/restaurant-categories/', CategorySerializer),
+            ('/api/menu-cuisines/', CategorySerializer),
+        ]:
+            etag = self.client.get(url)['ETag']
+            self.assertNotModified(url, serializer, HTTP_IF_NONE_MATCH=etag)
+
+    def test_if_modified_since_is_not_trusted(self):
+        url = '/api/restaurant-categories/'
+        response = self.client.get(url)
+        # A change within the same second leaves Last-Modified as it was
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='New', category_type='restaurant')
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('New', [category['name'] for category in response.data])
+
+    def test_change_invalidates(self):
+        url = '/api/restaurant-categories/'
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='New', category_type='restaurant')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_query_string_is_part_of_the_etag(self):
+        etag = self.client.get('/api/featured-restaurants/')['ETag']
+        response = self.client.get('/api/featured-restaurants/?expand=menus', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class RedeemedPromoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('customer', password='password')
+        UserProfile.objects.create(user=cls.user, phone='555-0101', address='1 Main St', city='Vancouver')
+        cls.restaurant = create_restaurant(User.objects.create_user('owner', password='password'), 'First')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_redeemed_promo_hidden_after_approval(self):
+        promo = self.restaurant.promos.get()
+        url = '/api/restaurants/?expand=promos'
+        self.assertEqual(len(self.client.get(url).data['results'][0]['promos']), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PromoUsage.objects.create(promo=promo, customer=self.user, status='approved')
+
+        self.assertEqual(self.client.get(url).data['results'][0]['promos'], [])
+        promo_ids = [row['id'] for row in self.client.get('/api/promos/').data['results']]
+        self.assertNotIn(promo.pk, promo_ids)
+
+    def test_approval_while_a_miss_reads_the_table(self):
+        promo = self.restaurant.promos.get()
+        filter = PromoUsage.objects.filter
+
+        def read_then_approve(*args, **kwargs):
+            promo_ids = list(filter(*args, **kwargs).values_list('promo_id', flat=True))
+            # Approved, and the cache invalidated, before the miss stores what it read
+            with self.captureOnCommitCallbacks(execute=True):
+                PromoUsage.objects.create(promo=promo, customer=self.user, status='approved')
+            return mock.Mock(values_list=lambda *args, **kwargs: promo_ids)
+
+        with mock.patch.object(PromoUsage.objects, 'filter', read_then_approve):
+            self.assertEqual(redeemed_promo_ids(self.user), frozenset())
+        self.assertEqual(redeemed_promo_ids(self.user), {promo.pk})
+
+
+@override_settings(RESTAURANT_TIME_ZONE='America/Vancouver')
+class PromoWindowTests(TestCase):
+    # Monday 2026-10-19, 10:00 and 16:00 in Vancouver
+    MONDAY_MORNING = datetime.fromisoformat('2026-10-19T10:00:00-07:00')
+    MONDAY_EVENING = datetime.fromisoformat('2026-10-19T16:00:00-07:00')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = create_restaurant(User.objects.create_user('owner', password='password'), 'First', menus=0)
+        cls.promo = Promo.objects.create(
+            restaurant=cls.restaurant, name='Lunch', description='', discount=Decimal('10.00'),
+            time_offer={'Monday': '9:00AM – 3:00PM', 'Tuesday': 'Closed'},
+        )
+
+    def test_window(self):
+        self.assertTrue(self.promo.live_at(self.MONDAY_MORNING))
+        self.assertFalse(self.promo.live_at(self.MONDAY_EVENING))
+
+        self.promo.start_date = date(2026, 10, 20)
+        self.assertFalse(self.promo.live_at(self.MONDAY_MORNING))
+
+    def test_scheduler_flips_at_boundaries(self):
+        Promo.objects.filter(pk=self.promo.pk).update(is_live=False)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            flipped, next_change = sync_live_promos(self.MONDAY_MORNING)
+        self.assertEqual(flipped, 1)
+        self.assertEqual(next_change, datetime.fromisoformat('2026-10-19T15:00:00-07:00'))
+        self.promo.refresh_from_db()
+        self.assertTrue(self.promo.is_live)
+        self.assertTrue(RestaurantDocument.objects.filter(restaurant=self.restaurant).exists())
+
+        flipped, _ = sync_live_promos(next_change)
+        self.assertEqual(flipped, 1)
+        self.promo.refresh_from_db()
+        self.assertFalse(self.promo.is_live)
+
+    def test_scheduler_flips_unattached_promos(self):
+        Promo.objects.filter(pk=self.promo.pk).delete()
+        unattached = Promo.objects.create(name='Unattached', description='', discount=Decimal('10.00'), time_offer=ALL_WEEK)
+        Promo.objects.filter(pk=unattached.pk).update(is_live=False)
+
+        flipped, _ = sync_live_promos(self.MONDAY_MORNING)
+        self.assertEqual(flipped, 1)
+        unattached.refresh_from_db()
+        self.assertTrue(unattached.is_live)
+
+
+class PriorityPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('customer', password='password')
+        UserProfile.objects.create(user=cls.user, phone='555-0101', address='1 Main St', city='Vancouver')
+        owner = User.objects.create_user('owner', password='password')
+        # Ties and unranked rows straddle page boundaries at every page size below
+        for index, priority in enumerate((None, 3, None, 1, 3, None, 2, 3, None, 1, None)):
+            restaurant = create_restaurant(owner, f'Restaurant {index}', menus=0)
+            Restaurant.objects.filter(pk=restaurant.pk).update(priority_index=priority)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url, page_size):
+        pks = []
+        response = self.client.get(url, {'fields': 'id', 'page_size': page_size})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), page_size)
+            pks += [row['id'] for row in response.data['results']]
+            if response.data['next'] is None:
+                return pks
+            response = self.client.get(response.data['next'])
+
+    def test_pages_follow_one_ordering_of_the_whole_list(self):
+        expected = list(
+            Restaurant.objects.order_by(Coalesce('priority_index', Value(UNRANKED_PRIORITY)), 'id').values_list('pk', flat=True)
+        )
+        # Unranked restaurants last
+        self.assertEqual(set(expected[-5:]), set(Restaurant.objects.filter(priority_index__isnull=True).values_list('pk', flat=True)))
+        for page_size in (1, 2, 3, 4, 100):
+            with self.subTest(page_size=page_size):
+                self.assertEqual(self.walk('/api/restaurants/', page_size), expected)
+
+    def test_bad_cursor(self):
+        response = self.client.get('/api/restaurants/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+
+class NearbyTests(TestCase):
+    ORIGIN = {'lat': 49.2827, 'lng': -123.1207}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('customer', password='password')
+        UserProfile.objects.create(user=cls.user, phone='555-0101', address='1 Main St', city='Vancouver')
+        owner = User.objects.create_user('owner', password='password')
+        # Degrees of longitude east of the origin, about 72.7 m each thousandth
+        for name, east in (
+            ('Far', 0.05), ('Next door', 0.002), ('Twin 1', 0.01), ('Twin 2', 0.01),
+            ('Across town', 0.03), ('Out of range', 0.2),
+        ):
+            restaurant = create_restaurant(owner, name, menus=0)
+            Restaurant.objects.filter(pk=restaurant.pk).update(
+                coordinates=Point(cls.ORIGIN['lng'] + east, cls.ORIGIN['lat'], srid=4326),
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def nearby(self, **params):
+        response = self.client.get('/api/restaurants/nearby/', {**self.ORIGIN, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_nearest_first_within_the_radius(self):
+        results = self.nearby(radius=5000)['results']
+        # Equally distant restaurants come in id order
+        self.assertEqual(
+            [row['name'] for row in results],
+            ['Next door', 'Twin 1', 'Twin 2', 'Across town', 'Far'],
+        )
+        distances = [row['distance'] for row in results]
+        self.assertEqual(distances, sorted(distances))
+        self.assertAlmostEqual(distances[0], 145, delta=5)
+
+        self.assertEqual([row['name'] for row in self.nearby(radius=1000)['results']], ['Next door', 'Twin 1', 'Twin 2'])
+        self.assertEqual(len(self.nearby()['results']), 5)  # DEFAULT_RADIUS
+
+    def test_cursor_pages_continue_where_the_last_ended(self):
+        names = []
+        page = self.nearby(radius=5000, page_size=2)
+        while True:
+            self.assertLessEqual(len(page['results']), 2)
+            names += [row['name'] for row in page['results']]
+            if page['next'] is None:
+                break
+            page = self.client.get(page['next']).data
+        self.assertEqual(names, ['Next door', 'Twin 1', 'Twin 2', 'Across town', 'Far'])
+
+    def test_bad_parameters(self):
+        for params in (
+            {'lat': 'north', 'lng': -123.1207}, {'lat': 49.2827}, {'lat': 95, 'lng': -123.1207},
+            {**self.ORIGIN, 'radius': -1}, {**self.ORIGIN, 'radius': 'far'},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get('/api/restaurants/nearby/', params).status_code, 400)
+        response = self.client.get('/api/restaurants/nearby/', {**self.ORIGIN, 'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+
+class WeeklyHoursTests(SimpleTestCase):
+    SUNDAY = 6 * MINUTES_PER_DAY
+
+    def test_parse_time(self):
+        self.assertEqual(parse_time('9:00AM'), 9 * 60)
+        self.assertEqual(parse_time(' 9 a.m. '), 9 * 60)
+        self.assertEqual(parse_time('12:30PM'), 12 * 60 + 30)
+        self.assertEqual(parse_time('12AM'), 0)
+        self.assertEqual(parse_time('21:00'), 21 * 60)
+        self.assertEqual(parse_time('noon'), 12 * 60)
+        for text in ('13PM', '9:75AM', '25:00', 'soon', ''):
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                parse_time(text)
+
+    def test_parse_day(self):
+        self.assertEqual(parse_day('9:00AM – 3:00PM'), [(9 * 60, 15 * 60)])
+        self.assertEqual(parse_day('9:00AM—3:00PM'), [(9 * 60, 15 * 60)])
+        self.assertEqual(parse_day('11AM-2PM, 5PM to 10PM'), [(11 * 60, 14 * 60), (17 * 60, 22 * 60)])
+        self.assertEqual(parse_day('Open 24 hours'), [(0, MINUTES_PER_DAY)])
+        for closed in ('Closed', 'closed', '', None):
+            self.assertEqual(parse_day(closed), [])
+        # Past midnight, into the next day
+        self.assertEqual(parse_day('10PM – 2AM'), [(22 * 60, MINUTES_PER_DAY + 2 * 60)])
+        for text in ('9AM', '9AM – 3PM – 5PM', '9AM – later', 'Weekdays only'):
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                parse_day(text)
+
+    def test_compile_weekly_hours(self):
+        hours = {'Monday': '9:00AM – 3:00PM', 'Tuesday': 'Closed', 'Sunday': '10PM – 2AM'}
+        # Sunday night wraps around to Monday morning
+        self.assertEqual(
+            compile_weekly_hours(hours),
+            [(0, 2 * 60), (9 * 60, 15 * 60), (self.SUNDAY + 22 * 60, 7 * MINUTES_PER_DAY)],
+        )
+        self.assertEqual(compile_weekly_hours({'Monday': 'Open 24 hours', 'Tuesday': '12AM – 6AM'}), [(0, MINUTES_PER_DAY + 6 * 60)])
+        self.assertEqual(compile_weekly_hours(None), [])
+
+    def test_malformed_days(self):
+        hours = {'Monday': 'whenever', 'Tuesday': '9AM – 5PM'}
+        with self.assertRaises(ValueError):
+            compile_weekly_hours(hours)
+        tuesday = MINUTES_PER_DAY
+        self.assertEqual(compile_weekly_hours(hours, strict=False), [(tuesday + 9 * 60, tuesday + 17 * 60)])
+
+
+@override_settings(RESTAURANT_TIME_ZONE='America/Vancouver')
+class OpenAtFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('customer', password='password')
+        UserProfile.objects.create(user=cls.user, phone='555-0101', address='1 Main St', city='Vancouver')
+        owner = User.objects.create_user('owner', password='password')
+        create_restaurant(owner, 'Lunch', menus=0)  # The default weekday 9:00AM – 3:00PM
+        late = create_restaurant(owner, 'Late', menus=0)
+        late.operating_hours = {'Friday': '6PM – 11PM', 'Sunday': '10PM – 2AM'}
+        late.save()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def names(self, **params):
+        response = self.client.get('/api/restaurants/', params)
+        self.assertEqual(response.status_code, 200)
+        return sorted(row['name'] for row in response.data['results'])
+
+    def test_open_at(self):
+        self.assertEqual(self.names(open_at='2026-10-19T10:00:00-07:00'), ['Lunch'])
+        # Naive datetimes are local; Sunday night's hours run into Monday
+        self.assertEqual(self.names(open_at='2026-10-18T23:00:00'), ['Late'])
+        self.assertEqual(self.names(open_at='2026-10-19T01:30:00'), ['Late'])
+        self.assertEqual(self.names(open_at='2026-10-19T02:00:00'), [])
+        self.assertEqual(self.names(open_at='2026-10-19T10:00:00Z'), [])  # 03:00 in Vancouver
+        self.assertEqual(self.names(), ['Late', 'Lunch'])
+        self.assertEqual(self.client.get('/api/restaurants/', {'open_at': 'tonight'}).status_code, 400)
+
+    def test_open_now(self):
+        friday_evening = datetime.fromisoformat('2026-10-23T19:00:00-07:00')
+        with mock.patch('django.utils.timezone.now', return_value=friday_evening):
+            self.assertEqual(self.names(open_now='true'), ['Late'])
+            self.assertEqual(self.names(open_now='false'), ['Late', 'Lunch'])
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('customer', password='password')
+        owner = User.objects.create_user('owner', password='password')
+        cls.restaurant = create_restaurant(owner, 'Shawarma Palace', menus=1)
+        create_restaurant(owner, 'Sushi Bar', menus=1)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_misspelled_name_matches(self):
+        response = self.client.get('/api/search/?q=shwarma')
+        self.assertEqual([row['id'] for row in response.data['restaurants']], [self.restaurant.pk])
+
+    def test_search_vector_follows_renames(self):
+        self.restaurant.name = 'Falafel Corner'
+        self.restaurant.save()
+        response = self.client.get('/api/search/?q=falafel&lat=49.28&lng=-123.12')
+        self.assertEqual(response.data['restaurants'][0]['id'], self.restaurant.pk)
+        self.assertIsNotNone(response.data['restaurants'][0]['distance'])
+
+
+class CategoryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('customer', password='password')
+        owner = User.objects.create_user('owner', password='password')
+        cls.pizza = Category.objects.create(name='Pizza', category_type='restaurant')
+        for name, city in [('First', 'Vancouver'), ('Second', 'Vancouver'), ('Third', 'Victoria')]:
+            restaurant = create_restaurant(owner, name, menus=0)
+            restaurant.city = city
+            restaurant.save()
+            restaurant.categories.add(cls.pizza)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def counts(self, url):
+        return {row['id']: row['count'] for row in self.client.get(url).data}
+
+    def test_counts_by_scope(self):
+        self.assertEqual(self.counts('/api/restaurant-categories/?counts=true')[self.pizza.pk], 3)
+        self.assertEqual(self.counts('/api/restaurant-categories/?counts=true&city=vancouver')[self.pizza.pk], 2)
+
+    def test_counts_are_one_cached_query(self):
+        # Warms the collection versions
+        self.client.get('/api/restaurant-categories/?counts=true&city=Vancouver')
+        url = '/api/restaurant-categories/?counts=true&city=Victoria'
+        # The categories and one grouped count
+        with self.assertNumQueries(2):
+            self.client.get(url)
+        # The counts of this scope are cached now
+        with self.assertNumQueries(1):
+            self.client.get(url)
+
+    def test_change_invalidates_counts(self):
+        url = '/api/restaurant-categories/?counts=true'
+        self.counts(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pizza.restaurants.first().categories.remove(self.pizza)
+        self.assertEqual(self.counts(url)[self.pizza.pk], 2)
+
+
+class MenuTreeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('customer', password='password')
+        cls.restaurant = create_restaurant(User.objects.create_user('owner', password='password'), 'First')
+        # Offer one menu as an addon of the other
+        first, second = cls.restaurant.menus.order_by('pk')
+        AddonOption.objects.create(category=first.addon_categories.get(), menu_item=second, price=Decimal('4.00'))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_tree_is_built_in_fixed_queries_and_cached(self):
+        url = f'/api/menus/tree/?restaurant={self.restaurant.pk}'
+        # Menus, images, addon categories, options, addon menu items, promos
+        with self.assertNumQueries(6):
+            response = self.client.get(url)
+        options = response.data['menus'][0]['addon_categories'][0]['addon_options']
+        self.assertEqual([option['menu_item'] and option['menu_item']['name'] for option in options], [None, 'First menu 1'])
+
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+    def test_change_invalidates_tree(self):
+        url = f'/api/menus/tree/?restaurant={self.restaurant.pk}'
+        self.client.get(url)
+        option = AddonOption.objects.get(category__menu__name='First menu 0', menu_item__isnull=True)
+        option.price = Decimal('9.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            option.save()
+        menu = self.client.get(url).data['menus'][0]
+        prices = [option['price'] for option in menu['addon_categories'][0]['addon_options']]
+        self.assertIn('9.00', prices)
+
+    def test_trees_of_missing_restaurants_are_not_cached(self):
+        missing = Restaurant.objects.order_by('pk').last().pk + 1
+        self.assertEqual(get_menu_tree(missing), {'restaurant': missing, 'menus': []})
+        self.assertIsNone(cache.get(tree_version_key(missing)))
+
+        # Restaurants without menus yet are cached as usual
+        empty = create_restaurant(self.user, 'Empty', menus=0)
+        get_menu_tree(empty.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_menu_tree(empty.pk)['menus'], [])
+
+
+class PromoCounterConcurrencyTests(TransactionTestCase):
+    """Redemptions from many connections never overshoot usage_limit."""
+
+    def setUp(self):
+        restaurant = create_restaurant(User.objects.create_user('owner', password='password'), 'First', menus=0)
+        self.promo = Promo.objects.create(
+            restaurant=restaurant, name='Flash', description='', discount=Decimal('10.00'),
+            usage_limit=25, time_offer=ALL_WEEK,
+        )
+
+    def assertLimitHolds(self):
+        claimed, _ = hammer_promo(self.promo.pk, threads=8, attempts=10)
+        self.assertEqual(claimed, 25)
+        self.assertEqual(Promo.objects.get(pk=self.promo.pk).total_usage(), 25)
+
+    def test_row_counter(self):
+        self.assertLimitHolds()
+
+    def test_sharded_counter(self):
+        self.promo.shard_usage_counter(4)
+        self.assertLimitHolds()
+
+    def test_new_limit_is_split_between_the_shards(self):
+        self.promo.shard_usage_counter(4)
+        self.assertTrue(self.promo.increment_usage())
+
+        promo = Promo.objects.get(pk=self.promo.pk)
+        promo.usage_limit = 40
+        promo.save()
+        self.assertEqual(sorted(promo.usage_counters.values_list('capacity', flat=True)), [9, 10, 10, 10])
+
+        claimed, _ = hammer_promo(self.promo.pk, threads=8, attempts=10)
+        self.assertEqual(claimed, 39)
+        self.assertEqual(Promo.objects.get(pk=self.promo.pk).total_usage(), 40)
+
+    def test_api_save_keeps_concurrent_uses(self):
+        update = PromoSerializer.update
+
+        def redeem_then_update(serializer, instance, validated_data):
+            # A redemption lands after the view read the promo and before it saves it
+            self.assertTrue(Promo.objects.get(pk=self.promo.pk).increment_usage())
+            return update(serializer, instance, validated_data)
+
+        client = APIClient()
+        client.force_authenticate(self.promo.restaurant.owner)
+        with mock.patch.object(PromoSerializer, 'update', redeem_then_update):
+            response = client.patch(f'/api/promos/{self.promo.pk}/', {'name': 'Renamed'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        promo = Promo.objects.get(pk=self.promo.pk)
+        self.assertEqual(promo.name, 'Renamed')
+        self.assertEqual(promo.usage_count, 1)
+
+
+def jpeg(width, height):
+    output = io.BytesIO()
+    Image.new('RGB', (width, height), 'orange').save(output, 'JPEG')
+    return ContentFile(output.getvalue())
+
+
+class TemporaryMediaMixin:
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        settings = override_settings(MEDIA_ROOT=self.media, CHUNKED_UPLOAD_ROOT=os.path.join(self.media, '.uploads'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+
+class ImageDerivativeTests(TemporaryMediaMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = create_restaurant(User.objects.create_user('owner', password='password'), 'First', menus=1)
+
+    def setUp(self):
+        super().setUp()
+        self.menu = self.restaurant.menus.get()
+        self.menu.image.save('soup.jpg', jpeg(1200, 800))
+
+    def test_widths_up_to_the_original_in_both_formats(self):
+        self.assertTrue(generate_derivatives(Menu, self.menu.pk))
+        self.menu.refresh_from_db()
+
+        variants = MenuSerializer(self.menu).data['image_variants']
+        self.assertEqual((variants['width'], variants['height']), (1200, 800))
+        self.assertEqual(list(variants['webp']), ['160', '320', '640', '1024'])
+        self.assertTrue(variants['jpeg']['320'].endswith('.jpeg'))
+        self.assertTrue(variants['placeholder'].startswith('data:image/webp;base64,'))
+        with default_storage.open(self.menu.image_variants['webp']['640']) as derivative:
+            self.assertEqual(Image.open(derivative).size, (640, 427))
+
+        # Already rendered for this image
+        self.assertFalse(generate_derivatives(Menu, self.menu.pk))
+
+    def test_replaced_image_hides_the_old_derivatives(self):
+        generate_derivatives(Menu, self.menu.pk)
+        self.menu.refresh_from_db()
+        self.menu.image.save('salad.jpg', jpeg(100, 100))
+        self.assertIsNone(MenuSerializer(self.menu).data['image_variants'])
+
+    def test_backfill_renders_what_is_missing(self):
+        call_command('generate_image_derivatives', workers=0, stdout=io.StringIO())
+        self.menu.refresh_from_db()
+        self.assertEqual(self.menu.image_variants['name'], self.menu.image.name)
+        # The fixtures' other images have no file, and are skipped
+        self.assertEqual(self.restaurant.images.first().image_variants, {})
+
+    def test_decompression_bombs_are_skipped(self):
+        # 1200x800 is over twice this many pixels
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 400000), self.assertLogs('core.images', 'WARNING'):
+            call_command('generate_image_derivatives', workers=0, stdout=io.StringIO())
+        self.menu.refresh_from_db()
+        self.assertEqual(self.menu.image_variants, {})
+
+
+class ContentAddressedStorageTests(TemporaryMediaMixin, TestCase):
+    def test_identical_uploads_share_one_blob(self):
+        first = default_storage.save('restaurant_images/logo.png', ContentFile(b'logo'))
+        second = default_storage.save('restaurant_images/branch-logo.PNG', ContentFile(b'logo'))
+        other = default_storage.save('restaurant_images/logo.png', ContentFile(b'new logo'))
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertTrue(is_blob(first))
+        self.assertRegex(first, r'^restaurant_images/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+        self.assertEqual(len(os.listdir(os.path.dirname(default_storage.path(first)))), 1)
+
+    def test_garbage_collection_keeps_referenced_files(self):
+        restaurant = create_restaurant(User.objects.create_user('owner', password='password'), 'First', menus=1)
+        menu = restaurant.menus.get()
+        menu.image.save('soup.jpg', jpeg(200, 100))
+        generate_derivatives(Menu, menu.pk)
+        menu.refresh_from_db()
+        orphan = default_storage.save('menu_images/old.jpg', ContentFile(b'replaced'))
+        legacy = default_storage.path('menu_images/legacy.jpg')
+        with open(legacy, 'wb') as file:
+            file.write(b'uploaded before content addressing')
+
+        call_command('collect_media_garbage', min_age=0, stdout=io.StringIO())
+        self.assertFalse(default_storage.exists(orphan))
+        self.assertTrue(default_storage.exists(menu.image.name))
+        self.assertTrue(all(default_storage.exists(name) for name in menu.image_variants['webp'].values()))
+        self.assertTrue(os.path.exists(legacy))
+
+
+class ChunkedUploadTests(TemporaryMediaMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='password')
+        cls.restaurant = create_restaurant(cls.owner, 'First', menus=0)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        self.photo = jpeg(400, 300).read()
+
+    def start(self, size, **data):
+        response = self.client.post('/api/uploads/', {'restaurant': self.restaurant.pk, 'filename': 'Patio.JPG', 'size': size, **data}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return f"/api/uploads/{response.data['id']}/"
+
+    def send(self, url, chunk, offset):
+        return self.client.patch(url, chunk, content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_chunks_resume_from_the_recorded_offset(self):
+        url = self.start(len(self.photo), caption='Patio')
+        middle = len(self.photo) // 2
+
+        self.assertEqual(self.send(url, self.photo[:middle], 0).data['offset'], middle)
+        # A retried chunk is refused with the offset to resume from
+        response = self.send(url, self.photo[:middle], 0)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Upload-Offset'], str(middle))
+        self.assertEqual(self.client.get(url).data['offset'], middle)
+
+        response = self.send(url, self.photo[middle:], middle)
+        self.assertEqual(response.status_code, 200)
+        image = RestaurantImage.objects.get(pk=response.data['image']['id'])
+        self.assertEqual((image.restaurant, image.caption), (self.restaurant, 'Patio'))
+        self.assertTrue(is_blob(image.image.name))
+        self.assertTrue(image.image.name.endswith('.jpg'))
+        with image.image.open() as file:
+            self.assertEqual(file.read(), self.photo)
+        self.assertFalse(os.path.exists(part_path(ChunkedUpload.objects.get())))
+
+    def test_files_that_are_not_images_are_refused(self):
+        url = self.start(8)
+        response = self.send(url, b'not jpeg', 0)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ChunkedUpload.objects.exists())
+
+    def test_decompression_bombs_are_refused(self):
+        url = self.start(len(self.photo))
+        # 400x300 is over twice this many pixels
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 50000):
+            response = self.send(url, self.photo, 0)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ChunkedUpload.objects.exists())
+
+    def test_uploads_are_limited_to_own_restaurants(self):
+        other = User.objects.create_user('other', password='password')
+        url = self.start(len(self.photo))
+        self.assertEqual(self.send(url, self.photo[:10], 0).status_code, 200)
+        self.client.force_authenticate(other)
+        self.assertEqual(self.send(url, self.photo[10:], 10).status_code, 404)
+        response = self.client.post('/api/uploads/', {'restaurant': self.restaurant.pk, 'filename': 'a.jpg', 'size': 10}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class PrincipalAuthenticationTests(TestCase):
+    """Requests are authenticated from the token's claims, without loading the user."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', email='owner@example.com', password='password')
+        UserProfile.objects.create(user=cls.owner, phone='555-0101', address='1 Main St', city='Vancouver', type_of_user='restaurant_owner')
+        create_restaurant(cls.owner, 'First')
+        create_restaurant(User.objects.create_user('other', password='password'), 'Second')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        response = self.client.post('/api/login/', {'identifier': 'owner@example.com', 'password': 'password'}, format='json')
+        self.tokens = response.data
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.tokens['access']}")
+        revoked_tokens.rebuild()
+
+    def test_no_queries_to_authenticate(self):
+        request = APIRequestFactory().get('/api/restaurants/', HTTP_AUTHORIZATION=f"Bearer {self.tokens['access']}")
+        with self.assertNumQueries(0):
+            principal, _ = PrincipalAuthentication().authenticate(request)
+            self.assertEqual((principal.pk, principal.is_staff), (self.owner.pk, False))
+            self.assertEqual(principal.profile.type_of_user, 'restaurant_owner')
+
+    def test_listings_do_not_load_the_user(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/restaurants/')
+        self.assertEqual([restaurant['name'] for restaurant in response.data['results']], ['First'])
+        tables = ('"auth_user"', '"core_userprofile"')
+        self.assertEqual([query['sql'] for query in context.captured_queries if any(table in query['sql'] for table in tables)], [])
+
+    def test_logout_revokes_the_tokens(self):
+        response = self.client.post('/api/token/logout/', {'refresh': self.tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/api/me/').status_code, 401)
+        self.client.credentials()
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': self.tokens['refresh']}, format='json').status_code, 401)
+
+    def test_password_change_revokes_earlier_tokens(self):
+        self.assertEqual(self.client.get('/api/me/').data['username'], 'owner')
+        self.owner.set_password('new password')
+        self.owner.save()
+        self.assertEqual(self.client.get('/api/me/').status_code, 401)
+        self.client.credentials()
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': self.tokens['refresh']}, format='json').status_code, 401)
+
+    def test_only_refresh_tokens_are_recorded(self):
+        rotated = self.client.post('/api/token/refresh/', {'refresh': self.tokens['refresh']}, format='json').data
+        recorded = set(OutstandingToken.objects.values_list('jti', flat=True))
+        self.assertEqual(recorded, {RefreshToken(token, verify=False)['jti'] for token in (self.tokens['refresh'], rotated['refresh'])})
+        self.assertNotIn(AccessToken(rotated['access'])['jti'], recorded)
+
+
+class RevokedTokenTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('customer', password='password')
+
+    def blacklist(self, expires_in):
+        token = AccessToken.for_user(self.user)
+        outstanding = OutstandingToken.objects.create(
+            user=self.user, jti=token['jti'], token=str(token), expires_at=timezone.now() + expires_in,
+        )
+        BlacklistedToken.objects.create(token=outstanding)
+        return token
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        keys = [f'jti-{index}' for index in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+        false_positives = sum(f'other-{index}' in bloom for index in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_filter_picks_up_tokens_revoked_elsewhere(self):
+        revoked_tokens.rebuild()
+        token = AccessToken.for_user(self.user)
+        with self.assertNumQueries(0):
+            self.assertFalse(is_revoked(token))
+
+        # Blacklisted by another process: seen at the next top-up
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.create(
+            user=self.user, jti=token['jti'], token=str(token), expires_at=timezone.now() + timedelta(minutes=5),
+        ))
+        with override_settings(TOKEN_REVOCATION_REFRESH_SECONDS=0):
+            self.assertTrue(is_revoked(token))
+
+    def test_filter_picks_up_users_cut_off_elsewhere(self):
+        revoked_tokens.rebuild()
+        token = AccessToken.for_user(self.user)
+        TokenCutoff.objects.create(user_id=self.user.pk, revoked_at=timezone.now(), expires_at=timezone.now() + timedelta(days=1))
+        with override_settings(TOKEN_REVOCATION_REFRESH_SECONDS=0):
+            self.assertTrue(is_revoked(token))
+        # Tokens issued after the cutoff are not revoked by it
+        later = AccessToken.for_user(self.user)
+        later.set_iat(at_time=timezone.now() + timedelta(seconds=1))
+        self.assertFalse(is_revoked(later))
+
+    def test_prune_deletes_expired_tokens_in_batches(self):
+        self.blacklist(timedelta(minutes=-5))
+        self.blacklist(timedelta(minutes=-1))
+        kept = self.blacklist(timedelta(minutes=5))
+        OutstandingToken.objects.create(user=self.user, jti='expired', token='', expires_at=timezone.now() - timedelta(minutes=1))
+        TokenCutoff.objects.create(user_id=self.user.pk, revoked_at=timezone.now(), expires_at=timezone.now() - timedelta(minutes=1))
+        TokenCutoff.objects.create(user_id=0, revoked_at=timezone.now(), expires_at=timezone.now() + timedelta(minutes=5))
+
+        call_command('prune_tokens', batch_size=1, stdout=io.StringIO())
+        self.assertEqual(list(TokenCutoff.objects.values_list('user_id', flat=True)), [0])
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), [kept['jti']])
+        self.assertEqual(BlacklistedToken.objects.get().token.jti, kept['jti'])
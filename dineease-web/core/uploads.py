@@ -0,0 +1,100 @@
+"""
+Resumable uploads of large restaurant and menu photos.
+
+A client creates an upload with the file's name and size, then sends its bytes
+in order as PATCH requests carrying ``Upload-Offset``, much like the tus
+protocol; after an interruption it asks for the offset and carries on from
+there. Each chunk is copied from the request stream onto the end of a part
+file a block at a time (Django already spools bodies larger than
+FILE_UPLOAD_MAX_MEMORY_SIZE to disk), so a worker holds a few blocks per
+upload however large the photo. The finished part file is moved, not copied,
+into media storage and attached to a new RestaurantImage.
+"""
+import os
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from PIL import Image
+
+from .models import RestaurantImage
+
+BLOCK_SIZE = 64 * 1024
+
+
+class PartFileLost(Exception):
+    """The part file holds fewer bytes than were recorded, e.g. after a volume was replaced."""
+
+
+class PartFile(File):
+    """A finished part file, which storage moves into place (see FileSystemStorage._save)."""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def part_path(upload):
+    return os.path.join(settings.CHUNKED_UPLOAD_ROOT, f'{upload.pk}.part')
+
+
+def append_chunk(upload, stream, length):
+    """
+    Write up to ``length`` bytes read from ``stream`` at the upload's offset,
+    returning how many were written. Bytes past the offset, left by a chunk
+    that was interrupted before it was recorded, are overwritten.
+    """
+    os.makedirs(settings.CHUNKED_UPLOAD_ROOT, exist_ok=True)
+    written = 0
+    with open(part_path(upload), 'ab') as part:
+        if part.tell() < upload.offset:
+            raise PartFileLost(upload.pk)
+        part.truncate(upload.offset)
+        while written < length:
+            block = stream.read(min(BLOCK_SIZE, length - written))
+            if not block:
+                break
+            part.write(block)
+            written += len(block)
+        part.flush()
+        # The offset is only recorded once the bytes it covers are on disk
+        os.fsync(part.fileno())
+    return written
+
+
+def is_image(path):
+    try:
+        with Image.open(path) as image:
+            image.verify()
+    # Images over twice Image.MAX_IMAGE_PIXELS are refused as decompression bombs
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        return False
+    return True
+
+
+def complete_upload(upload):
+    """
+    Attach a fully received upload to a new RestaurantImage and return it, or
+    None when the file is not an image. Either way the part file is removed.
+    """
+    path = part_path(upload)
+    try:
+        if not is_image(path):
+            return None
+        image = RestaurantImage(restaurant_id=upload.restaurant_id, menu_id=upload.menu_id, caption=upload.caption)
+        with transaction.atomic():
+            with open(path, 'rb') as part:
+                image.image.save(upload.filename, PartFile(part), save=False)
+            image.save()
+            upload.image = image
+            upload.save(update_fields=['image', 'updated_at'])
+        return image
+    finally:
+        # Still there when storage already had the same content
+        discard_part(upload)
+
+
+def discard_part(upload):
+    try:
+        os.remove(part_path(upload))
+    except FileNotFoundError:
+        pass
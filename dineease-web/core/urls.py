@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import RestaurantViewSet, PromoViewSet, MenuViewSet, FeaturedMenuListView, FeaturedRestaurantListView, RestaurantCategoryList, MenuCategoryList, RegisterView, LoginView, LogoutView, UserDetailView
+from .views import RestaurantViewSet, PromoViewSet, MenuViewSet, FeaturedMenuListView, FeaturedRestaurantListView, RestaurantCategoryList, MenuCategoryList, SearchView, RegisterView, LoginView, LogoutView, UserDetailView, ChunkedUploadView, ChunkedUploadDetailView
 from django.urls import path
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
@@ -19,6 +19,9 @@ urlpatterns = [
     path('featured-menus/', FeaturedMenuListView.as_view(), name='featured-menus'),
     path('restaurant-categories/', RestaurantCategoryList.as_view(), name='restaurant-category-list'),
     path('menu-cuisines/', MenuCategoryList.as_view(), name='menu-category-list'),
+    path('search/', SearchView.as_view(), name='search'),
+    path('uploads/', ChunkedUploadView.as_view(), name='chunked-upload'),
+    path('uploads/<uuid:pk>/', ChunkedUploadDetailView.as_view(), name='chunked-upload-detail'),
     path('register/', RegisterView.as_view(), name='register'),
     path('login/', LoginView.as_view(), name='login'),
     path('token/logout/', LogoutView.as_view(), name='logout'),
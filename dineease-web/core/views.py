@@ -1,66 +1,217 @@
 from rest_framework import viewsets, generics, status
 from rest_framework.views import APIView
-from .models import Restaurant, Promo, Menu, RestaurantImage, ExpiringToken
-from .serializers import RestaurantSerializer, PromoSerializer, MenuSerializer, Category, CategorySerializer, RegisterSerializer, LoginSerializer, UserSerializer
+from .models import Restaurant, Promo, Menu, RestaurantImage, ExpiringToken, OperatingInterval, ChunkedUpload
+from .serializers import RestaurantSerializer, NearbyRestaurantSerializer, PromoSerializer, MenuSerializer, Category, CategorySerializer, RegisterSerializer, LoginSerializer, UserSerializer
+from .serializers import RestaurantSearchSerializer, MenuSearchSerializer, CategorySearchSerializer, CategoryCountSerializer, ChunkedUploadSerializer
+from .pagination import NearbyPagination, PriorityPagination
+from .promos import winning_promo_prefetch, redeemed_promo_ids
+from .documents import absolutize_media_urls
+from .menu_tree import get_menu_tree, menu_index
+from .catalog import category_counts, get_collection_version
+from .geo import parse_point, parse_radius, radius_in_degrees
+from .hours import parse_open_at
+from .search import search, DEFAULT_LIMIT, MAX_LIMIT
+from .authentication import PrincipalRefreshToken, user_instance
+from .revocation import revoke_token
+from .uploads import PartFileLost, append_chunk, complete_upload, discard_part
 from rest_framework.response import Response
-from rest_framework.authtoken.models import Token
-from rest_framework.exceptions import ValidationError
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.decorators import action
 from rest_framework.authentication import TokenAuthentication
-from rest_framework_simplejwt.tokens import RefreshToken
-from django.db.models import Q, Prefetch
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from django.db import transaction
+from django.db.models import Q
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+import hashlib
+from django.contrib.gis.db.models.functions import Distance, GeometryDistance
+from django.contrib.gis.measure import D
 
-class RestaurantViewSet(viewsets.ModelViewSet):
+class ConditionalListMixin:
+    """
+    Validate list requests against the cached version of a catalog collection
+    (see core.catalog). A matching If-None-Match gets a 304 before the
+    queryset is built or anything is serialized. Last-Modified is sent but
+    If-Modified-Since is not honoured: HTTP dates are whole seconds, so a
+    change in the same second as the last one would get a stale 304.
+    """
+    catalog_collection = None
+
+    def get_catalog_collections(self):
+        """Collections the response depends on; none disables validation."""
+        return (self.catalog_collection,)
+
+    def list(self, request, *args, **kwargs):
+        collections = self.get_catalog_collections()
+        if not collections:
+            return super().list(request, *args, **kwargs)
+
+        states = [get_collection_version(collection) for collection in collections]
+        version = ':'.join(version for version, _ in states)
+        # The representation also depends on the query string and renderer.
+        variant = f'{version}:{request.accepted_renderer.format}:{request.get_full_path()}'
+        etag = quote_etag(hashlib.md5(variant.encode()).hexdigest())
+        last_modified = int(max(last_modified for _, last_modified in states).timestamp())
+
+        response = get_conditional_response(request._request, etag=etag)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+class RestaurantFieldsMixin:
+    """
+    ?fields= narrows the restaurant representation. In listings the nested
+    menus and promos are left out unless named in ?expand= (or ?fields=).
+    Relations that are not serialized are not prefetched either.
+    """
+    expandable_fields = ('menus', 'promos')
+
+    def get_requested_fields(self):
+        params = self.request.query_params
+        fields = set(self.get_serializer_class().Meta.fields)
+        if self.request.method != 'GET':
+            return fields
+
+        requested = {name for name in params.get('fields', '').split(',') if name}
+        expand = {name for name in params.get('expand', '').split(',') if name}
+        if requested:
+            fields &= requested | {'id'}
+        if getattr(self, 'action', None) != 'retrieve':
+            fields -= set(self.expandable_fields) - expand - requested
+        return fields
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.get_requested_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def get_prefetches(self, fields):
+        """
+        Prefetches for the serialized relations below the restaurant (promos
+        aside), each costing a fixed number of queries however many
+        restaurants are listed.
+        """
+        prefetches = []
+        if 'categories' in fields:
+            prefetches.append('categories')
+        if 'images' in fields:
+            prefetches.append('images')
+        if 'menus' in fields:
+            prefetches += [
+                'menus__images',
+                'menus__addon_categories__addon_options__menu_item',
+                winning_promo_prefetch('menus__promos'),
+            ]
+        return prefetches
+
+class RestaurantViewSet(RestaurantFieldsMixin, viewsets.ModelViewSet):
     serializer_class = RestaurantSerializer
     queryset = Restaurant.objects.all()
+    pagination_class = PriorityPagination
 
-    def get_queryset(self):
+    def get_scope(self):
+        """
+        Restaurants the user may see.
+        """
         user = self.request.user
 
-        # Check if the user is authenticated
-        if not user.is_authenticated:
-            return Restaurant.objects.prefetch_related('promos', 'menus', 'images')
+        # If the user is an admin or restaurant owner, return only the restaurants they created
+        if user.is_authenticated and user.profile.type_of_user in ['admin', 'restaurant_owner']:
+            return Restaurant.objects.filter(owner_id=user.pk)
 
-        # Get user profile
-        profile = user.profile
+        return Restaurant.objects.all()
 
-        # If the user is a customer, return all restaurants with promos available for the user
-        if profile.type_of_user == 'customer':
-            available_promos = Promo.objects.exclude(
-                usages__customer=user,
-                usages__status="approved"
-            )
-            return Restaurant.objects.prefetch_related(
-                Prefetch('promos', queryset=available_promos),
-                'menus',
-                'images'
-            )
+    def get_excluded_promo_ids(self):
+        """
+        Customers are not offered promos they have already redeemed. The ids
+        come from a per-user cache, so filtering is a set difference on the
+        prefetched promos rather than an anti-join in every listing.
+        """
+        user = self.request.user
+        if user.is_authenticated and user.profile.type_of_user == 'customer':
+            return redeemed_promo_ids(user)
+        return frozenset()
 
-        # If the user is an admin or restaurant owner, return only the restaurants they created
-        if profile.type_of_user in ['admin', 'restaurant_owner']:
-            return Restaurant.objects.filter(owner=user).prefetch_related(
-                Prefetch('promos', queryset=Promo.objects.filter(restaurant__owner=user)),
-                'menus',
-                'images'
-            )
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['excluded_promo_ids'] = self.get_excluded_promo_ids()
+        return context
+
+    def get_queryset(self):
+        fields = self.get_requested_fields()
+        prefetches = self.get_prefetches(fields)
+        if 'promos' in fields:
+            prefetches.append('promos')
+        return self.get_scope().prefetch_related(*prefetches)
 
-        # Default behavior for other cases
-        return Restaurant.objects.prefetch_related('promos', 'menus', 'images')
+    def filter_queryset(self, queryset):
+        """
+        ?open_now=true or ?open_at=<datetime> keep restaurants open at that
+        moment, looked up in the compiled OperatingInterval index.
+        """
+        queryset = super().filter_queryset(queryset)
+        moment = parse_open_at(self.request.query_params)
+        if moment is not None:
+            queryset = queryset.filter(pk__in=OperatingInterval.restaurants_open_at(moment))
+        return queryset
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Serve the pre-rendered document (see core.documents) for the full
+        representation, falling back to the serializers until it is built.
+        """
+        if 'fields' in request.query_params:
+            return super().retrieve(request, *args, **kwargs)
+
+        restaurant = get_object_or_404(self.get_scope().select_related('document'), pk=kwargs['pk'])
+        self.check_object_permissions(request, restaurant)
+        if not hasattr(restaurant, 'document'):
+            return super().retrieve(request, *args, **kwargs)
+
+        document = restaurant.document.document
+        excluded = self.get_excluded_promo_ids()
+        document['promos'] = [promo for promo in document['promos'] if promo['id'] not in excluded]
+        return Response(absolutize_media_urls(document, request))
+
+    @action(detail=False, methods=['get'], pagination_class=NearbyPagination, serializer_class=NearbyRestaurantSerializer)
+    def nearby(self, request):
+        """
+        Restaurants within ?radius= metres of ?lat=&lng=, nearest first.
+        """
+        point = parse_point(request.query_params)
+        radius = parse_radius(request.query_params)
+
+        # ST_DWithin on a generous degree radius is answered by the GiST index,
+        # the spherical distance check then trims the corners of that box.
+        # Ordering by the <-> operator lets PostGIS walk the index in KNN order.
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            coordinates__dwithin=(point, radius_in_degrees(point, radius)),
+            coordinates__distance_lte=(point, D(m=radius)),
+        ).annotate(
+            distance=Distance('coordinates', point),
+            knn_distance=GeometryDistance('coordinates', point),
+        )
+
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
 class PromoViewSet(viewsets.ModelViewSet):
     queryset = Promo.objects.all()
     serializer_class = PromoSerializer
+    pagination_class = PriorityPagination
 
     def get_queryset(self):
         """
         Exclude promos that have been used and approved by the current user.
         """
         if self.request.user.is_authenticated:
-            # Exclude promos where the user has an approved usage
-            return Promo.objects.exclude(
-                usages__customer=self.request.user,
-                usages__status="approved"
-            ).distinct()
+            # Redeemed promo ids are cached per user, so this is a plain NOT IN
+            return Promo.objects.exclude(pk__in=redeemed_promo_ids(self.request.user))
 
         # For unauthenticated users, return all promos
         return super().get_queryset()
@@ -68,25 +219,140 @@ class PromoViewSet(viewsets.ModelViewSet):
 class MenuViewSet(viewsets.ModelViewSet):
     queryset = Menu.objects.all().prefetch_related(
         'images',
-        'addon_categories__addon_options'
+        'addon_categories__addon_options__menu_item',
+        winning_promo_prefetch()
     )
     serializer_class = MenuSerializer
+    pagination_class = PriorityPagination
+
+    def retrieve(self, request, *args, **kwargs):
+        """Serve the menu from its restaurant's cached menu tree."""
+        try:
+            pk = int(kwargs['pk'])
+        except ValueError:
+            raise NotFound()
+        restaurant_id = Menu.objects.filter(pk=pk).values_list('restaurant_id', flat=True).first()
+        if restaurant_id is None:
+            raise NotFound()
+        menu = menu_index(get_menu_tree(restaurant_id)).get(pk)
+        if menu is None:
+            return super().retrieve(request, *args, **kwargs)
+        return Response(absolutize_media_urls(menu, request))
 
-class FeaturedRestaurantListView(generics.ListAPIView):
-    queryset = Restaurant.objects.all().order_by('priority_index').prefetch_related('images')
+    @action(detail=False, methods=['get'])
+    def tree(self, request):
+        """
+        Every menu of ?restaurant= with addon categories, options and menu
+        items offered as addons, from the cached menu tree (core.menu_tree).
+        """
+        try:
+            restaurant_id = int(request.query_params['restaurant'])
+        except (KeyError, ValueError):
+            raise ValidationError({"detail": "restaurant must be a restaurant id."})
+        return Response(absolutize_media_urls(get_menu_tree(restaurant_id), request))
+
+class FeaturedRestaurantListView(ConditionalListMixin, RestaurantFieldsMixin, generics.ListAPIView):
+    queryset = Restaurant.objects.all().order_by('priority_index')
     serializer_class = RestaurantSerializer
+    pagination_class = PriorityPagination
+    catalog_collection = 'restaurants'
+
+    def get_queryset(self):
+        fields = self.get_requested_fields()
+        prefetches = self.get_prefetches(fields)
+        if 'promos' in fields:
+            prefetches.append('promos')
+        return super().get_queryset().prefetch_related(*prefetches)
 
-class FeaturedMenuListView(generics.ListAPIView):
-    queryset = Menu.objects.all().order_by('priority_index').prefetch_related('images')
+class FeaturedMenuListView(ConditionalListMixin, generics.ListAPIView):
+    queryset = Menu.objects.all().order_by('priority_index').prefetch_related(
+        'images',
+        'addon_categories__addon_options__menu_item',
+        winning_promo_prefetch()
+    )
     serializer_class = MenuSerializer
+    pagination_class = PriorityPagination
+    catalog_collection = 'menus'
+
+class CategoryCountsMixin:
+    """
+    ?counts=true adds to every category the number of active restaurants
+    (or menus) in it, narrowed by ?city=, ?province= and ?open_now=true or
+    ?open_at=<datetime>. See core.catalog.category_counts.
+    """
+    category_type = None
+
+    def wants_counts(self):
+        return self.request.query_params.get('counts', '').lower() in ('1', 'true', 'yes')
 
-class RestaurantCategoryList(generics.ListAPIView):
+    def get_catalog_collections(self):
+        if not self.wants_counts():
+            return super().get_catalog_collections()
+        if 'open_now' in self.request.query_params:
+            # Changes by the minute without the catalog changing
+            return ()
+        return ('categories', 'restaurants', 'menus')
+
+    def get_serializer_class(self):
+        return CategoryCountSerializer if self.wants_counts() else super().get_serializer_class()
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.wants_counts():
+            params = self.request.query_params
+            context['category_counts'] = category_counts(
+                self.category_type,
+                city=params.get('city'),
+                province=params.get('province'),
+                open_at=parse_open_at(params),
+            )
+        return context
+
+class RestaurantCategoryList(CategoryCountsMixin, ConditionalListMixin, generics.ListAPIView):
     queryset = Category.objects.filter(category_type='restaurant').order_by('priority_index')
     serializer_class = CategorySerializer
+    catalog_collection = 'categories'
+    category_type = 'restaurant'
 
-class MenuCategoryList(generics.ListAPIView):
+class MenuCategoryList(CategoryCountsMixin, ConditionalListMixin, generics.ListAPIView):
     queryset = Category.objects.filter(category_type='menu').order_by('priority_index')
     serializer_class = CategorySerializer
+    catalog_collection = 'categories'
+    category_type = 'menu'
+
+class SearchView(APIView):
+    """
+    Ranked full text search over restaurants, menus and categories:
+    ?q=<text>, optionally around ?lat=&lng= and with up to ?limit= results
+    of each kind.
+    """
+
+    def get(self, request):
+        params = request.query_params
+        text = params.get('q', '').strip()
+        if not text:
+            raise ValidationError({"detail": "q is required."})
+        try:
+            limit = min(max(int(params.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+        except ValueError:
+            raise ValidationError({"detail": "limit must be a number."})
+        point = parse_point(params, required=False)
+
+        restaurants = search(
+            Restaurant.objects.exclude(status='inactive'), text, point, 'coordinates', limit,
+        )
+        menus = search(
+            Menu.objects.filter(status='active').exclude(restaurant__status='inactive').select_related('restaurant'),
+            text, point, 'restaurant__coordinates', limit,
+        )
+        categories = search(Category.objects.all(), text, limit=limit)
+
+        context = {'request': request}
+        return Response({
+            'restaurants': RestaurantSearchSerializer(restaurants, many=True, context=context).data,
+            'menus': MenuSearchSerializer(menus, many=True, context=context).data,
+            'categories': CategorySearchSerializer(categories, many=True, context=context).data,
+        })
 
 class RegisterView(generics.CreateAPIView):
     serializer_class = RegisterSerializer
@@ -111,6 +377,7 @@ class RegisterView(generics.CreateAPIView):
             )
 
 class LoginView(APIView):
+    permission_classes = [AllowAny]
     serializer_class = LoginSerializer
 
     def post(self, request, *args, **kwargs):
@@ -119,7 +386,7 @@ class LoginView(APIView):
         user = serializer.validated_data['user']
         
         # Create JWT tokens
-        refresh = RefreshToken.for_user(user)
+        refresh = PrincipalRefreshToken.for_user(user)
         access_token = refresh.access_token
 
         return Response({
@@ -135,19 +402,91 @@ class LogoutView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        try:
-            # Delete the user's token to log them out
-            token = Token.objects.get(user=request.user)
-            token.delete()
-            return Response({"detail": "Successfully logged out."}, status=status.HTTP_200_OK)
-        except Token.DoesNotExist:
-            return Response({"detail": "Token not found."}, status=status.HTTP_400_BAD_REQUEST)
+        """
+        Revoke the access token of the request and, when given as ``refresh``,
+        the refresh token it came with (see core.authentication).
+        """
+        if request.data.get('refresh'):
+            try:
+                refresh = PrincipalRefreshToken(request.data['refresh'])
+            except TokenError:
+                refresh = None
+            if refresh is None or refresh[jwt_settings.USER_ID_CLAIM] != request.user.pk:
+                return Response({"detail": "Invalid refresh token."}, status=status.HTTP_400_BAD_REQUEST)
+            revoke_token(refresh)
+        if request.auth is not None:
+            revoke_token(request.auth)
+        return Response({"detail": "Successfully logged out."}, status=status.HTTP_200_OK)
     
 class UserDetailView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
         if request.user.is_authenticated:
-            serializer = UserSerializer(request.user)
+            serializer = UserSerializer(user_instance(request.user))
             return Response(serializer.data)
-        return Response({"message": "User not authenticated"}, status=401)
\ No newline at end of file
+        return Response({"message": "User not authenticated"}, status=401)
+
+class ChunkedUploadView(generics.CreateAPIView):
+    """
+    POST {restaurant | menu, filename, size, caption} starts a resumable upload
+    of a photo (see core.uploads), answering with its id and offset 0.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = ChunkedUploadSerializer
+
+    def perform_create(self, serializer):
+        serializer.save(user_id=self.request.user.pk)
+
+class ChunkedUploadDetailView(APIView):
+    """
+    GET (or HEAD) reports how many bytes of the upload were received, as
+    ``offset`` and the Upload-Offset header. PATCH appends the request body,
+    sent with ``Upload-Offset`` equal to that offset; the chunk completing the
+    file answers with the new RestaurantImage. DELETE abandons the upload.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return ChunkedUpload.objects.filter(user_id=self.request.user.pk)
+
+    def respond(self, upload, status_code=status.HTTP_200_OK):
+        headers = {'Upload-Offset': str(upload.offset), 'Upload-Length': str(upload.size), 'Cache-Control': 'no-store'}
+        serializer = ChunkedUploadSerializer(upload, context={'request': self.request})
+        return Response(serializer.data, status=status_code, headers=headers)
+
+    def get(self, request, pk):
+        return self.respond(get_object_or_404(self.get_queryset(), pk=pk))
+
+    def patch(self, request, pk):
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers.get('Content-Length') or 0)
+        except (KeyError, ValueError):
+            return Response({"error": "Upload-Offset and Content-Length are required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # The row lock keeps two requests from appending to the same part file
+        with transaction.atomic():
+            upload = get_object_or_404(self.get_queryset().select_for_update(), pk=pk)
+            if upload.image_id is not None or offset != upload.offset:
+                # Already complete, or the client lost track: it resumes from the offset returned
+                return self.respond(upload, status.HTTP_409_CONFLICT)
+            if offset + length > upload.size:
+                return Response({"error": "The chunk runs past the upload's size."}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                upload.offset += append_chunk(upload, request.stream, length)
+            except PartFileLost:
+                upload.delete()
+                return Response({"error": "The upload was lost, please start again."}, status=status.HTTP_410_GONE)
+            upload.save(update_fields=['offset', 'updated_at'])
+
+            if upload.offset == upload.size and complete_upload(upload) is None:
+                upload.delete()
+                return Response({"error": "The file is not an image."}, status=status.HTTP_400_BAD_REQUEST)
+        return self.respond(upload)
+
+    def delete(self, request, pk):
+        upload = get_object_or_404(self.get_queryset(), pk=pk)
+        discard_part(upload)
+        upload.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 from pathlib import Path
 from datetime import timedelta
 import os
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -44,6 +45,7 @@ INSTALLED_APPS = [
     'rest_framework',
     'rest_framework.authtoken',
     'rest_framework_simplejwt',
+    'rest_framework_simplejwt.token_blacklist',
     'core',
     'payments',
     'rest_auth',
@@ -51,11 +53,12 @@ INSTALLED_APPS = [
     'corsheaders',
     'mapwidgets',
     'django.contrib.gis',
+    'django.contrib.postgres',
 ]
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.PrincipalAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -68,6 +71,10 @@ SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    # Requests are authenticated from the token's claims (see core.authentication)
+    'TOKEN_USER_CLASS': 'core.authentication.Principal',
+    'TOKEN_OBTAIN_SERIALIZER': 'core.authentication.PrincipalTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'core.authentication.PrincipalTokenRefreshSerializer',
 }
 
 MIDDLEWARE = [
@@ -85,6 +92,8 @@ CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
 ]
 
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
+
 ROOT_URLCONF = 'dineease_backend.urls'
 
 TEMPLATES = [
@@ -121,6 +130,25 @@ DATABASES = {
     }
 }
 
+# Cache
+# Shared by every worker, so state such as catalog versions is consistent
+# across processes. Without REDIS_URL (e.g. running tests) each process gets
+# its own in-memory cache.
+
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -147,6 +175,9 @@ LANGUAGE_CODE = 'en-us'
 
 TIME_ZONE = 'UTC'
 
+# Local time of the restaurants, used to read operating hours and promo time windows
+RESTAURANT_TIME_ZONE = 'America/Vancouver'
+
 USE_I18N = True
 
 USE_TZ = True
@@ -166,6 +197,32 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Uploads are named by their content hash (see core.storage), so nginx can
+# serve them as immutable
+STORAGES = {
+    'default': {
+        'BACKEND': 'core.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# Resumable photo uploads (see core.uploads). Part files are kept on the media
+# volume, so finished ones are renamed into place rather than copied
+CHUNKED_UPLOAD_ROOT = os.path.join(MEDIA_ROOT, '.uploads')
+CHUNKED_UPLOAD_MAX_SIZE = 512 * 1024 * 1024
+CHUNKED_UPLOAD_EXPIRY_HOURS = 24
+
+# Revoked token checks (see core.revocation): seconds between top-ups and
+# rebuilds of each process's filter, and its false positive rate
+TOKEN_REVOCATION_REFRESH_SECONDS = 5
+TOKEN_REVOCATION_REBUILD_SECONDS = 3600
+TOKEN_REVOCATION_FALSE_POSITIVE_RATE = 0.001
+
+# Threads per process rendering resized copies of uploaded images (see core.images)
+IMAGE_DERIVATIVE_WORKERS = 2
+
 MAP_WIDGETS = {
     "Mapbox": {
         "accessToken": "pk.eyJ1IjoiY291bnRhYmxlLXdlYiIsImEiOiJjamQyaTV0dXYxdjJuMnFtd3phMzJjZXBxIn0.DHpU55XJjLMUBHrl7d1bbQ",
@@ -0,0 +1,162 @@
+"""
+CSV and NDJSON exports of orders, order items and payments for accounting,
+served by export() and the export_sales command.
+
+Rows are read as plain tuples through a server-side cursor
+(``.values_list().iterator()``) and written out a block at a time, so memory
+stays flat however many months are exported.
+"""
+import csv
+import json
+from datetime import datetime, time, timedelta
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_date
+
+from core.hours import local_time_zone
+from core.models import Restaurant
+from .models import Order, OrderItem, Payment
+from .streams import authenticate
+
+CHUNK_SIZE = 2000  # Rows fetched from the cursor, and written, at a time
+
+# Rows of each export, filtered through the order they belong to
+EXPORTS = {
+    'orders': {
+        'model': Order,
+        'order': '',
+        'columns': [
+            'id', 'created_at', 'restaurant_id', 'restaurant__name', 'customer_id', 'status', 'order_type',
+            'is_delivery', 'order_total', 'tax', 'tip', 'promo_id',
+        ],
+    },
+    'order-items': {
+        'model': OrderItem,
+        'order': 'order__',
+        'columns': [
+            'id', 'order_id', 'order__created_at', 'order__restaurant_id', 'menu_item_id', 'menu_item__name',
+            'quantity', 'price',
+        ],
+    },
+    'payments': {
+        'model': Payment,
+        'order': 'order__',
+        'columns': [
+            'id', 'order_id', 'order__created_at', 'order__restaurant_id', 'transaction_id', 'payment_method',
+            'payment_gateway', 'payment_status', 'amount_paid', 'refund_status', 'refund_id', 'created_at',
+        ],
+    },
+}
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+
+def export_rows(kind, restaurant_ids=None, start=None, end=None, chunk_size=CHUNK_SIZE):
+    """
+    Tuples of the ``kind`` export for orders of ``restaurant_ids`` (all when
+    None) placed from local day ``start`` to ``end``, both inclusive.
+    """
+    export = EXPORTS[kind]
+    prefix = export['order']
+    rows = export['model'].objects.all()
+    if restaurant_ids is not None:
+        rows = rows.filter(**{f'{prefix}restaurant_id__in': restaurant_ids})
+    if start is not None:
+        rows = rows.filter(**{f'{prefix}created_at__gte': datetime.combine(start, time(), tzinfo=local_time_zone())})
+    if end is not None:
+        rows = rows.filter(**{f'{prefix}created_at__lt': datetime.combine(end + timedelta(days=1), time(), tzinfo=local_time_zone())})
+    return rows.order_by('pk').values_list(*export['columns']).iterator(chunk_size=chunk_size)
+
+
+class Echo:
+    """File-like object handing back what csv.writer writes to it."""
+
+    def write(self, value):
+        return value
+
+
+def format_lines(columns, rows, format):
+    if format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(columns)
+        for row in rows:
+            yield writer.writerow(row)
+    else:
+        for row in rows:
+            yield json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def export_blocks(kind, format='csv', chunk_size=CHUNK_SIZE, **filters):
+    """The ``kind`` export as text blocks of up to ``chunk_size`` lines."""
+    lines = format_lines(EXPORTS[kind]['columns'], export_rows(kind, chunk_size=chunk_size, **filters), format)
+    while block := ''.join(islice(lines, chunk_size)):
+        yield block
+
+
+async def aexport_blocks(*args, **kwargs):
+    """
+    export_blocks() for async responses. Under ASGI a synchronous iterator
+    would be read to the end before the first byte is sent, so each block is
+    read on the request's sync thread, where its cursor stays open.
+    """
+    blocks = export_blocks(*args, **kwargs)
+    next_block = sync_to_async(next)
+    try:
+        while (block := await next_block(blocks, None)) is not None:
+            yield block
+    finally:
+        # Closes the server-side cursor right away when the client goes
+        await sync_to_async(blocks.close)()
+
+
+def parse_day(value):
+    """A date from ``?from=``/``?to=``, None when not given; ValueError when malformed."""
+    if not value:
+        return None
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(value)
+    return day
+
+
+async def export(request, kind):
+    """
+    GET payments/exports/<orders|order-items|payments>/?format=csv|ndjson
+    &from=&to=&restaurant= for staff, or for owners over their restaurants.
+    Like the order streams, a stream ticket may be given as ``?ticket=`` so
+    the export can be a plain download link; the link works once.
+    """
+    user = await sync_to_async(authenticate)(request)
+    if user is None:
+        return JsonResponse({"error": "Authentication required"}, status=401)
+
+    format = request.GET.get('format', 'csv')
+    if kind not in EXPORTS or format not in FORMATS:
+        return JsonResponse({"error": "Unknown export"}, status=404)
+    try:
+        start, end = parse_day(request.GET.get('from')), parse_day(request.GET.get('to'))
+        restaurant = int(request.GET['restaurant']) if request.GET.get('restaurant') else None
+    except ValueError:
+        return JsonResponse({"error": "from and to must be ISO dates and restaurant an id."}, status=400)
+
+    restaurants = Restaurant.objects.all() if user.is_staff else Restaurant.objects.filter(owner_id=user.pk)
+    if restaurant is not None:
+        restaurants = restaurants.filter(pk=restaurant)
+    restaurant_ids = None if user.is_staff and restaurant is None else [pk async for pk in restaurants.values_list('pk', flat=True)]
+    if restaurant_ids == []:
+        return JsonResponse({"error": "Restaurant not found"}, status=404)
+
+    content_type, extension = FORMATS[format]
+    response = StreamingHttpResponse(
+        aexport_blocks(kind, format, restaurant_ids=restaurant_ids, start=start, end=end),
+        content_type=content_type,
+    )
+    response['Content-Disposition'] = f'attachment; filename="{kind}-{start or "start"}-{end or "now"}.{extension}"'
+    response['X-Accel-Buffering'] = 'no'
+    return response
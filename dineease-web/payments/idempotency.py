@@ -0,0 +1,129 @@
+import functools
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_KEY_TTL = 60 * 60 * 24
+# Longest a request may hold a key before duplicates stop waiting for it
+LOCK_TIMEOUT = 30
+# How long a concurrent duplicate waits for the first response
+WAIT_TIMEOUT = 10
+POLL_INTERVAL = 0.05
+
+
+def fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def replay(stored, request_fingerprint):
+    if stored['fingerprint'] != request_fingerprint:
+        return Response(
+            {"error": "Idempotency-Key was already used for a different request"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    return Response(stored['response'], status=stored['status_code'], headers={'Idempotent-Replayed': 'true'})
+
+
+def load(user_id, path, key):
+    row = IdempotencyKey.objects.filter(user_id=user_id, path=path, key=key, expires_at__gt=timezone.now()).first()
+    if row is None:
+        return None
+    return {'fingerprint': row.fingerprint, 'status_code': row.status_code, 'response': row.response}
+
+
+def wait_for(cache_key, lock_key):
+    """Poll for the response of the request holding the lock."""
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        stored = cache.get(cache_key)
+        if stored is not None or cache.get(lock_key) is None:
+            return stored
+        time.sleep(POLL_INTERVAL)
+    return None
+
+
+def idempotent(handler):
+    """
+    Honour an ``Idempotency-Key`` header on a view handler.
+
+    The first response (unless it is a server error) is stored for
+    IDEMPOTENCY_KEY_TTL, in the same transaction as the handler's writes and
+    in the cache. Repeats with the same key and body replay it from the cache;
+    repeats arriving while the first request still runs wait for its response
+    instead of running the handler again.
+    """
+    @functools.wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if key is None:
+            return handler(view, request, *args, **kwargs)
+        if not 0 < len(key) <= 255:
+            return Response({"error": "Idempotency-Key must be 1 to 255 characters"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # request.user is a token-backed Principal, not a User row (see core.authentication)
+        user_id = request.user.pk if request.user.is_authenticated else None
+        scope = hashlib.sha256(f'{user_id}:{request.path}:{key}'.encode()).hexdigest()
+        cache_key, lock_key = f'idempotency:{scope}', f'idempotency-lock:{scope}'
+        request_fingerprint = fingerprint(request)
+
+        stored = cache.get(cache_key)
+        if stored is not None:
+            return replay(stored, request_fingerprint)
+
+        if not cache.add(lock_key, True, LOCK_TIMEOUT):
+            stored = wait_for(cache_key, lock_key)
+            if stored is None:
+                return Response(
+                    {"error": "A request with this Idempotency-Key is in progress, retry later"},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            return replay(stored, request_fingerprint)
+
+        try:
+            # After a cache flush the stored response is still in the database
+            stored = load(user_id, request.path, key)
+            if stored is None:
+                try:
+                    with transaction.atomic():
+                        response = handler(view, request, *args, **kwargs)
+                        if response.status_code >= 500:
+                            return response
+                        stored = {
+                            'fingerprint': request_fingerprint,
+                            'status_code': response.status_code,
+                            'response': json.loads(JSONRenderer().render(response.data)),
+                        }
+                        # Expired keys may be reused
+                        IdempotencyKey.objects.filter(user_id=user_id, path=request.path, key=key).delete()
+                        IdempotencyKey.objects.create(
+                            user_id=user_id, path=request.path, key=key,
+                            expires_at=timezone.now() + timedelta(seconds=IDEMPOTENCY_KEY_TTL),
+                            **stored,
+                        )
+                except IntegrityError:
+                    # Another process stored the key after its lock expired;
+                    # everything written above was rolled back.
+                    stored = load(user_id, request.path, key)
+                    if stored is None:
+                        raise
+                else:
+                    cache.set(cache_key, stored, IDEMPOTENCY_KEY_TTL)
+                    return response
+
+            cache.set(cache_key, stored, IDEMPOTENCY_KEY_TTL)
+            return replay(stored, request_fingerprint)
+        finally:
+            cache.delete(lock_key)
+
+    return wrapper
@@ -0,0 +1,73 @@
+import os
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core.models import Restaurant
+from payments.models import Order
+
+BENCHMARK_USER = 'export-benchmark'
+
+
+class Command(BaseCommand):
+    help = (
+        "Export growing numbers of orders with export_sales, each in a fresh process, "
+        "and report its peak RSS and rows/sec."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', default='10000,100000,1000000,5000000', help="Comma-separated order counts")
+        parser.add_argument('--format', choices=('csv', 'ndjson'), default='csv')
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username=BENCHMARK_USER)
+        restaurant = Restaurant.objects.create(
+            name='Export benchmark', image='restaurant_images/benchmark.webp', location='1 Benchmark Street',
+            coordinates=Point(-123.1207, 49.2827, srid=4326), telephone='555-0100', owner=user,
+        )
+        try:
+            exported = 0
+            for rows in sorted(int(rows) for rows in options['rows'].split(',')):
+                self.insert_orders(user, restaurant, rows - exported)
+                exported = rows
+                peak, elapsed = self.export(restaurant, options['format'])
+                self.stdout.write(f"{rows} rows: peak RSS {peak / 1024:.1f} MB, {rows / elapsed:.0f} rows/sec")
+        finally:
+            # Straight to SQL: deleting millions of orders through the ORM would load them all
+            with connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {Order._meta.db_table} WHERE restaurant_id = %s", [restaurant.pk])
+            restaurant.delete()
+
+    def insert_orders(self, user, restaurant, count):
+        # Generated by Postgres, so millions of rows take seconds and no client memory
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {Order._meta.db_table}
+                    (customer_id, restaurant_id, order_total, status, order_time, is_delivery, order_type,
+                     tax, tip, created_at, updated_at)
+                SELECT %s, %s, 10 + n %% 90, 'delivered', stamp, false, 'takeaway', 0.50, 1.00, stamp, stamp
+                FROM generate_series(1, %s) AS n, LATERAL (SELECT now() - n * interval '1 second' AS stamp) AS s
+                """,
+                [user.pk, restaurant.pk, count],
+            )
+
+    def export(self, restaurant, format):
+        """Peak RSS (kB) and seconds of one export_sales run."""
+        command = [
+            sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'export_sales', 'orders',
+            '--format', format, '--restaurant', str(restaurant.pk), '--output', os.devnull,
+        ]
+        started = time.perf_counter()
+        process = subprocess.Popen(command)
+        _, exit_status, usage = os.wait4(process.pid, 0)
+        elapsed = time.perf_counter() - started
+        if exit_status:
+            raise RuntimeError(f"export_sales exited with status {exit_status}")
+        return usage.ru_maxrss, elapsed
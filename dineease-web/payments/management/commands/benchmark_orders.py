@@ -0,0 +1,67 @@
+import time
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.models import Menu, Restaurant
+from payments.views import CreateOrderView
+
+BENCHMARK_USER = 'order-benchmark'
+
+
+class Command(BaseCommand):
+    help = "Measure CreateOrderView throughput in orders/sec for several cart sizes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=200, help="Orders to create per cart size.")
+        parser.add_argument('--cart-sizes', type=int, nargs='+', default=[1, 10, 50])
+
+    def handle(self, *args, **options):
+        # Everything, including the orders, is rolled back at the end
+        with transaction.atomic():
+            user, _ = User.objects.get_or_create(username=BENCHMARK_USER)
+            restaurant = Restaurant.objects.create(
+                name='Order benchmark', image='restaurant_images/benchmark.webp', location='1 Benchmark Street',
+                coordinates=Point(-123.1207, 49.2827, srid=4326), telephone='555-0100', owner=user,
+            )
+            menus = Menu.objects.bulk_create(
+                Menu(restaurant=restaurant, name=f'Item {index}', description='', cost=Decimal('10.00'))
+                for index in range(max(options['cart_sizes']))
+            )
+
+            view = CreateOrderView.as_view()
+            factory = APIRequestFactory()
+            for size in options['cart_sizes']:
+                started = time.perf_counter()
+                for _ in range(options['orders']):
+                    request = factory.post('/api/payments/orders/create/', self.payload(restaurant, menus[:size]), format='json')
+                    force_authenticate(request, user=user)
+                    response = view(request)
+                    if response.status_code != 201:
+                        raise RuntimeError(response.data)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f"{size:3} items: {options['orders'] / elapsed:8.1f} orders/sec")
+
+            transaction.set_rollback(True)
+
+    def payload(self, restaurant, menus):
+        return {
+            'restaurant_id': restaurant.pk,
+            'order_total': str(Decimal('10.00') * len(menus)),
+            'is_delivery': False,
+            'order_type': 'takeaway',
+            'tax': '0.00',
+            'tip': '0.00',
+            'menu_items': [{'menu_item_id': menu.pk, 'quantity': 1} for menu in menus],
+            'payment': {
+                'payment_method': 'credit_card',
+                'amount_paid': str(Decimal('10.00') * len(menus)),
+                'payment_gateway': 'stripe',
+                'transaction_id': f'bench_{uuid.uuid4().hex}',
+            },
+        }
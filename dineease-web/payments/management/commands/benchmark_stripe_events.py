@@ -0,0 +1,73 @@
+import json
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from core.models import Restaurant
+from payments.models import Order, Payment, StripeEvent
+from payments.stripe_events import sign_payload
+from payments.webhooks import stripe_webhook
+
+BENCHMARK_USER = 'stripe-benchmark'
+
+
+class Command(BaseCommand):
+    help = "Measure webhook ingestion and inbox processing in events/sec."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=10000)
+        parser.add_argument('--payments', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username=BENCHMARK_USER)
+        restaurant = Restaurant.objects.create(
+            name='Stripe benchmark', image='restaurant_images/benchmark.webp', location='1 Benchmark Street',
+            coordinates=Point(-123.1207, 49.2827, srid=4326), telephone='555-0100', owner=user,
+        )
+        try:
+            orders = Order.objects.bulk_create(
+                Order(customer=user, restaurant=restaurant, order_total=Decimal('10.00'), status='pending', order_type='takeaway')
+                for _ in range(options['payments'])
+            )
+            Payment.objects.bulk_create(
+                Payment(
+                    order=order, payment_method='credit_card', payment_status='pending', amount_paid=Decimal('10.00'),
+                    payment_gateway='stripe', transaction_id=f'pi_bench_{order.pk}',
+                )
+                for order in orders
+            )
+
+            factory = RequestFactory()
+            secret = settings.STRIPE_WEBHOOK_SECRET
+            started = time.perf_counter()
+            for index in range(options['events']):
+                order = orders[index % len(orders)]
+                payload = json.dumps({
+                    'id': f'evt_bench_{index}',
+                    'type': 'payment_intent.succeeded',
+                    'created': int(time.time()),
+                    'data': {'object': {'object': 'payment_intent', 'id': f'pi_bench_{order.pk}'}},
+                })
+                request = factory.post(
+                    '/api/payments/stripe/webhook/', payload, content_type='application/json',
+                    HTTP_STRIPE_SIGNATURE=sign_payload(payload, secret),
+                )
+                stripe_webhook(request)
+            ingested = time.perf_counter() - started
+            self.stdout.write(f"Ingested {options['events']} events: {options['events'] / ingested:.0f} events/sec")
+
+            started = time.perf_counter()
+            call_command('process_stripe_events', once=True, workers=options['workers'], batch_size=options['batch_size'])
+            applied = time.perf_counter() - started
+            self.stdout.write(f"Applied {options['events']} events: {options['events'] / applied:.0f} events/sec")
+        finally:
+            StripeEvent.objects.filter(event_id__startswith='evt_bench_').delete()
+            restaurant.delete()
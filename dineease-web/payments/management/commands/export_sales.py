@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.exports import CHUNK_SIZE, EXPORTS, FORMATS, export_blocks, parse_day
+
+
+class Command(BaseCommand):
+    help = "Stream an orders, order-items or payments export as CSV or NDJSON to stdout or a file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS))
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--from', dest='start', help="First local day, YYYY-MM-DD")
+        parser.add_argument('--to', dest='end', help="Last local day, YYYY-MM-DD")
+        parser.add_argument('--restaurant', type=int, action='append', help="Repeat for several restaurants")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument('--output', help="File to write instead of stdout")
+
+    def handle(self, *args, **options):
+        try:
+            start, end = parse_day(options['start']), parse_day(options['end'])
+        except ValueError:
+            raise CommandError("--from and --to must be ISO dates.")
+
+        blocks = export_blocks(
+            options['kind'], options['format'], chunk_size=options['chunk_size'],
+            restaurant_ids=options['restaurant'], start=start, end=end,
+        )
+        if options['output']:
+            with open(options['output'], 'w', newline='') as output:
+                output.writelines(blocks)
+        else:
+            for block in blocks:
+                self.stdout.write(block, ending='')
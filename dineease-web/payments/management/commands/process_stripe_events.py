@@ -0,0 +1,57 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from payments import stripe_events
+from payments.stripe_events import PARTITIONS
+
+logger = logging.getLogger(__name__)
+
+MAX_BACKOFF = 60  # Seconds a worker waits at most after consecutive failures
+ONCE_MAX_FAILURES = 5  # Consecutive failures after which --once gives up
+
+
+class Command(BaseCommand):
+    help = "Apply the Stripe webhook events in the inbox with a pool of workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--idle-sleep', type=float, default=1.0, help="Seconds to wait when the inbox is empty.")
+        parser.add_argument('--once', action='store_true', help="Drain the inbox and exit.")
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        # Each worker owns the partitions it is the remainder of
+        partitions = [[p for p in range(PARTITIONS) if p % workers == index] for index in range(workers)]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            processed = sum(executor.map(lambda owned: self.work(owned, options), partitions))
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} Stripe events."))
+
+    def work(self, partitions, options):
+        processed = failures = 0
+        try:
+            while True:
+                try:
+                    count = stripe_events.process_batch(partitions, options['batch_size'])
+                except Exception:
+                    # A worker that stopped would leave its partitions unprocessed for good
+                    failures += 1
+                    logger.exception("Processing Stripe events of partitions %s failed (%d in a row)", partitions, failures)
+                    if options['once'] and failures >= ONCE_MAX_FAILURES:
+                        raise
+                    close_old_connections()
+                    time.sleep(min(options['idle_sleep'] * 2 ** (failures - 1), MAX_BACKOFF))
+                    continue
+                failures = 0
+                processed += count
+                if not count:
+                    if options['once']:
+                        return processed
+                    time.sleep(options['idle_sleep'])
+        finally:
+            # Each worker thread opened its own connection
+            connections.close_all()
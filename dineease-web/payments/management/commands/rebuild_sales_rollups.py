@@ -0,0 +1,58 @@
+from django.db import transaction
+from django.core.management.base import BaseCommand
+
+from payments.models import ItemSalesRollup, Order, RolledUpOrder, SalesRollup
+from payments.rollups import SALES_STATUSES, count_orders, uncount_orders
+
+
+class Command(BaseCommand):
+    help = (
+        "Bring the sales rollups up to date in chunks of orders: count the sales not counted yet "
+        "and take out the orders no longer sales. With --rebuild, start from empty rollups."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--restaurant', type=int, help="Only this restaurant's rollups")
+        parser.add_argument('--rebuild', action='store_true')
+
+    def handle(self, *args, **options):
+        orders = Order.objects.all()
+        ledger = RolledUpOrder.objects.all()
+        if options['restaurant']:
+            orders = orders.filter(restaurant_id=options['restaurant'])
+            ledger = ledger.filter(restaurant_id=options['restaurant'])
+
+        if options['rebuild']:
+            with transaction.atomic():
+                for model in (SalesRollup, ItemSalesRollup, RolledUpOrder):
+                    rows = model.objects.all()
+                    if options['restaurant']:
+                        rows = rows.filter(restaurant_id=options['restaurant'])
+                    rows.delete()
+
+        # Both passes are safe next to live status changes: an order is only
+        # added or taken out by whoever inserts or deletes its ledger row
+        uncounted = orders.filter(status__in=SALES_STATUSES, rollup__isnull=True).only(
+            'pk', 'restaurant_id', 'created_at', 'order_total', 'tip',
+        )
+        added = last = 0
+        while True:
+            with transaction.atomic():
+                chunk = list(uncounted.filter(pk__gt=last).order_by('pk')[:options['chunk_size']])
+                if not chunk:
+                    break
+                added += count_orders(chunk)
+            last = chunk[-1].pk
+
+        stale = ledger.exclude(order__status__in=SALES_STATUSES)
+        removed = last = 0
+        while True:
+            with transaction.atomic():
+                chunk = list(stale.filter(pk__gt=last).order_by('pk').values_list('pk', flat=True)[:options['chunk_size']])
+                if not chunk:
+                    break
+                removed += uncount_orders(chunk)
+            last = chunk[-1]
+
+        self.stdout.write(self.style.SUCCESS(f"Counted {added} orders and took out {removed}."))
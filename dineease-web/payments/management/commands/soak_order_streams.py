@@ -0,0 +1,140 @@
+import asyncio
+import resource
+import time
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.models import Restaurant
+from dineease_backend.asgi import application
+from payments.models import Order, Payment
+from payments.order_events import broker
+
+SOAK_USER = 'stream-soak'
+
+
+def rss_kb():
+    """Resident memory of this process in kB (the peak where /proc is missing)."""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Client:
+    """An idle EventSource, speaking ASGI to the application directly."""
+
+    def __init__(self, path, token, port):
+        self.scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'root_path': '',
+            'query_string': f'token={token}'.encode(), 'headers': [(b'host', b'localhost')],
+            'client': ('127.0.0.1', port), 'server': ('localhost', 80),
+        }
+        self.requested = False
+        self.closed = asyncio.Event()
+        self.opened = asyncio.Event()
+        self.status = None
+        self.events = 0
+
+    async def receive(self):
+        if not self.requested:
+            self.requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await self.closed.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self.status = message['status']
+        elif message['type'] == 'http.response.body':
+            self.events += message.get('body', b'').count(b'event: ')
+            self.opened.set()
+
+
+class Command(BaseCommand):
+    help = (
+        "Hold many idle order streams on one event loop, as one ASGI worker would, "
+        "and report memory per stream and the time to fan a status change out to all of them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=5000)
+        parser.add_argument('--hold', type=int, default=60, help="Seconds to hold the streams idle")
+        parser.add_argument('--sample', type=int, default=10, help="Seconds between memory samples")
+        parser.add_argument('--step', type=int, default=500, help="Streams opened at a time")
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username=SOAK_USER)
+        restaurant = Restaurant.objects.create(
+            name='Stream soak', image='restaurant_images/benchmark.webp', location='1 Benchmark Street',
+            coordinates=Point(-123.1207, 49.2827, srid=4326), telephone='555-0100', owner=user,
+        )
+        try:
+            order = Order.objects.create(
+                customer=user, restaurant=restaurant, order_total=Decimal('10.00'), status='pending', order_type='takeaway',
+            )
+            Payment.objects.create(
+                order=order, payment_method='credit_card', payment_status='pending', amount_paid=Decimal('10.00'),
+                payment_gateway='stripe', transaction_id=f'pi_soak_{order.pk}',
+            )
+            asyncio.run(self.soak(order, str(AccessToken.for_user(user)), options))
+        finally:
+            restaurant.delete()
+
+    async def soak(self, order, token, options):
+        paths = (
+            f'/api/payments/orders/{order.pk}/stream/',
+            f'/api/payments/restaurants/{order.restaurant_id}/orders/stream/',
+        )
+        baseline = rss_kb()
+        clients, tasks = [], []
+        started = time.perf_counter()
+        for first in range(0, options['connections'], options['step']):
+            batch = [
+                Client(paths[index % 2], token, 10000 + index)
+                for index in range(first, min(first + options['step'], options['connections']))
+            ]
+            tasks += [asyncio.create_task(application(client.scope, client.receive, client.send)) for client in batch]
+            await asyncio.gather(*(client.opened.wait() for client in batch))
+            clients += batch
+        refused = sum(client.status != 200 for client in clients)
+        self.stdout.write(
+            f"Opened {len(clients)} streams in {time.perf_counter() - started:.1f}s ({refused} refused), "
+            f"{broker.subscriber_count()} subscribed"
+        )
+
+        held = rss_kb()
+        self.report("Open", baseline, held, len(clients))
+        for _ in range(options['hold'] // options['sample']):
+            await asyncio.sleep(options['sample'])
+            self.report("Idle", baseline, rss_kb(), len(clients))
+
+        # One status change, fanned out to every stream through NOTIFY
+        streaming = [client for client in clients if client.status == 200]
+        before = [client.events for client in streaming]
+        started = time.perf_counter()
+        order.status = 'confirmed'
+        await sync_to_async(order.save)(update_fields=['status', 'updated_at'])
+        while any(client.events == count for client, count in zip(streaming, before)):
+            await asyncio.sleep(0.01)
+        self.stdout.write(f"Status change reached {len(streaming)} streams in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+        for client in clients:
+            client.closed.set()
+        await asyncio.gather(*tasks)
+        self.report("Closed", baseline, rss_kb(), len(clients))
+        self.stdout.write(f"{broker.subscriber_count()} subscriptions left")
+
+    def report(self, label, baseline, rss, connections):
+        self.stdout.write(
+            f"{label}: RSS {rss / 1024:.1f} MB, {(rss - baseline) / connections:.1f} kB per stream"
+        )
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0008_streamticket'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stripeevent',
+            index=models.Index(condition=models.Q(('status', 'processed')), fields=['transaction_id', 'created'], name='stripe_event_processed_idx'),
+        ),
+    ]
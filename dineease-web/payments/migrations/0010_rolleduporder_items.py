@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0009_stripe_event_processed_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rolleduporder',
+            name='items',
+            field=models.JSONField(default=list),
+        ),
+        # Orders counted so far get their current items, the best record there is
+        migrations.RunSQL(
+            """
+            UPDATE payments_rolleduporder SET items = COALESCE((
+                SELECT jsonb_agg(jsonb_build_array(menu_item_id, quantity, revenue::text) ORDER BY menu_item_id)
+                FROM (
+                    SELECT menu_item_id, SUM(quantity) AS quantity, SUM(quantity * price) AS revenue
+                    FROM payments_orderitem
+                    WHERE order_id = payments_rolleduporder.order_id
+                    GROUP BY menu_item_id
+                ) AS totals
+            ), '[]'::jsonb)
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from core.models import Restaurant, Menu, AddonOption, Promo
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 class PromoUsage(models.Model):
     STATUS_CHOICES = (
@@ -46,6 +47,15 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Order listings are scoped to a customer or a restaurant and paged
+        # newest first by (created_at, id), see OrderViewSet; status is
+        # carried in the index for the ?status= filter
+        indexes = [
+            models.Index(fields=['customer', 'created_at', 'id'], include=['status'], name='order_customer_recent_idx'),
+            models.Index(fields=['restaurant', 'created_at', 'id'], include=['status'], name='order_restaurant_recent_idx'),
+        ]
+
     def __str__(self):
         return f"Order {self.id} - {self.customer}"
 
@@ -98,3 +108,129 @@ class Payment(models.Model):
 
     def __str__(self):
         return f"Payment for Order {self.order.id} - {self.payment_method}"
+
+
+class IdempotencyKey(models.Model):
+    # Stored first response of a request sent with an Idempotency-Key header,
+    # see payments.idempotency
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    path = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)  # SHA-256 of the request body
+    status_code = models.PositiveSmallIntegerField()
+    response = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'path', 'key'], name='unique_idempotency_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.path})"
+
+
+class StreamTicket(models.Model):
+    # Single-use credential for an event stream or export URL, see payments.tickets
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stream_tickets')
+    digest = models.CharField(max_length=64, unique=True)  # SHA-256 of the ticket
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Ticket for user {self.user_id} until {self.expires_at}"
+
+
+class StripeEvent(models.Model):
+    # Inbox of verified Stripe webhook events, applied by the
+    # process_stripe_events worker (see payments.stripe_events)
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('processed', 'Processed'),
+        ('ignored', 'Ignored'),
+        ('failed', 'Failed'),
+    )
+
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    transaction_id = models.CharField(max_length=255, blank=True)  # Payment intent the event is about
+    partition = models.PositiveSmallIntegerField()  # Events of one payment share a partition
+    created = models.DateTimeField()  # When Stripe created the event
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)  # Retry backoff
+    error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['partition', 'created', 'id'],
+                condition=models.Q(status='pending'),
+                name='stripe_event_pending_idx',
+            ),
+            # Latest applied event of a payment, see process_batch
+            models.Index(
+                fields=['transaction_id', 'created'],
+                condition=models.Q(status='processed'),
+                name='stripe_event_processed_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.event_id} ({self.type}) - {self.status}"
+
+
+# Sales rollups for the owner dashboards, kept up to date as orders move in
+# and out of SALES_STATUSES (see payments.rollups). Days and hours are in
+# restaurant local time, by when the order was placed.
+class SalesRollup(models.Model):
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='sales_rollups')
+    day = models.DateField()
+    hour = models.PositiveSmallIntegerField()
+    orders = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    tips = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['restaurant', 'day', 'hour'], name='unique_sales_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.restaurant_id} {self.day} {self.hour}:00 - {self.orders} orders"
+
+
+class ItemSalesRollup(models.Model):
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='item_sales_rollups')
+    day = models.DateField()
+    menu_item = models.ForeignKey(Menu, on_delete=models.CASCADE, related_name='sales_rollups')
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['restaurant', 'day', 'menu_item'], name='unique_item_sales_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.restaurant_id} {self.day} {self.menu_item_id} x {self.quantity}"
+
+
+class RolledUpOrder(models.Model):
+    # An order currently counted in the rollups, with what it added, so it
+    # is counted once however often its status changes and taken out
+    # exactly as it went in, even if its items have changed since
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, primary_key=True, related_name='rollup')
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='+')
+    day = models.DateField()
+    hour = models.PositiveSmallIntegerField()
+    revenue = models.DecimalField(max_digits=10, decimal_places=2)
+    tips = models.DecimalField(max_digits=10, decimal_places=2)
+    # [[menu_item_id, quantity, revenue], ...] as added to the item rollups
+    items = models.JSONField(default=list)
+
+    def __str__(self):
+        return f"Order {self.order_id} in {self.day} {self.hour}:00"
@@ -0,0 +1,183 @@
+"""
+Order and payment status changes pushed to the order streams (see streams.py).
+
+Changes are sent with Postgres NOTIFY once their transaction commits, so
+every worker hears them whichever worker made them. Each worker keeps one
+LISTEN connection, on a thread of its own, and fans the events out to the
+streams it holds.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+
+import psycopg2
+from django.db import connection, connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'order_events'
+
+# Events a stream may fall behind by before it is closed; the client then
+# reconnects and starts again from a fresh snapshot
+QUEUE_SIZE = 32
+
+RECONNECT_DELAY = 5  # Seconds before listening again after the connection drops
+POLL_TIMEOUT = 5  # Seconds, how often the listener checks it should keep running
+
+
+def order_topic(order_id):
+    return f'order:{order_id}'
+
+
+def restaurant_topic(restaurant_id):
+    return f'restaurant:{restaurant_id}'
+
+
+def order_event(order):
+    return {
+        'type': 'order',
+        'order_id': order.pk,
+        'restaurant_id': order.restaurant_id,
+        'customer_id': order.customer_id,
+        'status': order.status,
+        'at': timezone.now().isoformat(),
+    }
+
+
+def payment_event(payment):
+    order = payment.order
+    return {
+        'type': 'payment',
+        'order_id': order.pk,
+        'restaurant_id': order.restaurant_id,
+        'customer_id': order.customer_id,
+        'payment_id': payment.pk,
+        'payment_status': payment.payment_status,
+        'at': timezone.now().isoformat(),
+    }
+
+
+def notify(events):
+    """Send ``events`` to every listening worker in one statement."""
+    if not events:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload",
+            [CHANNEL, [json.dumps(event) for event in events]],
+        )
+
+
+def publish(events):
+    """Notify ``events`` once the current transaction commits, not if it rolls back."""
+    events = list(events)
+    if events:
+        transaction.on_commit(lambda: notify(events))
+
+
+class Subscription:
+    """The events of some topics for one stream, queued on the stream's loop."""
+
+    def __init__(self, topics):
+        self.topics = tuple(topics)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, event):
+        # Runs on self.loop
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self, timeout):
+        """The next event, None once the stream fell behind; TimeoutError when idle."""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class Broker:
+    """Fans the events heard on CHANNEL out to the subscriptions of this process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = {}
+        self.thread = None
+
+    def subscribe(self, topics):
+        subscription = Subscription(topics)
+        with self.lock:
+            for topic in subscription.topics:
+                self.subscriptions.setdefault(topic, set()).add(subscription)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.listen, name='order-events', daemon=True)
+                self.thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for topic in subscription.topics:
+                subscribers = self.subscriptions.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self.subscriptions[topic]
+
+    def subscriber_count(self):
+        with self.lock:
+            return len({subscription for subscribers in self.subscriptions.values() for subscription in subscribers})
+
+    def dispatch(self, payload):
+        event = json.loads(payload)
+        topics = (order_topic(event['order_id']), restaurant_topic(event['restaurant_id']))
+        with self.lock:
+            subscribers = {subscription for topic in topics for subscription in self.subscriptions.get(topic, ())}
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, event)
+            except RuntimeError:
+                # The stream's loop has closed; it unsubscribes on its way out
+                pass
+
+    def listen(self):
+        while True:
+            with self.lock:
+                if not self.subscriptions:
+                    self.thread = None
+                    return
+            try:
+                self.listen_once()
+            except psycopg2.Error:
+                logger.exception("Lost the %s listener connection, reconnecting", CHANNEL)
+                time.sleep(RECONNECT_DELAY)
+
+    def listen_once(self):
+        # A connection of its own: Django's are per thread and closed between requests
+        params = connections['default'].get_connection_params()
+        listener = psycopg2.connect(**params)
+        try:
+            listener.set_session(autocommit=True)
+            with listener.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL}")
+            while True:
+                with self.lock:
+                    if not self.subscriptions:
+                        return
+                if select.select([listener], [], [], POLL_TIMEOUT) == ([], [], []):
+                    continue
+                listener.poll()
+                while listener.notifies:
+                    self.dispatch(listener.notifies.pop(0).payload)
+        finally:
+            listener.close()
+
+
+broker = Broker()
@@ -0,0 +1,150 @@
+"""
+Sales rollups behind the owner dashboards.
+
+An order is counted while its status is one of SALES_STATUSES. It is added
+when it moves into them and taken out again when it leaves (e.g. when it is
+cancelled), so the dashboards read a few rollup rows per day however many
+orders a restaurant has had. The RolledUpOrder ledger makes both steps
+idempotent: only the transaction that inserts (or deletes) an order's ledger
+row changes the rollups. The ledger row keeps the order's item totals as they
+were counted, so an order is taken out of the item rollups as it went in even
+if its OrderItem rows have changed since.
+"""
+import json
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from core.hours import local_time_zone
+from core.models import Menu
+from .models import ItemSalesRollup, OrderItem, RolledUpOrder, SalesRollup
+
+SALES_STATUSES = ('confirmed', 'preparing', 'delivered')
+
+
+def bucket(order):
+    """The local ``(day, hour)`` an order is counted in."""
+    local = timezone.localtime(order.created_at, local_time_zone())
+    return local.date(), local.hour
+
+
+def execute_values(sql, rows, suffix='', template=None):
+    """
+    Run ``sql VALUES (...), (...) suffix`` for ``rows``, returning what it
+    returns. ``template`` is the placeholders of one row, e.g. to cast them.
+    """
+    if not rows:
+        return []
+    template = template or '(' + ', '.join(['%s'] * len(rows[0])) + ')'
+    values = ', '.join([template] * len(rows))
+    with connection.cursor() as cursor:
+        cursor.execute(f"{sql} VALUES {values} {suffix}", [value for row in rows for value in row])
+        return cursor.fetchall() if cursor.description else []
+
+
+def add_to_rollups(sales, items, sign):
+    """
+    Add (``sign=1``) or take out (``sign=-1``) ``sales``, keyed by
+    ``(restaurant_id, day, hour)`` with ``[orders, revenue, tips]``, and
+    ``items``, keyed by ``(restaurant_id, day, menu_item_id)`` with
+    ``[quantity, revenue]``: one upsert per table.
+    """
+    table = SalesRollup._meta.db_table
+    execute_values(
+        f"INSERT INTO {table} (restaurant_id, day, hour, orders, revenue, tips)",
+        [(*key, sign * orders, sign * revenue, sign * tips) for key, (orders, revenue, tips) in sales.items()],
+        f"ON CONFLICT (restaurant_id, day, hour) DO UPDATE SET "
+        f"orders = {table}.orders + EXCLUDED.orders, "
+        f"revenue = {table}.revenue + EXCLUDED.revenue, "
+        f"tips = {table}.tips + EXCLUDED.tips",
+    )
+    table = ItemSalesRollup._meta.db_table
+    execute_values(
+        f"INSERT INTO {table} (restaurant_id, day, menu_item_id, quantity, revenue)",
+        [(*key, sign * quantity, sign * revenue) for key, (quantity, revenue) in items.items()],
+        f"ON CONFLICT (restaurant_id, day, menu_item_id) DO UPDATE SET "
+        f"quantity = {table}.quantity + EXCLUDED.quantity, "
+        f"revenue = {table}.revenue + EXCLUDED.revenue",
+    )
+
+
+def item_totals(order_ids):
+    """The ``[[menu_item_id, quantity, revenue], ...]`` of each order in ``order_ids``, by order id."""
+    items = defaultdict(list)
+    rows = (
+        OrderItem.objects.filter(order_id__in=order_ids)
+        .values('order_id', 'menu_item_id')
+        .annotate(quantity=Sum('quantity'), revenue=Sum(F('quantity') * F('price')))
+        .order_by('order_id', 'menu_item_id')
+    )
+    for row in rows:
+        items[row['order_id']].append([row['menu_item_id'], row['quantity'], str(row['revenue'])])
+    return items
+
+
+def count_orders(orders):
+    """Add ``orders`` to the rollups unless already counted. Returns how many were added."""
+    items = item_totals([order.pk for order in orders])
+    rows = []
+    for order in orders:
+        day, hour = bucket(order)
+        rows.append((order.pk, order.restaurant_id, day, hour, order.order_total, order.tip, json.dumps(items[order.pk])))
+    inserted = {pk for pk, in execute_values(
+        f"INSERT INTO {RolledUpOrder._meta.db_table} (order_id, restaurant_id, day, hour, revenue, tips, items)",
+        rows, "ON CONFLICT (order_id) DO NOTHING RETURNING order_id",
+        template='(%s, %s, %s, %s, %s, %s, %s::jsonb)',
+    )}
+    added = [row for row in rows if row[0] in inserted]
+    apply_ledger_rows(added, sign=1)
+    return len(added)
+
+
+def uncount_orders(order_ids):
+    """Take ``order_ids`` out of the rollups where counted. Returns how many were."""
+    if not order_ids:
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {RolledUpOrder._meta.db_table} WHERE order_id = ANY(%s) "
+            f"RETURNING order_id, restaurant_id, day, hour, revenue, tips, items",
+            [list(order_ids)],
+        )
+        removed = cursor.fetchall()
+    apply_ledger_rows(removed, sign=-1)
+    return len(removed)
+
+
+def apply_ledger_rows(rows, sign):
+    if not rows:
+        return
+    sales = defaultdict(lambda: [0, Decimal(0), Decimal(0)])
+    items = defaultdict(lambda: [0, Decimal(0)])
+    for _, restaurant_id, day, hour, revenue, tips, order_items in rows:
+        totals = sales[(restaurant_id, day, hour)]
+        totals[0] += 1
+        totals[1] += Decimal(revenue)
+        totals[2] += Decimal(tips)
+        # Read back raw, jsonb comes as text
+        if isinstance(order_items, str):
+            order_items = json.loads(order_items)
+        for menu_item_id, quantity, item_revenue in order_items:
+            totals = items[(restaurant_id, day, menu_item_id)]
+            totals[0] += quantity
+            totals[1] += Decimal(item_revenue)
+    if sign < 0:
+        # Rollups of menu items deleted since went with them
+        existing = set(Menu.objects.filter(pk__in={key[2] for key in items}).values_list('pk', flat=True))
+        items = {key: totals for key, totals in items.items() if key[2] in existing}
+    add_to_rollups(sales, items, sign)
+
+
+def sync_order_rollup(order):
+    """Count or stop counting ``order`` according to its status."""
+    with transaction.atomic():
+        if order.status in SALES_STATUSES:
+            count_orders([order])
+        else:
+            uncount_orders([order.pk])
@@ -1,21 +1,23 @@
 from rest_framework import serializers
 from .models import Order, OrderItem, Payment
 from core.models import Menu, AddonOption
+from decimal import Decimal
 
 class OrderItemSerializer(serializers.ModelSerializer):
     menu_item = serializers.StringRelatedField()
 
     class Meta:
         model = OrderItem
-        fields = ['menu_item', 'quantity', 'price', 'addon_options', 'subtotal']
+        fields = ['menu_item', 'quantity', 'price', 'subtotal']
 
 class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(source='orderitem_set', many=True)
     restaurant = serializers.StringRelatedField()
+    payment_status = serializers.CharField(source='payment.payment_status', read_only=True)  # None before a payment exists
 
     class Meta:
         model = Order
-        fields = ['id', 'customer', 'restaurant', 'items', 'order_total', 'status', 'order_time', 'delivery_address', 'is_delivery', 'order_type', 'tax', 'tip']
+        fields = ['id', 'customer', 'restaurant', 'items', 'order_total', 'status', 'payment_status', 'order_time', 'delivery_address', 'is_delivery', 'order_type', 'tax', 'tip', 'created_at']
 
 class PaymentSerializer(serializers.ModelSerializer):
     order = serializers.StringRelatedField()
@@ -23,3 +25,22 @@ class PaymentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Payment
         fields = ['id', 'order', 'payment_method', 'payment_status', 'transaction_id', 'amount_paid', 'payment_date', 'payment_gateway', 'is_refunded', 'refund_amount']
+
+class SalesBucketSerializer(serializers.Serializer):
+    day = serializers.DateField(required=False)  # Local day, absent from the totals
+    hour = serializers.IntegerField(required=False)  # Local hour, when grouped by hour
+    orders = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+    tips = serializers.DecimalField(max_digits=14, decimal_places=2)
+    average_ticket = serializers.SerializerMethodField()
+
+    def get_average_ticket(self, obj):
+        if not obj['orders']:
+            return None
+        return str((obj['revenue'] / obj['orders']).quantize(Decimal('0.01')))
+
+class TopItemSerializer(serializers.Serializer):
+    menu_item = serializers.IntegerField(source='menu_item_id')
+    name = serializers.CharField(source='menu_item__name')
+    quantity = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
@@ -0,0 +1,50 @@
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from core.promos import forget_redeemed_promos
+from .models import Order, Payment, PromoUsage
+from .order_events import order_event, payment_event, publish
+from .rollups import SALES_STATUSES, sync_order_rollup, uncount_orders
+
+
+@receiver(post_save, sender=PromoUsage)
+@receiver(post_delete, sender=PromoUsage)
+def promo_usage_changed(sender, instance, **kwargs):
+    # Recomputed from the table on the next read, once the change is visible
+    transaction.on_commit(lambda: forget_redeemed_promos(instance.customer_id))
+
+
+# The status an instance was loaded with (read without loading deferred fields),
+# so saves that leave it alone are neither streamed nor rolled up
+@receiver(post_init, sender=Order)
+def remember_order_status(sender, instance, **kwargs):
+    instance._saved_status = instance.__dict__.get('status')
+
+
+@receiver(post_init, sender=Payment)
+def remember_payment_status(sender, instance, **kwargs):
+    instance._saved_status = instance.__dict__.get('payment_status')
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, created, **kwargs):
+    if created or instance.status != instance._saved_status:
+        instance._saved_status = instance.status
+        publish([order_event(instance)])
+        # New orders are pending, so only count the rare one created confirmed
+        if not created or instance.status in SALES_STATUSES:
+            sync_order_rollup(instance)
+
+
+@receiver(pre_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    # Before the cascade removes its items and ledger row, which the rollups are taken out by
+    uncount_orders([instance.pk])
+
+
+@receiver(post_save, sender=Payment)
+def payment_saved(sender, instance, created, **kwargs):
+    if created or instance.payment_status != instance._saved_status:
+        instance._saved_status = instance.payment_status
+        publish([payment_event(instance)])
@@ -0,0 +1,112 @@
+"""
+Server-sent event streams of order and payment status changes, one per order
+for its customer and one per restaurant for its owner.
+
+The views are async, so an idle stream holds no thread; serve them with an
+ASGI server (see command.sh). EventSource cannot set headers, so a stream
+ticket may be given as ``?ticket=`` instead (see payments.tickets).
+"""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from core.authentication import PrincipalAuthentication
+from core.models import Restaurant
+from .models import Order, Payment
+from .order_events import broker, order_event, order_topic, payment_event, restaurant_topic
+from .tickets import redeem_ticket
+
+HEARTBEAT = 20  # Seconds between comments keeping idle streams and proxies alive
+RETRY = 3000  # Milliseconds browsers wait before reconnecting
+
+
+def format_event(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+def authenticate(request):
+    """The user of the request's access token, or of its ``?ticket=``; None when neither is valid."""
+    authentication = PrincipalAuthentication()
+    header = authentication.get_header(request)
+    if header is None:
+        ticket = request.GET.get('ticket')
+        return redeem_ticket(ticket) if ticket else None
+    raw_token = authentication.get_raw_token(header)
+    if not raw_token:
+        return None
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (AuthenticationFailed, InvalidToken, TokenError):
+        return None
+
+
+async def event_stream(subscription, snapshot):
+    try:
+        yield f"retry: {RETRY}\n\n"
+        for event in snapshot:
+            yield format_event(event)
+        while True:
+            try:
+                event = await subscription.get(HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if event is None:
+                # Fell too far behind; the client reconnects and gets a new snapshot
+                return
+            yield format_event(event)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def stream_response(subscription, snapshot=()):
+    response = StreamingHttpResponse(event_stream(subscription, snapshot), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Sent on as written by nginx
+    return response
+
+
+def load_order(order_id):
+    order = Order.objects.select_related('restaurant').filter(pk=order_id).first()
+    payment = Payment.objects.filter(order_id=order_id).first() if order else None
+    if payment is not None:
+        payment.order = order
+    return order, payment
+
+
+async def order_stream(request, order_id):
+    """Status changes of one order and its payment, starting with their current status."""
+    user = await sync_to_async(authenticate)(request)
+    if user is None:
+        return JsonResponse({"error": "Authentication required"}, status=401)
+
+    # Subscribed before reading the snapshot, so no change falls in between
+    subscription = broker.subscribe([order_topic(order_id)])
+    order, payment = await sync_to_async(load_order)(order_id)
+    if order is None or user.pk not in (order.customer_id, order.restaurant.owner_id) and not user.is_staff:
+        broker.unsubscribe(subscription)
+        return JsonResponse({"error": "Order not found"}, status=404)
+
+    snapshot = [order_event(order)]
+    if payment is not None:
+        snapshot.append(payment_event(payment))
+    return stream_response(subscription, snapshot)
+
+
+async def restaurant_order_stream(request, restaurant_id):
+    """
+    Status changes of every order of a restaurant, new orders included.
+    Clients reload the order list when they (re)connect.
+    """
+    user = await sync_to_async(authenticate)(request)
+    if user is None:
+        return JsonResponse({"error": "Authentication required"}, status=401)
+
+    owner_id = await Restaurant.objects.filter(pk=restaurant_id).values_list('owner_id', flat=True).afirst()
+    if owner_id is None or owner_id != user.pk and not user.is_staff:
+        return JsonResponse({"error": "Restaurant not found"}, status=404)
+    return stream_response(broker.subscribe([restaurant_topic(restaurant_id)]))
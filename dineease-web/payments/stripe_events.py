@@ -0,0 +1,128 @@
+import hashlib
+import hmac
+import time
+import zlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Payment, StripeEvent
+from .order_events import payment_event, publish
+
+# Events are spread over partitions by payment, and every worker owns a set
+# of partitions, so the events of one payment are applied by one worker in
+# the order Stripe created them.
+PARTITIONS = 64
+
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 30  # Seconds, times the number of attempts so far
+
+# Payment status each handled event type moves the payment to
+PAYMENT_STATUS_BY_EVENT = {
+    'payment_intent.succeeded': 'completed',
+    'charge.refunded': 'refunded',
+}
+
+
+def event_transaction_id(event):
+    """The payment intent id an event is about, '' when there is none."""
+    obj = event['data']['object']
+    if obj.get('object') == 'payment_intent':
+        return obj.get('id') or ''
+    return obj.get('payment_intent') or ''
+
+
+def partition_for(transaction_id):
+    return zlib.crc32(transaction_id.encode()) % PARTITIONS
+
+
+def record_events(events):
+    """
+    Store verified events in the inbox. Redeliveries of an event id already
+    stored are dropped by the unique constraint.
+    """
+    rows = []
+    for event in events:
+        transaction_id = event_transaction_id(event)
+        rows.append(StripeEvent(
+            event_id=event['id'],
+            type=event['type'],
+            transaction_id=transaction_id,
+            partition=partition_for(transaction_id),
+            created=datetime.fromtimestamp(event['created'], tz=dt_timezone.utc),
+            payload=event,
+        ))
+    StripeEvent.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+def process_batch(partitions=None, batch_size=500):
+    """
+    Apply up to ``batch_size`` pending events of ``partitions`` (all when
+    None) in one transaction: one locked fetch of the events, one of their
+    payments by transaction_id and one bulk update of each.
+
+    Rows locked by another worker are skipped. An event older than one
+    already applied to its payment, e.g. one retried while the payment was
+    missing, is ignored rather than setting an outdated status. Returns the
+    number of events handled.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        pending = StripeEvent.objects.filter(status='pending', available_at__lte=now)
+        if partitions is not None:
+            pending = pending.filter(partition__in=partitions)
+        events = list(pending.select_for_update(skip_locked=True).order_by('created', 'id')[:batch_size])
+        if not events:
+            return 0
+
+        transaction_ids = {event.transaction_id for event in events if event.type in PAYMENT_STATUS_BY_EVENT}
+        payments = (
+            Payment.objects.select_related('order').select_for_update(of=('self',))
+            .in_bulk(transaction_ids, field_name='transaction_id')
+        )
+        # When the latest event applied to each payment was created
+        applied = dict(
+            StripeEvent.objects.filter(transaction_id__in=transaction_ids, status='processed')
+            .values('transaction_id').annotate(latest=Max('created')).values_list('transaction_id', 'latest')
+        ) if transaction_ids else {}
+
+        changed = {}
+        for event in events:
+            payment_status = PAYMENT_STATUS_BY_EVENT.get(event.type)
+            payment = payments.get(event.transaction_id)
+            if payment_status is None:
+                event.status = 'ignored'
+            elif payment is not None and event.created < applied.get(event.transaction_id, event.created):
+                event.status = 'ignored'
+                event.error = "Superseded by a newer event"
+            elif payment is not None:
+                payment.payment_status = payment_status
+                payment.updated_at = now
+                changed[payment.pk] = payment
+                event.status = 'processed'
+                applied[event.transaction_id] = event.created
+            else:
+                # The order creating the payment may not have committed yet
+                event.attempts += 1
+                event.error = "Payment not found"
+                if event.attempts >= MAX_ATTEMPTS:
+                    event.status = 'failed'
+                else:
+                    event.available_at = now + timedelta(seconds=RETRY_DELAY * event.attempts)
+            if event.status != 'pending':
+                event.processed_at = now
+
+        Payment.objects.bulk_update(changed.values(), ['payment_status', 'updated_at'])
+        # bulk_update sends no post_save, so the streams are told here
+        publish(payment_event(payment) for payment in changed.values())
+        StripeEvent.objects.bulk_update(events, ['status', 'attempts', 'available_at', 'error', 'processed_at'])
+    return len(events)
+
+
+def sign_payload(payload, secret, timestamp=None):
+    """A Stripe-Signature header for ``payload``, for tests and benchmarks."""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signature = hmac.new(secret.encode(), f'{timestamp}.{payload}'.encode(), hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={signature}'
@@ -1,3 +1,540 @@
-from django.test import TestCase
+import csv
+import io
+import itertools
+import json
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import OperationalError
+from django.test import AsyncClient, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.menu_tree import get_menu_tree
+from core.models import UserProfile
+from core.tests import create_restaurant
+from .models import IdempotencyKey, ItemSalesRollup, Order, OrderItem, Payment, PromoUsage, RolledUpOrder, SalesRollup, StripeEvent
+from .order_events import broker
+from .tickets import issue_ticket
+from .stripe_events import process_batch, sign_payload
+
+transaction_ids = itertools.count()
+
+
+def order_payload(restaurant, menus, items, promo=None):
+    return {
+        'restaurant_id': restaurant.pk,
+        'promo_id': promo.pk if promo else None,
+        'order_total': '100.00',
+        'is_delivery': False,
+        'order_type': 'takeaway',
+        'tax': '5.00',
+        'tip': '0.00',
+        'menu_items': [
+            {'menu_item_id': menus[index % len(menus)].pk, 'quantity': 1} for index in range(items)
+        ],
+        'payment': {
+            'payment_method': 'credit_card',
+            'amount_paid': '105.00',
+            'payment_gateway': 'stripe',
+            'transaction_id': f'txn_{next(transaction_ids)}',
+        },
+    }
+
+
+class CreateOrderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user('customer', password='password')
+        cls.restaurant = create_restaurant(User.objects.create_user('owner', password='password'), 'First', menus=3)
+        cls.menus = list(cls.restaurant.menus.order_by('pk'))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+        get_menu_tree(self.restaurant.pk)
+
+    def create_order(self, items, promo=None):
+        return self.client.post('/api/payments/orders/create/', order_payload(self.restaurant, self.menus, items, promo), format='json')
+
+    def test_query_budget_does_not_grow_with_the_cart(self):
+        for items in (1, 20):
+            # Savepoint, order, items, payment, release
+            with self.assertNumQueries(5):
+                response = self.create_order(items)
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(OrderItem.objects.filter(order_id=response.data['order_id']).count(), items)
+
+    def test_query_budget_with_promo(self):
+        promo = self.restaurant.promos.get()
+        # Promo and redeemed promo ids, then the writes plus the promo usage
+        # and the usage counter
+        with self.assertNumQueries(2 + 7):
+            response = self.create_order(20, promo)
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(PromoUsage.objects.filter(promo=promo, customer=self.customer, status='pending').exists())
+
+    def test_unknown_item_writes_nothing(self):
+        payload = order_payload(self.restaurant, self.menus, 2)
+        payload['menu_items'][1]['menu_item_id'] = 0
+        response = self.client.post('/api/payments/orders/create/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_usage_limit(self):
+        promo = self.restaurant.promos.get()
+        promo.usage_limit = 1
+        promo.save()
+        self.assertEqual(self.create_order(1, promo).status_code, 201)
+
+        other = User.objects.create_user('other', password='password')
+        self.client.force_authenticate(other)
+        response = self.create_order(1, promo)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.filter(customer=other).exists())
+        promo.refresh_from_db()
+        self.assertEqual(promo.usage_count, 1)
+
+
+class IdempotencyKeyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user('customer', password='password')
+        cls.restaurant = create_restaurant(User.objects.create_user('owner', password='password'), 'First', menus=2)
+        cls.menus = list(cls.restaurant.menus.order_by('pk'))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+        self.payload = order_payload(self.restaurant, self.menus, 3)
+
+    def post(self, payload, key='checkout-1'):
+        return self.client.post('/api/payments/orders/create/', payload, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_is_replayed_from_the_cache(self):
+        first = self.post(self.payload)
+        self.assertEqual(first.status_code, 201)
+
+        with self.assertNumQueries(0):
+            retry = self.post(self.payload)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data['order_id'], first.data['order_id'])
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_replayed_from_the_database_after_a_cache_flush(self):
+        first = self.post(self.payload)
+        cache.clear()
+        self.assertEqual(self.post(self.payload).data['order_id'], first.data['order_id'])
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_reused_for_another_request(self):
+        self.post(self.payload)
+        other = order_payload(self.restaurant, self.menus, 1)
+        self.assertEqual(self.post(other).status_code, 422)
+
+    def test_keys_are_per_user(self):
+        self.post(self.payload)
+        self.client.force_authenticate(User.objects.create_user('other', password='password'))
+        self.assertEqual(self.post(order_payload(self.restaurant, self.menus, 3)).status_code, 201)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_with_a_login_token(self):
+        # A token from /api/login/ authenticates as a Principal, not a User row
+        User.objects.create_user('checkout', email='checkout@example.com', password='password')
+        login = self.client.post('/api/login/', {'identifier': 'checkout@example.com', 'password': 'password'}, format='json')
+        self.client.force_authenticate(None)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {login.data['access']}")
+
+        first = self.post(self.payload)
+        self.assertEqual(first.status_code, 201)
+        cache.clear()
+        self.assertEqual(self.post(self.payload).data['order_id'], first.data['order_id'])
+        self.assertEqual(IdempotencyKey.objects.get().user.username, 'checkout')
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET='whsec_test')
+class StripeWebhookTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        customer = User.objects.create_user('customer', password='password')
+        restaurant = create_restaurant(User.objects.create_user('owner', password='password'), 'First', menus=1)
+        order = Order.objects.create(customer=customer, restaurant=restaurant, order_total='20.00', status='pending', order_type='takeaway')
+        cls.payment = Payment.objects.create(
+            order=order, payment_method='credit_card', payment_status='pending', amount_paid='20.00',
+            payment_gateway='stripe', transaction_id='pi_123',
+        )
+
+    def deliver(self, event_id, event_type, obj, created=1700000000):
+        payload = json.dumps({'id': event_id, 'type': event_type, 'created': created, 'data': {'object': obj}})
+        return self.client.post(
+            '/api/payments/stripe/webhook/', payload, content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=sign_payload(payload, 'whsec_test'),
+        )
+
+    def test_bad_signature_is_rejected(self):
+        response = self.client.post(
+            '/api/payments/stripe/webhook/', '{}', content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=sign_payload('{}', 'whsec_other'),
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    def test_redelivery_is_stored_once(self):
+        for _ in range(2):
+            response = self.deliver('evt_1', 'payment_intent.succeeded', {'object': 'payment_intent', 'id': 'pi_123'})
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(StripeEvent.objects.count(), 1)
+        # Acknowledged only, applied by the worker
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.payment_status, 'pending')
+
+    def test_events_are_applied_in_order_in_one_batch(self):
+        self.deliver('evt_2', 'charge.refunded', {'object': 'charge', 'payment_intent': 'pi_123'}, created=1700000100)
+        self.deliver('evt_1', 'payment_intent.succeeded', {'object': 'payment_intent', 'id': 'pi_123'}, created=1700000000)
+        self.deliver('evt_3', 'customer.created', {'object': 'customer', 'id': 'cus_1'})
+
+        # Events, payments, latest applied events, payment update, event update
+        with self.assertNumQueries(5 + 2):
+            self.assertEqual(process_batch(), 3)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.payment_status, 'refunded')
+        self.assertEqual(
+            dict(StripeEvent.objects.values_list('event_id', 'status')),
+            {'evt_1': 'processed', 'evt_2': 'processed', 'evt_3': 'ignored'},
+        )
+
+    def test_older_event_does_not_overwrite_a_newer_status(self):
+        self.deliver('evt_2', 'charge.refunded', {'object': 'charge', 'payment_intent': 'pi_123'}, created=1700000100)
+        process_batch()
+        # Created first but applied last, e.g. retried while the payment was missing
+        self.deliver('evt_1', 'payment_intent.succeeded', {'object': 'payment_intent', 'id': 'pi_123'}, created=1700000000)
+        process_batch()
+
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.payment_status, 'refunded')
+        self.assertEqual(StripeEvent.objects.get(event_id='evt_1').status, 'ignored')
+
+    def test_worker_recovers_from_a_failed_batch(self):
+        output = io.StringIO()
+        batches = mock.Mock(side_effect=[OperationalError("server closed the connection"), 1, 0])
+        with mock.patch('payments.stripe_events.process_batch', batches), \
+                self.assertLogs('payments.management.commands.process_stripe_events', 'ERROR'):
+            call_command('process_stripe_events', workers=1, once=True, idle_sleep=0, stdout=output)
+        self.assertEqual(batches.call_count, 3)
+        self.assertIn("Processed 1 Stripe events.", output.getvalue())
+
+    def test_unknown_payment_is_retried(self):
+        self.deliver('evt_1', 'payment_intent.succeeded', {'object': 'payment_intent', 'id': 'pi_missing'})
+        process_batch()
+        event = StripeEvent.objects.get()
+        self.assertEqual((event.status, event.attempts), ('pending', 1))
+        self.assertGreater(event.available_at, timezone.now())
+
+
+class OrderStreamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user('customer', password='password')
+        cls.owner = User.objects.create_user('owner', password='password')
+        restaurant = create_restaurant(cls.owner, 'First', menus=1)
+        cls.order = Order.objects.create(customer=cls.customer, restaurant=restaurant, order_total='20.00', status='pending', order_type='takeaway')
+
+    def test_status_changes_are_notified_on_commit(self):
+        order = Order.objects.get(pk=self.order.pk)
+        with mock.patch('payments.order_events.notify') as notify:
+            with self.captureOnCommitCallbacks(execute=True):
+                order.special_instructions = 'No onions'
+                order.save()
+            notify.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                order.status = 'confirmed'
+                order.save()
+        [events], _ = notify.call_args
+        self.assertEqual(
+            [(event['type'], event['order_id'], event['restaurant_id'], event['status']) for event in events],
+            [('order', order.pk, order.restaurant_id, 'confirmed')],
+        )
+
+    def test_only_the_customer_and_the_owner_may_listen(self):
+        stranger = User.objects.create_user('stranger', password='password')
+        subscribers = broker.subscriber_count()
+        path = f'/api/payments/orders/{self.order.pk}/stream/'
+        self.assertEqual(self.client.get(path).status_code, 401)
+        self.assertEqual(self.client.get(path, {'ticket': issue_ticket(stranger.pk)}).status_code, 404)
+        self.assertEqual(
+            self.client.get(f'/api/payments/restaurants/{self.order.restaurant_id}/orders/stream/', {'ticket': issue_ticket(self.customer.pk)}).status_code,
+            404,
+        )
+        self.assertEqual(broker.subscriber_count(), subscribers)
+
+    def test_tickets_are_single_use_and_short_lived(self):
+        # The customer's stream of another restaurant: 404 once authenticated
+        path = f'/api/payments/restaurants/{self.order.restaurant_id}/orders/stream/'
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        response = client.post('/api/payments/stream-tickets/')
+        self.assertEqual(response.status_code, 201)
+        ticket = response.data['ticket']
+
+        self.assertEqual(self.client.get(path, {'ticket': ticket}).status_code, 404)
+        self.assertEqual(self.client.get(path, {'ticket': ticket}).status_code, 401)
+
+        ticket = issue_ticket(self.customer.pk)
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(minutes=1)):
+            self.assertEqual(self.client.get(path, {'ticket': ticket}).status_code, 401)
+
+        # Access tokens are only accepted in the Authorization header
+        self.assertEqual(self.client.get(path, {'token': str(AccessToken.for_user(self.customer))}).status_code, 401)
+
+    async def test_stream_starts_with_the_current_status(self):
+        response = await AsyncClient().get(
+            f'/api/payments/orders/{self.order.pk}/stream/', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.customer)}',
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = aiter(response.streaming_content)
+        self.assertTrue((await anext(content)).startswith(b'retry: '))
+        event = await anext(content)
+        self.assertTrue(event.startswith(b'event: order\n'))
+        self.assertEqual(json.loads(event.split(b'data: ')[1])['status'], 'pending')
+        await content.aclose()
+
+
+class OrderListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user('customer', password='password')
+        UserProfile.objects.create(user=cls.customer, phone='555-0101', address='1 Main St', city='Vancouver')
+        cls.owner = User.objects.create_user('owner', password='password')
+        UserProfile.objects.create(user=cls.owner, phone='555-0102', address='2 Main St', city='Vancouver', type_of_user='restaurant_owner')
+        cls.restaurant = create_restaurant(cls.owner, 'First', menus=2)
+        other = create_restaurant(User.objects.create_user('other', password='password'), 'Second', menus=1)
+        menus = list(cls.restaurant.menus.all())
+
+        orders = Order.objects.bulk_create(
+            Order(
+                customer=cls.customer, restaurant=cls.restaurant, order_total='20.00', order_type='takeaway',
+                status='cancelled' if index % 10 == 0 else 'pending',
+            )
+            for index in range(60)
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, menu_item=menu, price=menu.cost) for order in orders for menu in menus
+        )
+        Payment.objects.bulk_create(
+            Payment(
+                order=order, payment_method='credit_card', payment_status='pending', amount_paid='20.00',
+                payment_gateway='stripe', transaction_id=f'pi_list_{order.pk}',
+            )
+            for order in orders
+        )
+        Order.objects.create(
+            customer=User.objects.create_user('someone', password='password'), restaurant=other,
+            order_total='20.00', status='pending', order_type='takeaway',
+        )
+
+    def list(self, user, **params):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.get('/api/payments/router/orders/', params)
+
+    def test_page_costs_the_same_queries_whatever_its_size(self):
+        # Profile, orders with restaurant and payment, items with menu
+        with self.assertNumQueries(3):
+            response = self.list(self.customer)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 50)
+        first = response.data['results'][0]
+        self.assertEqual((first['restaurant'], first['payment_status'], len(first['items'])), ('First', 'pending', 2))
+
+    def test_pages_run_newest_first_without_overlap(self):
+        first = self.list(self.owner)
+        second = APIClient()
+        second.force_authenticate(self.owner)
+        second = second.get(first.data['next'])
+        ids = [order['id'] for order in first.data['results'] + second.data['results']]
+        self.assertEqual(ids, sorted(ids, reverse=True))
+        self.assertEqual(len(set(ids)), 60)
+        self.assertIsNone(second.data['next'])
+
+    def test_orders_are_scoped_to_the_user(self):
+        stranger = User.objects.create_user('stranger', password='password')
+        UserProfile.objects.create(user=stranger, phone='555-0103', address='3 Main St', city='Vancouver')
+        self.assertEqual(self.list(stranger).data['results'], [])
+        owned = {order['restaurant'] for order in self.list(self.owner, page_size=100).data['results']}
+        self.assertEqual(owned, {'First'})
+
+    def test_filters(self):
+        response = self.list(self.customer, status='cancelled', created_after=(timezone.now() - timedelta(days=1)).isoformat())
+        self.assertEqual(len(response.data['results']), 6)
+        self.assertEqual(self.list(self.customer, status='lost').status_code, 400)
+        self.assertEqual(self.list(self.customer, created_before='yesterday').status_code, 400)
+
+
+class SalesRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='password')
+        cls.restaurant = create_restaurant(cls.owner, 'First', menus=2)
+        cls.menus = list(cls.restaurant.menus.order_by('pk'))
+        customer = User.objects.create_user('customer', password='password')
+        cls.orders = []
+        for quantity in (1, 2, 3):
+            order = Order.objects.create(
+                customer=customer, restaurant=cls.restaurant, order_total=Decimal('20.00'), tip=Decimal('2.00'),
+                status='pending', order_type='takeaway',
+            )
+            OrderItem.objects.bulk_create(
+                OrderItem(order=order, menu_item=menu, quantity=quantity, price=menu.cost) for menu in cls.menus
+            )
+            cls.orders.append(order)
+
+    def set_status(self, order, status):
+        order = Order.objects.get(pk=order.pk)
+        order.status = status
+        order.save()
+
+    def rollups(self):
+        return (
+            list(SalesRollup.objects.values_list('day', 'hour', 'orders', 'revenue', 'tips').order_by('day', 'hour')),
+            sorted(ItemSalesRollup.objects.values_list('day', 'menu_item', 'quantity', 'revenue')),
+        )
+
+    def test_orders_are_counted_while_they_are_sales(self):
+        for status in ('confirmed', 'preparing', 'delivered'):
+            self.set_status(self.orders[0], status)
+        self.set_status(self.orders[1], 'confirmed')
+        self.set_status(self.orders[2], 'cancelled')
+
+        [(_, _, orders, revenue, tips)], items = self.rollups()
+        self.assertEqual((orders, revenue, tips), (2, Decimal('40.00'), Decimal('4.00')))
+        self.assertEqual([quantity for _, _, quantity, _ in items], [3, 3])
+
+        self.set_status(self.orders[1], 'cancelled')
+        [(_, _, orders, revenue, _)], items = self.rollups()
+        self.assertEqual((orders, revenue), (1, Decimal('20.00')))
+        self.assertEqual([quantity for _, _, quantity, _ in items], [1, 1])
+        self.assertEqual(list(RolledUpOrder.objects.values_list('order', flat=True)), [self.orders[0].pk])
+
+    def test_deleted_orders_are_taken_out(self):
+        self.set_status(self.orders[0], 'confirmed')
+        self.set_status(self.orders[1], 'delivered')
+
+        Order.objects.get(pk=self.orders[1].pk).delete()
+        [(_, _, orders, revenue, tips)], items = self.rollups()
+        self.assertEqual((orders, revenue, tips), (1, Decimal('20.00'), Decimal('2.00')))
+        self.assertEqual([quantity for _, _, quantity, _ in items], [1, 1])
+
+        # Orders that were never counted leave the rollups alone
+        Order.objects.filter(pk=self.orders[2].pk).delete()
+        self.assertEqual(self.rollups()[0][0][2], 1)
+
+    def test_orders_are_taken_out_as_they_were_counted(self):
+        self.set_status(self.orders[1], 'confirmed')
+        # Items edited after the order was counted
+        items = OrderItem.objects.filter(order=self.orders[1])
+        items.filter(menu_item=self.menus[0]).update(quantity=5)
+        items.filter(menu_item=self.menus[1]).delete()
+
+        self.set_status(self.orders[1], 'cancelled')
+        self.assertEqual(self.rollups()[0][0][2], 0)
+        self.assertEqual([(quantity, revenue) for _, _, quantity, revenue in self.rollups()[1]], [(0, Decimal('0.00'))] * 2)
+
+    def test_rebuild_matches_the_incremental_rollups(self):
+        self.set_status(self.orders[0], 'confirmed')
+        self.set_status(self.orders[2], 'delivered')
+        incremental = self.rollups()
+
+        # Changes the signals did not see, e.g. bulk updates
+        Order.objects.filter(pk=self.orders[1].pk).update(status='confirmed')
+        Order.objects.filter(pk=self.orders[2].pk).update(status='cancelled')
+        call_command('rebuild_sales_rollups', chunk_size=1, stdout=io.StringIO())
+        caught_up = self.rollups()
+        self.assertNotEqual(caught_up, incremental)
+
+        call_command('rebuild_sales_rollups', rebuild=True, stdout=io.StringIO())
+        self.assertEqual(self.rollups(), caught_up)
+
+    def test_dashboard_reads_only_the_rollups(self):
+        for order in self.orders:
+            self.set_status(order, 'confirmed')
+        client = APIClient()
+        client.force_authenticate(self.owner)
+
+        # Restaurant, totals, buckets, top items
+        with self.assertNumQueries(4):
+            response = client.get(f'/api/payments/restaurants/{self.restaurant.pk}/sales/', {'group': 'hour', 'top': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['totals']['orders'], 3)
+        self.assertEqual(response.data['totals']['average_ticket'], '20.00')
+        self.assertEqual(len(response.data['buckets']), 1)
+        self.assertEqual([item['quantity'] for item in response.data['top_items']], [6])
+
+        client.force_authenticate(User.objects.create_user('stranger', password='password'))
+        self.assertEqual(client.get(f'/api/payments/restaurants/{self.restaurant.pk}/sales/').status_code, 404)
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='password')
+        restaurant = create_restaurant(cls.owner, 'First', menus=1)
+        other = create_restaurant(User.objects.create_user('other', password='password'), 'Second', menus=1)
+        customer = User.objects.create_user('customer', password='password')
+        for index, owned_by in enumerate((restaurant, restaurant, other)):
+            order = Order.objects.create(customer=customer, restaurant=owned_by, order_total='20.00', status='delivered', order_type='takeaway')
+            Payment.objects.create(
+                order=order, payment_method='credit_card', payment_status='completed', amount_paid='20.00',
+                payment_gateway='stripe', transaction_id=f'pi_export_{index}',
+            )
+
+    async def export(self, kind, user, **params):
+        response = await AsyncClient().get(
+            f'/api/payments/exports/{kind}/', params, HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}',
+        )
+        if not response.streaming:
+            return response, None
+        return response, b''.join([block async for block in response.streaming_content]).decode()
+
+    async def test_owner_exports_their_orders_as_csv(self):
+        response, content = await self.export('orders', self.owner)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        header, *rows = csv.reader(io.StringIO(content))
+        self.assertEqual(header[:2], ['id', 'created_at'])
+        self.assertEqual({row[header.index('restaurant__name')] for row in rows}, {'First'})
+        self.assertEqual(len(rows), 2)
+
+    async def test_payments_export_as_ndjson(self):
+        response, content = await self.export('payments', self.owner, format='ndjson')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(sorted(row['transaction_id'] for row in rows), ['pi_export_0', 'pi_export_1'])
+
+    async def test_download_link_with_a_ticket(self):
+        path = f'/api/payments/exports/orders/?ticket={await sync_to_async(issue_ticket)(self.owner.pk)}'
+        response = await AsyncClient().get(path)
+        content = b''.join([block async for block in response.streaming_content]).decode()
+        self.assertEqual(len(list(csv.reader(io.StringIO(content)))), 3)
+        self.assertEqual((await AsyncClient().get(path)).status_code, 401)
+
+        token_path = f'/api/payments/exports/orders/?token={AccessToken.for_user(self.owner)}'
+        self.assertEqual((await AsyncClient().get(token_path)).status_code, 401)
+
+    async def test_bad_requests(self):
+        stranger = await User.objects.acreate(username='stranger')
+        self.assertEqual((await self.export('orders', stranger))[0].status_code, 404)
+        self.assertEqual((await self.export('customers', self.owner))[0].status_code, 404)
+        self.assertEqual((await self.export('orders', self.owner, **{'from': 'last month'}))[0].status_code, 400)
+
+    def test_command_streams_the_same_rows(self):
+        output = io.StringIO()
+        call_command('export_sales', 'orders', chunk_size=1, stdout=output)
+        self.assertEqual(len(output.getvalue().splitlines()), 1 + 3)
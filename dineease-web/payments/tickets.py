@@ -0,0 +1,45 @@
+"""
+Stream tickets: short-lived, single-use credentials for the requests that
+cannot carry an Authorization header, EventSource connections and plain
+download links.
+
+A client POSTs to payments/stream-tickets/ with its access token and puts the
+ticket it gets back in the URL as ``?ticket=``. Unlike an access token in a
+URL, a ticket that ends up in a proxy log or the browser history is of no
+use: it is spent by the first request and expires within TICKET_TTL seconds
+anyway. Only its SHA-256 is stored.
+"""
+import hashlib
+import secrets
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import StreamTicket
+
+TICKET_TTL = 30
+
+
+def ticket_digest(ticket):
+    return hashlib.sha256(ticket.encode()).hexdigest()
+
+
+def issue_ticket(user_id):
+    """A new ticket for the user; their expired ones are deleted on the way."""
+    now = timezone.now()
+    StreamTicket.objects.filter(user_id=user_id, expires_at__lte=now).delete()
+    ticket = secrets.token_urlsafe(32)
+    StreamTicket.objects.create(user_id=user_id, digest=ticket_digest(ticket), expires_at=now + timedelta(seconds=TICKET_TTL))
+    return ticket
+
+
+def redeem_ticket(ticket):
+    """The active User the ticket was issued to, or None. A ticket is redeemed once."""
+    row = StreamTicket.objects.select_related('user').filter(digest=ticket_digest(ticket), expires_at__gt=timezone.now()).first()
+    if row is None:
+        return None
+    # Of concurrent requests with the same ticket only the one deleting it gets in
+    deleted, _ = StreamTicket.objects.filter(pk=row.pk).delete()
+    if not deleted or not row.user.is_active:
+        return None
+    return row.user
@@ -1,6 +1,8 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import OrderViewSet, PaymentViewSet, CreateOrderView, UpdatePaymentStatusView, UpdateOrderStatusView
+from .views import OrderViewSet, PaymentViewSet, CreateOrderView, UpdatePaymentStatusView, UpdateOrderStatusView, SalesRollupView, StreamTicketView
+from .exports import export
+from .streams import order_stream, restaurant_order_stream
 from .webhooks import stripe_webhook
 
 router = DefaultRouter()
@@ -16,4 +18,11 @@ urlpatterns = [
     path('orders/<int:order_id>/update-status/', UpdateOrderStatusView.as_view(), name='update_order_status'),
     path('<int:payment_id>/update-status/', UpdatePaymentStatusView.as_view(), name='update_payment_status'),
     path('stripe/webhook/', stripe_webhook, name='stripe_webhook'),
+    path('restaurants/<int:restaurant_id>/sales/', SalesRollupView.as_view(), name='restaurant_sales'),
+    path('exports/<str:kind>/', export, name='export'),
+
+    # Server-sent event streams of status changes
+    path('stream-tickets/', StreamTicketView.as_view(), name='stream_ticket'),
+    path('orders/<int:order_id>/stream/', order_stream, name='order_stream'),
+    path('restaurants/<int:restaurant_id>/orders/stream/', restaurant_order_stream, name='restaurant_order_stream'),
 ]
\ No newline at end of file
@@ -1,24 +1,103 @@
 from rest_framework import viewsets, status
-from .models import Order, OrderItem, Payment, Promo, PromoUsage, Menu
-from .serializers import OrderSerializer, PaymentSerializer
+from .models import Order, OrderItem, Payment, Promo, PromoUsage, SalesRollup, ItemSalesRollup
+from .serializers import OrderSerializer, PaymentSerializer, SalesBucketSerializer, TopItemSerializer
 from django.db import transaction
+from django.db.models import Prefetch, Sum
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
+from core.models import Restaurant
+from core.pagination import RecentPagination
+from core.menu_tree import get_menu_tree, menu_index
+from core.promos import redeemed_promo_ids
+from core.hours import local_time_zone
+from .idempotency import idempotent
+from .tickets import TICKET_TTL, issue_ticket
+from decimal import Decimal
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import timedelta
+
+
+def parse_moment(value, param):
+    """An aware datetime from an ISO date or datetime, naive ones taken as restaurant local time."""
+    try:
+        moment = parse_datetime(value)  # A bare date parses as its midnight
+    except ValueError:
+        moment = None
+    if moment is None:
+        raise ValidationError({"detail": f"{param} must be an ISO 8601 date or datetime."})
+    if timezone.is_naive(moment):
+        moment = moment.replace(tzinfo=local_time_zone())
+    return moment
 
 
 class OrderViewSet(viewsets.ModelViewSet):
-    queryset = Order.objects.all().prefetch_related('menu_items', 'addon_options', 'orderitem_set')
+    queryset = Order.objects.all()
     serializer_class = OrderSerializer
+    pagination_class = RecentPagination
+
+    def get_scope(self):
+        """
+        Orders the user may see: those of their restaurants for owners and
+        admins (one of them with ?restaurant=<id>), their own for customers.
+        """
+        user = self.request.user
+        if user.profile.type_of_user in ['admin', 'restaurant_owner']:
+            restaurants = Restaurant.objects.filter(owner_id=user.pk)
+            restaurant_id = self.request.query_params.get('restaurant')
+            if restaurant_id:
+                if not restaurant_id.isdigit():
+                    raise ValidationError({"detail": "restaurant must be an id."})
+                restaurants = restaurants.filter(pk=restaurant_id)
+            return Order.objects.filter(restaurant__in=restaurants.values('pk'))
+        return Order.objects.filter(customer_id=user.pk)
+
+    def get_queryset(self):
+        # A page costs the same two queries whatever its size: the orders
+        # with their restaurant and payment, then their items with the menu
+        return self.get_scope().select_related('restaurant', 'payment').prefetch_related(
+            Prefetch('orderitem_set', queryset=OrderItem.objects.select_related('menu_item')),
+        )
+
+    def filter_queryset(self, queryset):
+        """
+        ?status=pending,confirmed keeps orders in any of those statuses;
+        ?created_after= and ?created_before= (ISO dates or datetimes) bound
+        their creation time.
+        """
+        queryset = super().filter_queryset(queryset)
+        params = self.request.query_params
+
+        if params.get('status'):
+            statuses = params['status'].split(',')
+            valid = {value for value, _ in Order._meta.get_field('status').choices}
+            if not valid.issuperset(statuses):
+                raise ValidationError({"detail": f"status must be one of {', '.join(sorted(valid))}."})
+            queryset = queryset.filter(status__in=statuses)
+
+        for param, lookup in (('created_after', 'created_at__gte'), ('created_before', 'created_at__lt')):
+            if params.get(param):
+                queryset = queryset.filter(**{lookup: parse_moment(params[param], param)})
+        return queryset
 
 class PaymentViewSet(viewsets.ModelViewSet):
     queryset = Payment.objects.all().select_related('order')
     serializer_class = PaymentSerializer
 
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
 class CreateOrderView(APIView):
-    @transaction.atomic
+    @idempotent
     def post(self, request):
         """
         Creates an order, initializes payment, and tracks promo usage.
+
+        Everything is validated before the transaction opens; inside it the
+        order, its items, the promo usage and the payment are one insert each,
+        whatever the size of the cart.
         """
         try:
             data = request.data
@@ -35,48 +114,64 @@ class CreateOrderView(APIView):
                     return Response({"error": "Promo cannot be used"}, status=status.HTTP_400_BAD_REQUEST)
 
                 # Check if the customer has already used this promo
-                existing_usage = PromoUsage.objects.filter(promo=promo, customer=customer).first()
-                if existing_usage and existing_usage.status == 'approved':
+                if promo.pk in redeemed_promo_ids(customer):
                     return Response({"error": "Promo has already been used and approved"}, status=status.HTTP_400_BAD_REQUEST)
 
-            # Create the Order
-            order = Order.objects.create(
-                customer=customer,
-                restaurant_id=data['restaurant_id'],
-                promo=promo,
-                order_total=data['order_total'],
-                status='pending',  # Always pending until payment is approved
-                is_delivery=data['is_delivery'],
-                order_type=data['order_type'],
-                delivery_address=data.get('delivery_address', ''),
-                tax=data['tax'],
-                tip=data['tip']
-            )
-
-            # Add Order Items
+            # Resolve every item from the restaurant's cached menu tree
+            menus = menu_index(get_menu_tree(int(data['restaurant_id'])))
+            items = []
             for item in data['menu_items']:
-                menu_item = Menu.objects.get(id=item['menu_item_id'])
-                OrderItem.objects.create(
-                    order=order,
-                    menu_item=menu_item,
+                menu = menus.get(int(item['menu_item_id']))
+                if menu is None or menu['status'] != 'active':
+                    return Response(
+                        {"error": f"Menu item {item['menu_item_id']} is not available at this restaurant"},
+                        status=status.HTTP_400_BAD_REQUEST,
+                    )
+                items.append(OrderItem(
+                    menu_item_id=menu['id'],
                     quantity=item['quantity'],
-                    price=menu_item.cost,
+                    price=Decimal(menu['cost']),
                     special_instructions=item.get('special_instructions', '')
+                ))
+
+            with transaction.atomic():
+                # Create the Order
+                order = Order.objects.create(
+                    customer_id=customer.pk,
+                    restaurant_id=data['restaurant_id'],
+                    promo=promo,
+                    order_total=data['order_total'],
+                    status='pending',  # Always pending until payment is approved
+                    is_delivery=data['is_delivery'],
+                    order_type=data['order_type'],
+                    delivery_address=data.get('delivery_address', ''),
+                    tax=data['tax'],
+                    tip=data['tip']
                 )
 
-            # Record Promo Usage
-            if promo:
-                PromoUsage.objects.create(promo=promo, customer=customer, status='pending')
+                # Add Order Items
+                for item in items:
+                    item.order = order
+                OrderItem.objects.bulk_create(items)
+
+                # Record Promo Usage
+                if promo:
+                    PromoUsage.objects.create(promo=promo, customer_id=customer.pk, status='pending')
 
-            # Initialize Payment
-            payment = Payment.objects.create(
-                order=order,
-                payment_method=data['payment']['payment_method'],
-                payment_status='pending',  # Pending until payment is processed
-                amount_paid=data['payment']['amount_paid'],
-                payment_gateway=data['payment']['payment_gateway'],
-                transaction_id=data['payment']['transaction_id']
-            )
+                # Initialize Payment
+                payment = Payment.objects.create(
+                    order=order,
+                    payment_method=data['payment']['payment_method'],
+                    payment_status='pending',  # Pending until payment is processed
+                    amount_paid=data['payment']['amount_paid'],
+                    payment_gateway=data['payment']['payment_gateway'],
+                    transaction_id=data['payment']['transaction_id']
+                )
+
+                # Counted last, so the promo row is locked only until commit
+                if promo and not promo.increment_usage():
+                    transaction.set_rollback(True)
+                    return Response({"error": "Promo usage limit reached"}, status=status.HTTP_400_BAD_REQUEST)
 
             return Response({
                 "order_id": order.id,
@@ -133,6 +228,8 @@ class UpdatePaymentStatusView(APIView):
                     if promo_usage:
                         promo_usage.status = "rejected"
                         promo_usage.save()
+                        # The use was counted when the order was created
+                        order.promo.release_usage()
 
                 return Response({"message": "Payment failed and order cancelled"}, status=status.HTTP_200_OK)
 
@@ -175,3 +272,69 @@ class UpdateOrderStatusView(APIView):
             return Response({"error": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+class StreamTicketView(APIView):
+    def post(self, request):
+        """A stream ticket for one event stream or export request, see payments.tickets."""
+        return Response({"ticket": issue_ticket(request.user.pk), "expires_in": TICKET_TTL}, status=status.HTTP_201_CREATED)
+
+
+class SalesRollupView(APIView):
+    DEFAULT_DAYS = 30
+    MAX_DAYS = 366
+    DEFAULT_TOP = 10
+    MAX_TOP = 50
+
+    def get(self, request, restaurant_id):
+        """
+        Dashboard figures of a restaurant for its owner, read from the sales
+        rollups (see payments.rollups), so the cost depends on the range asked
+        for and not on the number of orders.
+
+        ?from= and ?to= are local dates, both inclusive (the last 30 days by
+        default); ?group=day or hour; ?top= is the number of best sellers.
+        """
+        restaurant = Restaurant.objects.filter(pk=restaurant_id).only('owner_id').first()
+        if restaurant is None or restaurant.owner_id != request.user.pk and not request.user.is_staff:
+            return Response({"error": "Restaurant not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        params = request.query_params
+        try:
+            end = parse_date(params['to']) if params.get('to') else timezone.localdate(timezone=local_time_zone())
+            start = parse_date(params['from']) if params.get('from') else end - timedelta(days=self.DEFAULT_DAYS - 1)
+            top = min(int(params.get('top', self.DEFAULT_TOP)), self.MAX_TOP)
+        except ValueError:
+            start = end = None
+        if start is None or end is None or top < 0:
+            return Response({"error": "from and to must be ISO dates and top a number."}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 <= (end - start).days < self.MAX_DAYS:
+            return Response({"error": f"The range must run forward and cover at most {self.MAX_DAYS} days."}, status=status.HTTP_400_BAD_REQUEST)
+
+        group = params.get('group', 'day')
+        if group not in ('day', 'hour'):
+            return Response({"error": "group must be day or hour."}, status=status.HTTP_400_BAD_REQUEST)
+
+        sales = SalesRollup.objects.filter(restaurant_id=restaurant_id, day__range=(start, end), orders__gt=0)
+        totals = {
+            'orders': Sum('orders', default=0),
+            'revenue': Sum('revenue', default=Decimal(0)),
+            'tips': Sum('tips', default=Decimal(0)),
+        }
+        keys = ['day'] if group == 'day' else ['day', 'hour']
+        buckets = sales.values(*keys).annotate(**totals).order_by(*keys)
+        top_items = (
+            ItemSalesRollup.objects.filter(restaurant_id=restaurant_id, day__range=(start, end))
+            .values('menu_item_id', 'menu_item__name')
+            .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'))
+            .filter(quantity__gt=0)
+            .order_by('-quantity', '-revenue')[:top]
+        )
+
+        return Response({
+            "from": start,
+            "to": end,
+            "group": group,
+            "totals": SalesBucketSerializer(sales.aggregate(**totals)).data,
+            "buckets": SalesBucketSerializer(buckets, many=True).data,
+            "top_items": TopItemSerializer(top_items, many=True).data,
+        })